@@ -0,0 +1,212 @@
+"""Synthetic Porter API payloads for offline benchmarking.
+
+Dataset builds a deterministic hotel portfolio with reviews spread over a
+time range; paginate() wraps a list the way Porter pages its collections.
+Everything is seeded, so two runs with the same arguments serve the same
+bytes.
+"""
+
+import bisect
+import random
+
+PORTER_URL = 'https://porter.revinate.com'
+
+REVIEW_SITES = [
+    ('TripAdvisor', 'tripadvisor', 'https://www.tripadvisor.com'),
+    ('Booking.com', 'booking', 'https://www.booking.com'),
+    ('Expedia', 'expedia', 'https://www.expedia.com'),
+    ('Google', 'google', 'https://www.google.com'),
+    ('Hotels.com', 'hotels-com', 'https://www.hotels.com'),
+    ('Yelp', 'yelp', 'https://www.yelp.com'),
+]
+
+LANGUAGES = [
+    ('English', 'English', 'en'),
+    ('Deutsch', 'German', 'de'),
+    ('Espanol', 'Spanish', 'es'),
+    ('Francais', 'French', 'fr'),
+]
+
+WORDS = ('room clean staff friendly breakfast location quiet noisy pool view '
+         'bed comfortable service slow fast great poor value price lobby '
+         'parking wifi spa dinner bar helpful check-in check-out').split()
+
+# rels Porter may add to a review's links besides self and hotel
+EXTRA_REVIEW_RELS = ('responses', 'reviewsite', 'language', 'images', 'translations')
+
+
+def _link(rel, href):
+    return {'rel': rel, 'href': href}
+
+
+def _text(rnd, words):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words))
+
+
+def review_site(site_id):
+    name, slug, main_url = REVIEW_SITES[(site_id - 1) % len(REVIEW_SITES)]
+    return {
+        'name': name,
+        'slug': slug,
+        'mainUrl': main_url,
+        'links': [_link('self', '{}/reviewsites/{}'.format(PORTER_URL, site_id))]
+    }
+
+
+def language(language_id):
+    name, english_name, slug = LANGUAGES[(language_id - 1) % len(LANGUAGES)]
+    return {
+        'name': name,
+        'englishName': english_name,
+        'slug': slug,
+        'links': [_link('self', '{}/languages/{}'.format(PORTER_URL, language_id))]
+    }
+
+
+def hotel(hotel_id):
+    return {
+        'name': 'Hotel {}'.format(hotel_id),
+        'slug': 'hotel-{}'.format(hotel_id),
+        'logo': 'https://cdn.example.com/logos/{}.png'.format(hotel_id),
+        'url': 'https://hotel-{}.example.com'.format(hotel_id),
+        'address1': '{} Main Street'.format(hotel_id),
+        'address2': '',
+        'city': 'San Francisco',
+        'state': 'CA',
+        'postalCode': '94105',
+        'country': 'US',
+        'tripAdvisorId': 100000 + hotel_id,
+        'revinatePurchaseUri': 'https://www.revinate.com/purchase/{}'.format(hotel_id),
+        'revinateLoginUri': 'https://www.revinate.com/login/{}'.format(hotel_id),
+        'accountType': 'PREMIUM',
+        'links': [
+            _link('self', '{}/hotels/{}'.format(PORTER_URL, hotel_id)),
+            _link('reviews', '{}/hotels/{}/reviews'.format(PORTER_URL, hotel_id)),
+            _link('reviewssnapshot', '{}/hotels/{}/reviewssnapshot'.format(PORTER_URL, hotel_id))
+        ]
+    }
+
+
+def review(review_id, hotel_id, updated_at, rnd, body_words=60, extra_links=0):
+    site_id = rnd.randint(1, len(REVIEW_SITES))
+    language_id = rnd.randint(1, len(LANGUAGES))
+    links = [
+        _link('self', '{}/reviews/{}'.format(PORTER_URL, review_id)),
+        _link('hotel', '{}/hotels/{}'.format(PORTER_URL, hotel_id))
+    ]
+    for index in range(extra_links):
+        rel = EXTRA_REVIEW_RELS[index % len(EXTRA_REVIEW_RELS)]
+        links.append(_link(rel, '{}/reviews/{}/{}'.format(PORTER_URL, review_id, rel)))
+    return {
+        'title': _text(rnd, 6).capitalize(),
+        'body': _text(rnd, body_words) + '\n"{}"'.format(_text(rnd, 4)),
+        'author': 'Guest {}'.format(review_id),
+        'authorLocation': 'Springfield',
+        'dateReview': updated_at - 86400 * 3,
+        'dateCollected': updated_at - 86400,
+        'updatedAt': updated_at,
+        'rating': float(rnd.randint(1, 10)) / 2,
+        'nps': rnd.randint(0, 10),
+        'crawledUrl': 'https://reviews.example.com/{}'.format(review_id),
+        'tripType': rnd.choice(['BUSINESS', 'COUPLES', 'FAMILY', 'SOLO']),
+        'subratings': {
+            'Cleanliness': float(rnd.randint(1, 5)),
+            'Hotel condition': float(rnd.randint(1, 5)),
+            'Rooms': float(rnd.randint(1, 5)),
+            'Service': float(rnd.randint(1, 5))
+        },
+        'guestStay': {'roomNumber': str(rnd.randint(100, 999))},
+        'surveyTopics': [],
+        'response': {'body': _text(rnd, 20)} if rnd.random() < 0.3 else None,
+        'reviewSite': review_site(site_id),
+        'language': language(language_id),
+        'links': links
+    }
+
+
+def _snapshot_values(rnd):
+    return {
+        'averageRating': round(rnd.uniform(1, 5), 2),
+        'newReviews': float(rnd.randint(0, 200)),
+        'posReviewsPct': round(rnd.uniform(0, 100), 2),
+        'tripadvisorMarketRanking': rnd.randint(1, 400),
+        'tripadvisorMarketRankingPctl': round(rnd.uniform(0, 100), 2),
+        'tripadvisorMarketSize': 400
+    }
+
+
+def reviews_snapshot(hotel_id, start_date, end_date, periods=12, seed=0):
+    rnd = random.Random(hotel_id * 7919 + start_date + seed)
+    step = max(1, (end_date - start_date) // max(1, periods))
+    return {
+        'aggregateValues': _snapshot_values(rnd),
+        'valuesByReviewSite': [
+            {'reviewSite': review_site(site_id), 'values': _snapshot_values(rnd)}
+            for site_id in range(1, len(REVIEW_SITES) + 1)
+        ],
+        'valuesByTime': [
+            {'time': start_date + step * i, 'values': _snapshot_values(rnd)}
+            for i in range(periods)
+        ],
+        'links': [
+            _link('self', '{}/hotels/{}/reviewssnapshot?date={}..{}'.format(
+                PORTER_URL, hotel_id, start_date, end_date)),
+            _link('hotel', '{}/hotels/{}'.format(PORTER_URL, hotel_id))
+        ]
+    }
+
+
+class Dataset:
+    """A deterministic hotel portfolio with reviews spread over a time range.
+
+    Reviews are assigned to hotels at random and sorted by updatedAt, with
+    several sharing each minute the way real crawls do. body_words sets the
+    review text size, extra_links the number of links beyond self and hotel
+    on each review, and snapshot_periods the length of valuesByTime.
+    """
+
+    def __init__(self, hotels=20, reviews=2000, start=1535760000, end=1538352000,
+                 body_words=60, extra_links=0, snapshot_periods=12, seed=0):
+        rnd = random.Random(seed)
+        self.start = start
+        self.end = end
+        self.snapshot_periods = snapshot_periods
+        self.seed = seed
+        self.hotels = [hotel(hotel_id) for hotel_id in range(1, hotels + 1)]
+        self.reviews = []
+        for review_id in range(1, reviews + 1):
+            hotel_id = rnd.randint(1, hotels)
+            updated_at = rnd.randint(start, end) // 60 * 60
+            self.reviews.append(review(review_id, hotel_id, updated_at, rnd, body_words,
+                                       extra_links))
+        self.reviews.sort(key=lambda r: (r['updatedAt'], r['links'][0]['href']))
+        self._updated_at = [rec['updatedAt'] for rec in self.reviews]
+
+    def reviews_between(self, from_ts, to_ts, hotel_id=None):
+        # updatedAt is inclusive at both ends, as in the Porter API
+        low = bisect.bisect_left(self._updated_at, from_ts)
+        high = bisect.bisect_right(self._updated_at, to_ts)
+        if hotel_id is None:
+            return self.reviews[low:high]
+        hotel_href = '{}/hotels/{}'.format(PORTER_URL, hotel_id)
+        return [rec for rec in self.reviews[low:high] if rec['links'][1]['href'] == hotel_href]
+
+    def snapshot(self, hotel_id, start_date=None, end_date=None):
+        if start_date is None:
+            start_date, end_date = self.start, self.end
+        return reviews_snapshot(hotel_id, start_date, end_date, self.snapshot_periods, self.seed)
+
+
+def paginate(items, page, size, base_url):
+    total = len(items)
+    total_pages = (total + size - 1) // size if size else 0
+    return {
+        'links': [_link('self', '{}?page={}&size={}'.format(base_url, page, size))],
+        'content': items[page * size:(page + 1) * size],
+        'page': {
+            'size': size,
+            'totalElements': total,
+            'totalPages': total_pages,
+            'number': page
+        }
+    }
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for the record flatteners (the tap_revinate.parse_* functions).
+
+Usage: python benchmarks/flatten_benchmark.py [--records N] [--repeat N]
+
+Prints records/sec per stream for representative Porter payloads, so runs
+from before and after a change to parsing can be compared.
+"""
+
+import argparse
+import copy
+import time
+
+import tap_revinate
+
+PORTER_URL = 'https://porter.revinate.com'
+
+REVIEW = {
+    'title': 'Great "little" hotel',
+    'body': 'Friendly staff, clean rooms.\r\nWould stay again, "highly" recommended.',
+    'author': 'Guest 1234',
+    'authorLocation': 'Springfield',
+    'dateReview': 1536000000,
+    'dateCollected': 1536100000,
+    'updatedAt': 1536200000,
+    'rating': 4.5,
+    'nps': 9,
+    'crawledUrl': 'https://reviews.example.com/1234',
+    'tripType': 'COUPLES',
+    'subratings': {'Cleanliness': 5.0, 'Hotel condition': 4.0, 'Rooms': 4.0, 'Service': 5.0},
+    'guestStay': {'roomNumber': '512'},
+    'surveyTopics': [],
+    'response': {'body': 'Thank you for staying with us.'},
+    'reviewSite': {
+        'name': 'TripAdvisor', 'slug': 'tripadvisor', 'mainUrl': 'https://www.tripadvisor.com',
+        'links': [{'rel': 'self', 'href': PORTER_URL + '/reviewsites/1'}]
+    },
+    'language': {
+        'name': 'English', 'englishName': 'English', 'slug': 'en',
+        'links': [{'rel': 'self', 'href': PORTER_URL + '/languages/1'}]
+    },
+    'links': [
+        {'rel': 'self', 'href': PORTER_URL + '/reviews/1234'},
+        {'rel': 'hotel', 'href': PORTER_URL + '/hotels/42'}
+    ]
+}
+
+HOTEL = {
+    'name': 'Hotel 42', 'slug': 'hotel-42', 'logo': 'https://cdn.example.com/42.png',
+    'url': 'https://hotel-42.example.com', 'address1': '42 Main Street', 'address2': '',
+    'city': 'San Francisco', 'state': 'CA', 'postalCode': '94105', 'country': 'US',
+    'tripAdvisorId': 100042, 'revinatePurchaseUri': 'https://www.revinate.com/purchase/42',
+    'revinateLoginUri': 'https://www.revinate.com/login/42',
+    'links': [
+        {'rel': 'self', 'href': PORTER_URL + '/hotels/42'},
+        {'rel': 'reviews', 'href': PORTER_URL + '/hotels/42/reviews'},
+        {'rel': 'reviewssnapshot', 'href': PORTER_URL + '/hotels/42/reviewssnapshot'}
+    ]
+}
+
+VALUES = {'averageRating': 4.2, 'newReviews': 12.0, 'posReviewsPct': 87.5,
+          'tripadvisorMarketRanking': 12, 'tripadvisorMarketRankingPctl': 97.0,
+          'tripadvisorMarketSize': 400}
+
+SITE = {'reviewSite': REVIEW['reviewSite'], 'values': VALUES}
+
+PERIOD = {'time': 1535760000, 'values': VALUES}
+
+SNAPSHOT = {
+    'aggregateValues': VALUES,
+    'valuesByReviewSite': [SITE] * 6,
+    'valuesByTime': [PERIOD] * 12,
+    'links': [
+        {'rel': 'self',
+         'href': PORTER_URL + '/hotels/42/reviewssnapshot?date=1535760000..1538352000'},
+        {'rel': 'hotel', 'href': PORTER_URL + '/hotels/42'}
+    ]
+}
+
+SNAPSHOT_URL = SNAPSHOT['links'][0]['href']
+
+CASES = [
+    ('reviews', REVIEW, tap_revinate.parse_review),
+    ('hotels', HOTEL, tap_revinate.parse_hotel),
+    ('hotel_reviews_snapshot', SNAPSHOT,
+     lambda obj: tap_revinate.parse_hotel_reviews_snapshot(obj, '42')),
+    ('hotel_reviews_snapshot_by_site', SITE,
+     lambda obj: tap_revinate.parse_hotel_reviews_snapshot_by_site(
+         '42', SNAPSHOT_URL, 1535760000, 1538352000, obj)),
+    ('hotel_reviews_snapshot_by_time', PERIOD,
+     lambda obj: tap_revinate.parse_hotel_reviews_snapshot_by_time('42', SNAPSHOT_URL, obj)),
+]
+
+
+def bench(parse, obj, records, repeat):
+    # distinct copies, so nothing is accidentally cached between records;
+    # the best of `repeat` rounds is reported to keep scheduler noise out
+    objects = [copy.deepcopy(obj) for _ in range(min(records, 1000))]
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        done = 0
+        while done < records:
+            for item in objects:
+                parse(item)
+            done = done + len(objects)
+        best = max(best, done / (time.perf_counter() - start))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    for stream, obj, parse in CASES:
+        rate = bench(parse, obj, args.records, args.repeat)
+        print('{:<34} {:>12,.0f} records/sec'.format(stream, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""A local stand-in for the Revinate Porter API, serving fixtures.Dataset.
+
+Usage: python benchmarks/mock_porter.py [--port 8080] [--hotels N] [--reviews N] ...
+
+Serves /hotels, /reviews, /hotels/{id}/reviews and /hotels/{id}/reviewssnapshot
+(with or without ?date=from..to), paged like Porter. Requests without the
+X-Revinate-Porter-* headers get a 401, as do requests whose signature is
+more than --signature-ttl seconds old (counted from when it was made: the tap
+backdates its timestamps by CLOCK_SKEW). With --etags, responses carry an
+ETag and a matching If-None-Match gets a 304. Latency can be added to every
+response, and a share of requests can be answered with 429 (with a
+Retry-After header) or 503 instead, or have their connection dropped halfway
+through the body. GET /_stats returns the request counts.
+
+Point the tap at it by setting tap_revinate.client.BASE_URL, as sync_benchmark.py
+does.
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from fixtures import Dataset, paginate, PORTER_URL
+
+REQUIRED_HEADERS = ('X-Revinate-Porter-Username',
+                    'X-Revinate-Porter-Timestamp',
+                    'X-Revinate-Porter-Key',
+                    'X-Revinate-Porter-Encoded')
+
+SNAPSHOT_PATH = re.compile(r'^/hotels/(\d+)/reviewssnapshot$')
+HOTEL_REVIEWS_PATH = re.compile(r'^/hotels/(\d+)/reviews$')
+# how far the tap backdates X-Revinate-Porter-Timestamp (auth.CLOCK_SKEW)
+CLOCK_SKEW = 5 * 60
+
+
+class MockPorter:
+    """The server state: dataset, fault injection settings and counters."""
+
+    def __init__(self, dataset, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, etags=False, signature_ttl=0.0, reset_rate=0.0, seed=0):
+        self.dataset = dataset
+        self.etags = etags
+        self.signature_ttl = signature_ttl
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.reset_rate = reset_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'errors': 0, 'throttled': 0, 'not_modified': 0,
+                       'unauthorized': 0, 'resets': 0, 'bytes': 0, 'by_path': {}}
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    @property
+    def requests(self):
+        return self.counts['requests']
+
+    def start(self, port=0):
+        # serve from a background thread of this process
+        self.bind(port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def bind(self, port=0):
+        handler = type('Handler', (PorterHandler,), {'porter': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.server.daemon_threads = True
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, path, status, nbytes):
+        key = path
+        if path.startswith('/hotels/'):
+            key = '/hotels/{id}/' + path.rsplit('/', 1)[1]
+        with self.lock:
+            self.counts['requests'] += 1
+            self.counts['bytes'] += nbytes
+            self.counts['by_path'][key] = self.counts['by_path'].get(key, 0) + 1
+            if status == 429:
+                self.counts['throttled'] += 1
+            elif status == 304:
+                self.counts['not_modified'] += 1
+            elif status == 401:
+                self.counts['unauthorized'] += 1
+            elif status >= 500:
+                self.counts['errors'] += 1
+
+    def delay(self):
+        with self.lock:
+            jitter = self.random.uniform(0, self.jitter) if self.jitter else 0.0
+        return self.latency + jitter
+
+    def fault(self):
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 503
+        return None
+
+    def reset(self):
+        # whether to drop this response's connection halfway through the body
+        with self.lock:
+            if self.random.random() >= self.reset_rate:
+                return False
+            self.counts['resets'] += 1
+            return True
+
+
+class PorterHandler(BaseHTTPRequestHandler):
+    porter = None
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # responses go out in one write; don't let Nagle hold them back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def _send(self, status, body=b'{}', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+        return status, len(body)
+
+    def _send_reset(self, body):
+        # the headers of the whole body, then half of it and a closed connection
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:len(body) // 2])
+        self.wfile.flush()
+        self.close_connection = True
+        return 200, len(body) // 2
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        porter = self.porter
+        parsed = urlparse(self.path)
+        if parsed.path == '/_stats':
+            with porter.lock:
+                self._send(200, json.dumps(porter.counts).encode())
+            return
+        status, nbytes = self.respond(parsed)
+        porter.count(parsed.path, status, nbytes)
+
+    def respond(self, parsed):
+        porter = self.porter
+        missing = [header for header in REQUIRED_HEADERS if not self.headers.get(header)]
+        if missing:
+            return self._send(401, json.dumps({'error': 'missing ' + ','.join(missing)}).encode())
+        age = time.time() - int(self.headers['X-Revinate-Porter-Timestamp']) - CLOCK_SKEW
+        if porter.signature_ttl and age > porter.signature_ttl:
+            return self._send(401, json.dumps({'error': 'signature expired'}).encode())
+        delay = porter.delay()
+        if delay:
+            time.sleep(delay)
+        status = porter.fault()
+        if status:
+            return self._send(status, headers={'Retry-After': str(porter.retry_after)})
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        payload = route(porter.dataset, parsed.path, query)
+        if payload is None:
+            return self._send(404)
+        body = json.dumps(payload).encode()
+        if porter.reset_rate and porter.reset():
+            return self._send_reset(body)
+        if not porter.etags:
+            return self._send(200, body)
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, b'', {'ETag': etag})
+        return self._send(200, body, {'ETag': etag})
+
+
+def route(dataset, path, query):
+    page = int(query.get('page', 0))
+    size = int(query.get('size', 20))
+    base = PORTER_URL + path
+    if path == '/hotels':
+        return paginate(dataset.hotels, page, size, base)
+    if path == '/reviews':
+        from_ts, to_ts = _range(query.get('updatedAt'), dataset)
+        return paginate(dataset.reviews_between(from_ts, to_ts), page, size, base)
+    match = HOTEL_REVIEWS_PATH.match(path)
+    if match:
+        from_ts, to_ts = _range(query.get('updatedAt'), dataset)
+        items = dataset.reviews_between(from_ts, to_ts, int(match.group(1)))
+        return paginate(items, page, size, base)
+    match = SNAPSHOT_PATH.match(path)
+    if match:
+        if 'date' in query:
+            start_date, end_date = _range(query['date'], dataset)
+            return dataset.snapshot(int(match.group(1)), start_date, end_date)
+        return dataset.snapshot(int(match.group(1)))
+    return None
+
+
+def _range(value, dataset):
+    if not value:
+        return dataset.start, dataset.end
+    low, high = value.split('..')
+    return int(low), int(high)
+
+
+def _serve(dataset_args, porter_args, port, ready):
+    porter = MockPorter(Dataset(**dataset_args), **porter_args).bind(port)
+    ready.put(porter.url)
+    porter.server.serve_forever()
+
+
+def start_process(dataset_args, porter_args, port=0):
+    """Run the mock in a child process, so it doesn't share the tap's GIL.
+
+    Returns (process, url); terminate the process when done.
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(dataset_args, porter_args, port, ready),
+                                      daemon=True)
+    process.start()
+    return process, ready.get(timeout=120)
+
+
+def add_arguments(parser):
+    parser.add_argument('--hotels', type=int, default=50)
+    parser.add_argument('--reviews', type=int, default=20000)
+    parser.add_argument('--body-words', type=int, default=60,
+                        help='words in each review body')
+    parser.add_argument('--extra-links', type=int, default=0,
+                        help='links on each review besides self and hotel')
+    parser.add_argument('--snapshot-periods', type=int, default=12,
+                        help='entries in each snapshot valuesByTime')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='up to this many more seconds, at random')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of requests answered with a 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='share of requests answered with a 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--reset-rate', type=float, default=0.0,
+                        help='share of responses cut off halfway through the body')
+    parser.add_argument('--etags', action='store_true',
+                        help='send ETags and answer If-None-Match with 304')
+    parser.add_argument('--signature-ttl', type=float, default=0.0,
+                        help='refuse signatures made more than this many seconds ago '
+                             '(0: never)')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def split_arguments(args):
+    # (Dataset kwargs, MockPorter kwargs) from parsed add_arguments options
+    dataset_args = {'hotels': args.hotels, 'reviews': args.reviews,
+                    'body_words': args.body_words, 'extra_links': args.extra_links,
+                    'snapshot_periods': args.snapshot_periods, 'seed': args.seed}
+    porter_args = {'latency': args.latency, 'jitter': args.jitter,
+                   'error_rate': args.error_rate, 'throttle_rate': args.throttle_rate,
+                   'retry_after': args.retry_after, 'etags': args.etags,
+                   'signature_ttl': args.signature_ttl, 'reset_rate': args.reset_rate,
+                   'seed': args.seed}
+    return dataset_args, porter_args
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--port', type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+    dataset_args, porter_args = split_arguments(args)
+    porter = MockPorter(Dataset(**dataset_args), **porter_args).bind(args.port)
+    print('Serving {} hotels and {} reviews on {}'.format(args.hotels, args.reviews, porter.url))
+    try:
+        porter.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
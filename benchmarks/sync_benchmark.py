@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""End-to-end benchmark of a tap run against a local mock Porter API.
+
+Usage: python benchmarks/sync_benchmark.py [--hotels N] [--reviews N] [--latency S]
+           [--error-rate R] [--throttle-rate R] [--target-mb-per-sec R]
+           [--config '{"page_size": 100}'] [--json]
+
+Starts mock_porter.py in a child process with a synthetic dataset, runs
+tap_revinate.do_sync against it with its output discarded, and reports
+records/sec per stream, requests/sec, peak RSS and the time spent in each
+phase of the sync. --config is merged into the tap config, so runs with
+different page sizes or concurrency settings can be compared.
+--target-mb-per-sec makes the output as slow to drain as a target that
+reads at that rate.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import resource
+import sys
+import time
+
+import requests
+import tap_revinate
+
+import mock_porter
+
+START_DATE = '2018-09-01T00:00:00Z'
+RECORD_PREFIX = '{"type":"RECORD","stream":"'
+
+
+class CountingSink:
+    """Stands in for stdout: counts the bytes and RECORD messages per stream."""
+
+    def __init__(self, mb_per_sec=None):
+        self.bytes = 0
+        self.records = {}
+        self.mb_per_sec = mb_per_sec
+
+    def write(self, data):
+        if self.mb_per_sec:
+            time.sleep(len(data) / (self.mb_per_sec * 1024 * 1024))
+        self.bytes += len(data)
+        # cheap enough not to skew the numbers: no JSON parsing of the output
+        for line in data.splitlines():
+            if line.startswith(RECORD_PREFIX):
+                stream = line[len(RECORD_PREFIX):line.index('"', len(RECORD_PREFIX))]
+                self.records[stream] = self.records.get(stream, 0) + 1
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def run(url, config_extra, target_mb_per_sec=None):
+    tap_revinate.client.BASE_URL = url
+    config = {'username': 'benchmark', 'api_key': 'key', 'api_secret': 'secret',
+              'start_date': START_DATE}
+    config.update(config_extra)
+    sink = CountingSink(target_mb_per_sec)
+    args = argparse.Namespace(config=config, state={}, catalog=None, properties=None,
+                              discover=False)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sink):
+        tap_revinate.do_sync(args)
+    # the tap times its sync_hotels and sync_reviews jobs, whichever engine runs them
+    phases = dict(tap_revinate.METRICS.summary()['jobs'])
+    phases['total'] = time.perf_counter() - start
+    phases['setup'] = phases['total'] - phases.get('sync_hotels', 0.0) - \
+        phases.get('sync_reviews', 0.0)
+    return sink, phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    mock_porter.add_arguments(parser)
+    parser.add_argument('--config', type=json.loads, default={},
+                        help='JSON object merged into the tap config')
+    parser.add_argument('--target-mb-per-sec', type=float, default=None,
+                        help='drain the output no faster than this')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='keep the tap log output')
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    dataset_args, porter_args = mock_porter.split_arguments(args)
+    process, url = mock_porter.start_process(dataset_args, porter_args)
+    try:
+        sink, phases = run(url, args.config, args.target_mb_per_sec)
+        served = requests.get(url + '/_stats').json()
+    finally:
+        process.terminate()
+    total = phases['total']
+    records = sum(sink.records.values())
+    results = {
+        'config': args.config,
+        'dataset': dataset_args,
+        'mock': porter_args,
+        'records': sink.records,
+        'records_per_second': records / total,
+        'output_bytes': sink.bytes,
+        'requests': served['requests'],
+        'requests_by_path': served['by_path'],
+        'requests_per_second': served['requests'] / total,
+        'throttled': served['throttled'],
+        'errors': served['errors'],
+        'unauthorized': served['unauthorized'],
+        'bytes_served': served['bytes'],
+        'peak_rss_mb': peak_rss_mb(),
+        'phases': phases,
+        'pipeline': tap_revinate.PIPELINE.stats()
+    }
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+    for stream, count in sorted(sink.records.items()):
+        print('{:<34} {:>10,} records'.format(stream, count))
+    print('{:<34} {:>12,.0f} records/sec'.format('all streams', results['records_per_second']))
+    print('{:<34} {:>12,.1f} requests/sec ({} requests, {} throttled, {} errors, '
+          '{} unauthorized)'.format('porter', results['requests_per_second'], served['requests'],
+                                    served['throttled'], served['errors'],
+                                    served['unauthorized']))
+    print('{:<34} {:>12,.1f} MB'.format('peak RSS', results['peak_rss_mb']))
+    for name in ('setup', 'sync_hotels', 'sync_reviews', 'total'):
+        print('{:<34} {:>12.3f} s'.format(name, phases.get(name, 0.0)))
+    for stage, entry in sorted(results['pipeline'].items()):
+        print('{:<34} {:>12.0%} busy ({:.3f}s waiting, {:.3f}s blocked)'.format(
+            'stage ' + stage, entry['utilization'], entry['waiting'], entry['blocked']))
+
+
+if __name__ == '__main__':
+    main()
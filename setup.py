@@ -17,6 +17,10 @@ setup(name='tap-revinate',
           'pybase64==0.4.0',
           'pendulum==2.0.3'
       ],
+      extras_require={
+          'orjson': ['orjson==3.8.3'],
+          'async': ['aiohttp==3.13.5']
+      },
       entry_points='''
           [console_scripts]
           tap-revinate=tap_revinate:main
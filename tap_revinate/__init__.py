@@ -1,511 +1,481 @@
 #!/usr/bin/env python3
 
 from decimal import Decimal
-import hmac
-import hashlib
+import asyncio
+import collections
 import base64
-import binascii
 import re
 import copy
 import datetime
+import functools
 import json
 import os
 import sys
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import dateutil.parser
 import requests
 import singer
 from singer import utils
-import backoff
+from singer.catalog import Catalog
 import tap_revinate.schemas as schemas
+import tap_revinate.fields as fields
+from tap_revinate.accounts import resolve
+from tap_revinate.aio import AsyncTransport, CLIENT_ERRORS, async_iter_pages, \
+    async_page_fetcher
+from tap_revinate.auth import Signer, CLOCK_SKEW, generate_hash_key
+from tap_revinate.bookmarks import by_time_periods, checkpoint_due, snapshot_backfill_jobs, \
+    snapshot_periods
+from tap_revinate.catalog import discover, get_selection
+from tap_revinate.cache import DEFAULT_MAX_BYTES
+from tap_revinate.client import decoded_pages, fetch_cached, fetch_object, iter_pages, log_page, \
+    porter_url
+from tap_revinate.concurrency import ordered_map
+from tap_revinate.context import ACCOUNT_STREAMS, ACCOUNTS, CACHE, CHANGES, CONFIG, DEDUP, \
+    DIMENSION_COLUMNS, DIMENSION_STREAMS, FLATTENERS, HOTEL_STREAMS, KEY_PROPERTIES, LIMITER, \
+    METRICS, PIPELINE, REVIEW_STREAMS, SELECTED, SIGNER, SNAPSHOT_CONTEXT, SNAPSHOT_STREAMS, \
+    STATE, TRANSPORT, WRITER, emit_dimension, emit_record, write_state
+from tap_revinate.dedup import BoundaryDedup
+from tap_revinate.fingerprints import ChangeDetector
+from tap_revinate.flatten import Flattener, Interned
+from tap_revinate.paging import PageSizer
+from tap_revinate.pipeline import WriteStage, DEFAULT_WRITE_DEPTH
+from tap_revinate.reviews import async_sync_reviews, parse_review, sync_reviews
+from tap_revinate.streaming import PorterPage, load_object
+from tap_revinate.throttle import RateLimiter
+from tap_revinate.transport import DEFAULT_POOL_SIZE
+from tap_revinate.writer import DEFAULT_BUFFER_SIZE, write_out
 
 LOGGER = singer.get_logger()
-BASE_URL = 'https://porter.revinate.com'
 REQUIRED_CONFIG_KEYS = ['username',
                         'api_key',
                         'api_secret',
                         'start_date']
-CONFIG = {
-    'username': None,
-    'api_key': None,
-    'api_secret': None,
-    'start_date': None
-}
-STATE = {}
-
-@backoff.on_exception(backoff.expo,
-                      (requests.exceptions.RequestException),
-                      max_tries=5,
-                      giveup=lambda e: e.response is not None and 400 <= e.response.status_code < 500, # pylint: disable=line-too-long
-                      factor=2)
-
-def request(url, headers, params={}):
-    LOGGER.info("Making request: GET {} {}".format(url, params))
-    try:
-        response = requests.get(
-            url=url,
-            headers=headers,
-            params=params)
-    except Exception as exception:
-        LOGGER.exception(exception)
-    LOGGER.info("Got response code: {}".format(response.status_code))
-    response.raise_for_status()
-    return response
-
-def parse_review(review):
-    # flatten review links and get review_id and hotel_id
-    review_url = ''
-    review_id = 0
-    hotel_url = ''
-    hotel_id = 0
-    if 'links' not in review:
-        links_json = {}
-    else:
-        links_json = review['links']
-    for link in review['links']:
-        if link['rel'] == "self":
-            review_url = link['href']
-            match = re.search(r".*/reviews/(.*)", review_url)
-            if match:
-                review_id = int(match.group(1))
-            else:
-                review_id = 0
-        if link['rel'] == "hotel":
-            hotel_url = link['href']
-            match = re.search(r".*/hotels/(.*)", hotel_url)
-            if match:
-                hotel_id = int(match.group(1))
-            else:
-                hotel_id = 0
-    # flatten review_site links and get review_site_id
-    if 'reviewSite' not in review:
-        review_site_json = {}
-    else:
-        review_site_json = review['reviewSite']
-    review_site_url = ''
-    review_site_id = 0
-    for link in review['reviewSite']['links']:
-        if link['rel'] == "self":
-            review_site_url = link['href']
-            match = re.search(r".*/reviewsites/(.*)", review_site_url)
-            if match:
-                review_site_id = int(match.group(1))
-            else:
-                review_site_id = 0
-    # flatten language links and get language_id
-    language_url = ''
-    language_id = 0
-    if 'language' not in review:
-        language_json = {}
-    else:
-        language_json = review['language']
-
-        for link in review['language']['links']:
-            if link['rel'] == "self":
-                language_url = link['href']
-            match = re.search(r".*/languages/(.*)", language_url)
-            if match:
-                language_id = int(match.group(1))
-            else:
-                language_id = 0
-    # Get other nested json elements
-    if 'subratings' not in review:
-        subratings_json = {}
-    else:
-        subratings_json = review['subratings']
-    if 'guestStay' not in review:
-        guest_stay_json = {}
-    else:
-        guest_stay_json = review['guestStay']
-    if 'surveyTopics' not in review:
-        survey_topics_json = {}
-    else:
-        survey_topics_json = review['surveyTopics']
-    if 'response' not in review:
-        response_json = {}
-    else:
-        response_json = review['response']
-    return {
-        'review_id': int(review_id),
-        'review_url': str(review_url),
-        'review_json': str(review),
-        'hotel_id': int(hotel_id),
-        'hotel_url': str(hotel_url),
-        'title': str(review.get('title', '')).replace('"', '\\"').replace('\r', \
-            '').replace('\n', ''),
-        'body': str(review.get('body', '')).replace('"', '\\"').replace('\r', \
-            '').replace('\n', ''),
-        'author': str(review.get('author', '')),
-        'author_location': str(review.get('authorLocation', '')),
-        'date_review': int(review.get('dateReview', 0)),
-        'date_collected': int(review.get('dateCollected', 0)),
-        'updated_at': int(review.get('updatedAt', 0)),
-        'rating': float(review.get('rating', 0.0)),
-        'nps': int(review.get('nps', 0)),
-        'review_site_json': str(review_site_json),
-        'review_site_id': int(review_site_id),
-        'review_site_url': str(review_site_url),
-        'review_site_name': str(review.get('reviewSite', {}).get('name', '')),
-        'review_site_main_url': str(review.get('reviewSite', {}).get('mainUrl', '')),
-        'review_site_slug': str(review.get('reviewSite', {}).get('slug', '')),
-        'language_json': str(language_json),
-        'language_id': int(language_id),
-        'language_url': str(language_url),
-        'language_name': str(review.get('language', {}).get('name', '')),
-        'language_english_name': str(review.get('language', {}).get('englishName', '')),
-        'language_slug': str(review.get('language', {}).get('slug', '')),
-        'crawled_url': str(review.get('crawledUrl', '')),
-        'subratings_json': str(subratings_json),
-        'subratings_cleanliness': float(review.get('subratings', {}).get('Cleanliness', 0.0)),
-        'subratings_hotel_condition': float(review.get('subratings', \
-            {}).get('Hotel condition', 0.0)),
-        'subratings_rooms': float(review.get('subratings', {}).get('Rooms', 0.0)),
-        'subratings_service': float(review.get('subratings', {}).get('Service', 0.0)),
-        'trip_type': str(review.get('tripType', '')),
-        'guest_stay_json': str(guest_stay_json),
-        'survey_topics_json': str(survey_topics_json),
-        'response_json': str(response_json),
-        'links_json': str(links_json)
-    }
-
-def fetch_reviews(headers, params):
-    url = '{}/reviews'.format(BASE_URL)
-    resp = request(url, headers, params)
-    parsed = json.loads(resp.text)
-    return parsed
-
-def sync_reviews(headers, CONFIG, STATE):
-    page = 0 # initialize at first page
-    rec = 1 # initialize first record
-    total_pages = 1 # initial total pages, which gets overwritten
-    total_elements = 0 # initial total elements, which gets overwritten
-    size = 10 # number of records per request
-    to_timestamp = int(headers['X-Revinate-Porter-Timestamp'])
-    last_update = to_timestamp  # init
-    from_timestamp = 0  # initial value
-    # set from_timestamp as NVL(STATE.last_update, CONFIG.start_date, now - 1 year)
-    if 'last_update' not in STATE:
-        if 'start_date' not in CONFIG:
-            from_timestamp = to_timestamp - (60 * 60 * 24 * 7)  # looks back 1 week
-        else:
-            from_timestamp = int(time.mktime(datetime.datetime.strptime(CONFIG['start_date'], \
-                '%Y-%m-%dT%H:%M:%SZ').timetuple()))
-    else:
-        from_timestamp = int(STATE['last_update'])
-    updated_at_range = str(from_timestamp) + '..' + str(to_timestamp)
-    # loop thru all pages
-    while (page + 1) <= total_pages:
-        if (rec + size) <= total_elements:
-            rec_to = rec + size - 1
-        else:
-            rec_to = total_elements
-        LOGGER.info('Page {} of {} Total Pages, Record {}-{} of {} Total Records'.format( \
-            str(page + 1), str(total_pages), str(rec), str(rec_to), str(total_elements)))
-        params = {
-            'updatedAt': updated_at_range,
-            'page': page,
-            'size': size,
-            'sort': 'updatedAt,ASC'
-        }
-        try:
-            reviews_parsed = fetch_reviews(headers, params)
-        except Exception as exception:
-            LOGGER.exception(exception)
-            break
-        # loop thru all records on page
-        for record in reviews_parsed['content']:
-            parsed_review = parse_review(record)
-            singer.write_record('reviews', parsed_review)
-            last_update = record['updatedAt']
-            rec = rec + 1
-        page_json = reviews_parsed['page']
-        total_pages = int(page_json.get('totalPages', 1))
-        total_elements = int(page_json.get('totalElements', 0))
-        page = page + 1
-    # update STATE last_update
-    utils.update_state(STATE, 'last_update', last_update)
-    singer.write_state(STATE)
-    LOGGER.info("State synced to last_update: {}".format(last_update))
-    LOGGER.info("Done syncing reviews.")
+# settings read once for the whole run, so only from the top level of the
+# config, never from an account's own
+RUN_SETTINGS = ['account_concurrency', 'cache_dir', 'cache_max_bytes', 'cache_ttl',
+                'dimension_ids_only', 'json_columns', 'metrics_file', 'pool_size',
+                'write_buffer_size', 'write_queue_depth']
 
 def parse_hotel_reviews_snapshot_by_time(hotel_id, hotel_reviews_snapshot_url, period):
-    if 'values' not in period:
-        values_json = {}
-    else:
-        values_json = period['values']
-    return {
-        'hotel_id': int(hotel_id),
-        'hotel_reviews_snapshot_url': str(hotel_reviews_snapshot_url),
-        'time_period_json': str(period),
-        'unix_time': int(period.get('time', 0)),
-        'values_json': str(values_json),
-        'snapshot_average_rating': float(period.get('values', {}).get('averageRating', 0.0)),
-        'snapshot_new_reviews': float(period.get('values', {}).get('newReviews', 0.0)),
-        'snapshot_pos_reviews_pct': float(period.get('values', {}).get('posReviewsPct', 0.0)),
-        'snapshot_trip_advisor_market_ranking': int(period.get('values', \
-            {}).get('tripadvisorMarketRanking', 0)),
-        'snapshot_trip_advisor_market_ranking_pctl': float(period.get('values', \
-            {}).get('tripadvisorMarketRankingPctl', 0.0)),
-        'snapshot_trip_advisor_market_size': int(period.get('values', \
-            {}).get('tripadvisorMarketSize', 0)),
-    }
+    return FLATTENERS['hotel_reviews_snapshot_by_time'](period, {
+        'hotel_id': hotel_id,
+        'hotel_reviews_snapshot_url': hotel_reviews_snapshot_url
+    })
 
 def parse_hotel_reviews_snapshot_by_site(hotel_id, hotel_reviews_snapshot_url, \
     start_date, end_date, site):
-    # flatten review_site links and get review_site_id
-    review_site_url = ''
-    review_site_id = 0
-    if 'reviewSite' not in site:
-        review_site_json = {}
-    else:
-        review_site_json = site['reviewSite']
-        for link in site['reviewSite']['links']:
-            if link['rel'] == "self":
-                review_site_url = link['href']
-                match = re.search(r".*/reviewsites/(.*)", review_site_url)
-                if match:
-                    review_site_id = int(match.group(1))
-                else:
-                    review_site_id = 0
-    if 'values' not in site:
-        values_json = {}
-    else:
-        values_json = site['values']
-    return {
-        'hotel_id': int(hotel_id),
-        'hotel_reviews_snapshot_url': str(hotel_reviews_snapshot_url),
-        'site_json': str(site),
-        'snapshot_start_date': int(start_date),
-        'snapshot_end_date': int(end_date),
-        'review_site_json': str(review_site_json),
-        'review_site_id': int(review_site_id),
-        'review_site_url': str(review_site_url),
-        'review_site_name': str(site.get('reviewSite', {}).get('name', '')),
-        'review_site_main_url': str(site.get('reviewSite', {}).get('mainUrl', '')),
-        'review_site_slug': str(site.get('reviewSite', {}).get('slug', '')),
-        'values_json': str(values_json),
-        'site_average_rating': float(site.get('values', {}).get('averageRating', 0.0)),
-        'site_new_reviews': float(site.get('values', {}).get('newReviews', 0.0)),
-        'site_pos_reviews_pct': float(site.get('values', {}).get('posReviewsPct', 0.0)),
-        'site_trip_advisor_market_ranking': int(site.get('values', \
-            {}).get('tripadvisorMarketRanking', 0)),
-        'site_trip_advisor_market_ranking_pctl': float(site.get('values', \
-            {}).get('tripadvisorMarketRankingPctl', 0.0)),
-        'site_trip_advisor_market_size': int(site.get('values', \
-            {}).get('tripadvisorMarketSize', 0))
-    }
+    return FLATTENERS['hotel_reviews_snapshot_by_site'](site, {
+        'hotel_id': hotel_id,
+        'hotel_reviews_snapshot_url': hotel_reviews_snapshot_url,
+        'snapshot_start_date': start_date,
+        'snapshot_end_date': end_date
+    })
 
 def parse_hotel_reviews_snapshot(snapshot, hotel_id):
-    # flatten links and get start/end dates
-    hotel_reviews_snapshot_url = ''
-    start_date = 0
-    end_date = 0
-    if 'links' not in snapshot:
-        links_json = {}
-    else:
-        links_json = snapshot['links']
-        for link in snapshot['links']:
-            if link['rel'] == "self":
-                hotel_reviews_snapshot_url = link['href']
-                start_date = int(re.findall('^.*' + r'\?date' + r'\=(' + r'\d+)' + \
-                    r'\.' + r'\.' + r'\d+$', hotel_reviews_snapshot_url)[0])
-                end_date = int(re.findall('^.*' + r'\?date' + r'\=' + r'\d+' + r'\.' \
-                    + r'\.(' + r'\d+)$', hotel_reviews_snapshot_url)[0])
-    # Get other nested json elements
-    if 'aggregateValues' not in snapshot:
-        aggregate_values_json = {}
-    else:
-        aggregate_values_json = snapshot['aggregateValues']
-    if 'valuesByReviewSite' not in snapshot:
-        values_by_review_site_json = {}
-    else:
-        values_by_review_site_json = snapshot['valuesByReviewSite']
-    if 'valuesByTime' not in snapshot:
-        values_by_time_json = {}
-    else:
-        values_by_time_json = snapshot['valuesByTime']
-    return {
-        'hotel_id': int(hotel_id),
-        'hotel_reviews_snapshot_url': str(hotel_reviews_snapshot_url),
-        'hotel_reviews_snapshot_json': str(snapshot),
-        'snapshot_start_date': int(start_date),
-        'snapshot_end_date': int(end_date),
-        'aggregate_values_json': str(aggregate_values_json),
-        'aggregate_average_rating': float(snapshot.get('aggregateValues', \
-            {}).get('averageRating', 0.0)),
-        'aggregate_new_reviews': float(snapshot.get('aggregateValues', \
-            {}).get('newReviews', 0.0)),
-        'aggregate_pos_reviews_pct': float(snapshot.get('aggregateValues', \
-            {}).get('posReviewsPct', 0.0)),
-        'aggregate_trip_advisor_market_ranking': int(snapshot.get('aggregateValues', \
-            {}).get('tripadvisorMarketRanking', 0)),
-        'aggregate_trip_advisor_market_ranking_pctl': float(snapshot.get('aggregateValues', \
-            {}).get('tripadvisorMarketRankingPctl', 0.0)),
-        'aggregate_trip_advisor_market_size': int(snapshot.get('aggregateValues', \
-            {}).get('tripadvisorMarketSize', 0)),
-        'values_by_review_site_json': str(values_by_review_site_json),
-        'values_by_time_json': str(values_by_time_json),
-        'links_json': str(links_json)
-    }
-
-def fetch_hotel_reviews_snapshot(headers, hotel_id):
-    url = '{}/hotels/{}/reviewssnapshot'.format(BASE_URL, str(hotel_id))
-    resp = request(url, headers)
-    parsed = json.loads(resp.text)
-    return parsed
-
-def sync_hotel_reviews_snapshot(headers, hotel_id):
-    hotel_reviews_snapshot = fetch_hotel_reviews_snapshot(headers, hotel_id)
-    hotels_reviews_snapshot_parsed = hotel_reviews_snapshot
+    return FLATTENERS['hotel_reviews_snapshot'](snapshot, {'hotel_id': hotel_id})
+
+def fetch_hotel_reviews_snapshot(hotel_id, period=None):
+    # the default snapshot, or the one for period, a (start, end) pair
+    url = porter_url('/hotels/{}/reviewssnapshot'.format(hotel_id))
+    params = {'date': '{}..{}'.format(*period)} if period else None
+    return fetch_object(url, params)
+
+def write_hotel_reviews_snapshot(hotel_id, hotel_reviews_snapshot, period=None):
+    # period is the backfill period the snapshot is for, None for the current one
     LOGGER.info('Synced hotel reviews snapshot for hotel_id: {}.'.format(hotel_id))
-    snapshot = parse_hotel_reviews_snapshot(hotels_reviews_snapshot_parsed, hotel_id)
-    singer.write_record('hotel_reviews_snapshot', snapshot)
+    snapshot = {}
+    if 'hotel_reviews_snapshot' in SELECTED:
+        snapshot = emit_record('hotel_reviews_snapshot', parse_hotel_reviews_snapshot, \
+            hotel_reviews_snapshot, hotel_id)
+    if any(column not in snapshot for column in SNAPSHOT_CONTEXT):
+        snapshot = FLATTENERS['snapshot_context'](hotel_reviews_snapshot)
     start_date = int(snapshot.get('snapshot_start_date', 0))
     end_date = int(snapshot.get('snapshot_end_date', 0))
     hotel_reviews_snapshot_url = str(snapshot.get('hotel_reviews_snapshot_url', ''))
-    for site in hotels_reviews_snapshot_parsed['valuesByReviewSite']:
-        snapshot_by_site = parse_hotel_reviews_snapshot_by_site(hotel_id, \
-            hotel_reviews_snapshot_url, start_date, end_date, site)
-        singer.write_record('hotel_reviews_snapshot_by_site', snapshot_by_site)
-    for period in hotels_reviews_snapshot_parsed['valuesByTime']:
-        snapshot_by_time = parse_hotel_reviews_snapshot_by_time(hotel_id, \
-            hotel_reviews_snapshot_url, period)
-        singer.write_record('hotel_reviews_snapshot_by_time', snapshot_by_time)
-
-def parse_hotel(hotel):
-    # flatten links and get hotel_id
-    hotel_url = ''
-    hotel_id = 0
-    hotel_reviews_snapshot_url = ''
-    if 'links' not in hotel:
-        links_json = {}
-    else:
-        links_json = hotel['links']
-        for link in hotel['links']:
-            if link['rel'] == "self":
-                hotel_url = link['href']
-                match = re.search(r".*/hotels/(.*)", hotel_url)
-                if match:
-                    hotel_id = int(match.group(1))
-                else:
-                    hotel_id = 0
-            if link['rel'] == "reviewssnapshot":
-                hotel_reviews_snapshot_url = link['href']
-    return {
-        'hotel_id': int(hotel_id),
-        'hotel_url': str(hotel_url),
-        'hotel_reviews_snapshot_url': str(hotel_reviews_snapshot_url),
-        'hotel_json': str(hotel),
-        'name': str(hotel.get('name', '')),
-        'slug': str(hotel.get('slug', '')),
-        'logo': str(hotel.get('logo', '')),
-        'url': str(hotel.get('url', '')),
-        'address1': str(hotel.get('address1', '')),
-        'address2': str(hotel.get('address2', '')),
-        'city': str(hotel.get('city', '')),
-        'state': str(hotel.get('state', '')),
-        'postal_code': str(hotel.get('postalCode', '')),
-        'country': str(hotel.get('country', '')),
-        'trip_advisor_id': int(hotel.get('tripAdvisorId', 0)),
-        'revinate_purchase_uri': str(hotel.get('revinatePurchaseUri', '')),
-        'revinate_login_uri': str(hotel.get('revinateLoginUri', '')),
-        'account_type': str(hotel.get('revinatePurchaseUri', '')),
-        'links_json': str(links_json)
-    }
-
-def fetch_hotels(headers, params):
-    url = '{}/hotels'.format(BASE_URL)
-    resp = request(url, headers, params)
-    parsed = json.loads(resp.text)
-    return parsed
-
-def sync_hotels(headers):
-    page = 0 # initialize at first page
-    rec = 1 # initialize first record
-    total_pages = 1 # initial total pages, which gets overwritten
-    total_elements = 0 # initial total elements, which gets overwritten
-    size = 10 # number of records per request
-    # loop thru all pages
-    while (page + 1) <= total_pages:
-        if (rec + size) <= total_elements:
-            rec_to = rec + size - 1
-        else:
-            rec_to = total_elements
-        LOGGER.info('Page {} of {} Total Pages, Record {}-{} of {} Total Records'.format( \
-            str(page + 1), str(total_pages), str(rec), str(rec_to), str(total_elements)))
+    if 'hotel_reviews_snapshot_by_site' in SELECTED:
+        for site in hotel_reviews_snapshot['valuesByReviewSite']:
+            emit_record('hotel_reviews_snapshot_by_site', parse_hotel_reviews_snapshot_by_site, \
+                hotel_id, hotel_reviews_snapshot_url, start_date, end_date, site)
+    if 'hotel_reviews_snapshot_by_time' in SELECTED:
+        values_by_time = hotel_reviews_snapshot['valuesByTime']
+        if period is None:
+            values_by_time, skipped = by_time_periods(CONFIG, STATE, hotel_id, values_by_time)
+            # closed periods are not emitted, but still count as seen
+            for values in skipped:
+                CHANGES.keep('hotel_reviews_snapshot_by_time', \
+                    FLATTENERS['by_time_key'](values, {'hotel_id': hotel_id}))
+        for values in values_by_time:
+            emit_record('hotel_reviews_snapshot_by_time', parse_hotel_reviews_snapshot_by_time, \
+                hotel_id, hotel_reviews_snapshot_url, values)
+
+def parse_hotel(hotel, raw_json=None):
+    return FLATTENERS['hotels'](hotel, {'raw_json': raw_json} if raw_json else None)
+
+def fetch_hotels(params):
+    url = porter_url('/hotels')
+    return PorterPage(fetch_cached(url, params))
+
+def iter_hotels(sizer):
+    def fetch_page(page, size):
         params = {
             'page': page,
             'size': size,
             'sort': 'id,ASC'
         }
+        return fetch_hotels(params)
+    try:
+        for offset, size, hotels_parsed in METRICS.timed_iter('hotels', \
+                decoded_pages('hotels', iter_pages(fetch_page, sizer))):
+            # loop thru all records on page, as they are decoded
+            for record, raw_json in METRICS.timed_iter('hotels', hotels_parsed.with_raw()):
+                parsed_hotel = emit_record('hotels', parse_hotel, record, raw_json)
+                yield str(parsed_hotel.get('hotel_id', ''))
+            log_page(offset, size, hotels_parsed.count, hotels_parsed.page)
+    except (requests.exceptions.RequestException, ValueError) as exception:
+        LOGGER.exception(exception)
+
+def sync_hotels(CONFIG):
+    # snapshots are fetched on a worker pool while the hotels pager keeps going;
+    # records are still written from this thread, one hotel at a time, in hotel
+    # order. Returns the ids of the hotels found
+    concurrency = int(CONFIG.get('snapshot_concurrency', 1))
+    def fetch(hotel_id):
+        return hotel_id, fetch_hotel_reviews_snapshot(hotel_id)
+    sizer = PageSizer.from_config(CONFIG, 'hotels')
+    if not any(stream in SELECTED for stream in SNAPSHOT_STREAMS):
+        # no snapshot stream selected: skip the per-hotel requests
+        hotel_ids = list(iter_hotels(sizer))
+        finish_hotels()
+        return hotel_ids
+    hotel_ids = []
+    snapshots = ordered_map(fetch, iter_hotels(sizer), workers=concurrency, \
+        window=2 * concurrency)
+    for hotel_id, hotel_reviews_snapshot in METRICS.timed_iter('hotel_reviews_snapshot', \
+            snapshots):
+        write_hotel_reviews_snapshot(hotel_id, hotel_reviews_snapshot)
+        hotel_ids.append(hotel_id)
+    finish_hotels()
+    return hotel_ids
+
+def backfill_snapshots(CONFIG, STATE, sync_until, hotel_ids):
+    # a snapshot per hotel and snapshot_backfill period, fetched on a worker
+    # pool and written by hotel and then period, so each hotel's bookmark only
+    # passes periods written before it. A hotel whose snapshot fails is left
+    # from there for the next run
+    jobs = snapshot_backfill_jobs(STATE, hotel_ids, snapshot_periods(CONFIG, sync_until))
+    LOGGER.info('Backfilling {} hotel reviews snapshots.'.format(len(jobs)))
+    concurrency = int(CONFIG.get('snapshot_concurrency', 1))
+    def fetch(job):
         try:
-            hotels_parsed = fetch_hotels(headers, params)
-        except Exception as exception:
+            return job, fetch_hotel_reviews_snapshot(*job)
+        except (requests.exceptions.RequestException, ValueError) as exception:
             LOGGER.exception(exception)
-            break
-        # loop thru all records on page
-        for record in hotels_parsed['content']:
-            parsed_hotel = parse_hotel(record)
-            singer.write_record('hotels', parsed_hotel)
-            hotel_id = str(parsed_hotel.get('hotel_id', ''))
-            sync_hotel_reviews_snapshot(headers, hotel_id)
-            rec = rec + 1
-        page_json = hotels_parsed['page']
-        total_pages = int(page_json.get('totalPages', 1))
-        total_elements = int(page_json.get('totalElements', 0))
-        page = page + 1
+            return job, None
+    done = STATE.setdefault('snapshot_backfill', {})
+    failed = set()
+    due = checkpoint_due(CONFIG)
+    for (hotel_id, period), hotel_reviews_snapshot in METRICS.timed_iter( \
+            'hotel_reviews_snapshot', ordered_map(fetch, jobs, workers=concurrency, \
+                window=2 * concurrency)):
+        if hotel_reviews_snapshot is None:
+            failed.add(hotel_id)
+        if hotel_id in failed:
+            continue
+        write_hotel_reviews_snapshot(hotel_id, hotel_reviews_snapshot, period)
+        done[hotel_id] = period[1]
+        if due():
+            write_state(STATE)
+    write_state(STATE)
+    LOGGER.info('Done backfilling hotel reviews snapshots.')
+
+def finish_hotels():
+    if CHANGES.enabled:
+        CHANGES.log_stats(HOTEL_STREAMS)
+        CHANGES.save(STATE, HOTEL_STREAMS)
+    if CHANGES.enabled or CONFIG.get('snapshot_by_time_incremental'):
+        write_state(STATE)
     LOGGER.info("Done syncing hotels.")
 
-def generate_hash_key(username, api_secret, unix_timestamp):
-    user_time = username + str(unix_timestamp)
-    user_time_enc = user_time.encode()
-    api_secret_enc = api_secret.encode()
-    dig = hmac.new(api_secret_enc, user_time_enc, digestmod=hashlib.sha256).digest()
-    dig_hex = binascii.hexlify(dig)
-    hash_key = repr(dig_hex)[2:(len(repr(dig_hex))-1)]
-    LOGGER.info("Generated user-time hash key.")
-    return hash_key
+def finish_dimensions():
+    # review sites and languages turn up all through the run, so their digests
+    # are saved once it is over
+    if CHANGES.enabled:
+        CHANGES.log_stats(DIMENSION_STREAMS)
+        CHANGES.save(STATE, DIMENSION_STREAMS)
+        write_state(STATE)
+
+async def async_sync_hotels(client, CONFIG):
+    # snapshot requests are started as each hotel is written, up to two per
+    # request slot ahead of the hotel whose snapshot records are written next
+    sizer = PageSizer.from_config(CONFIG, 'hotels')
+    prefetch = int(CONFIG.get('page_prefetch', 1))
+    snapshots = any(stream in SELECTED for stream in SNAPSHOT_STREAMS)
+    pending = collections.deque()
+    hotel_ids = []
+    async def write_snapshots(keep):
+        while len(pending) > keep:
+            hotel_id, task = pending.popleft()
+            start = time.perf_counter()
+            body, _ = await task
+            METRICS.add_time('hotel_reviews_snapshot', 'fetch', time.perf_counter() - start)
+            write_hotel_reviews_snapshot(hotel_id, load_object([body]))
+    fetch_page = async_page_fetcher(client, porter_url('/hotels'), \
+        lambda page, size: {'page': page, 'size': size, 'sort': 'id,ASC'})
+    pages = async_iter_pages(fetch_page, sizer, prefetch)
+    try:
+        try:
+            async for offset, size, hotels_parsed in METRICS.timed_aiter('hotels', pages):
+                for record, raw_json in METRICS.timed_iter('hotels', hotels_parsed.with_raw()):
+                    hotel_id = str(emit_record('hotels', parse_hotel, record, raw_json) \
+                        .get('hotel_id', ''))
+                    hotel_ids.append(hotel_id)
+                    if snapshots:
+                        url = porter_url('/hotels/{}/reviewssnapshot'.format(hotel_id))
+                        pending.append((hotel_id, asyncio.ensure_future(client.get(url))))
+                        await write_snapshots(2 * client.max_in_flight)
+                log_page(offset, size, hotels_parsed.count, hotels_parsed.page)
+        except CLIENT_ERRORS + (ValueError,) as exception:
+            LOGGER.exception(exception)
+        await write_snapshots(0)
+    finally:
+        for _, task in pending:
+            task.cancel()
+    finish_hotels()
+    return hotel_ids
+
+def hotels_needed(CONFIG):
+    # the hotels are paged through for their own streams, and for the hotel ids
+    # when the reviews are partitioned by hotel
+    return any(stream in SELECTED for stream in HOTEL_STREAMS) or \
+        (CONFIG.get('partition_reviews_by_hotel') and \
+            any(stream in SELECTED for stream in REVIEW_STREAMS))
+
+def sync_snapshot_backfill(CONFIG, STATE, sync_until, hotel_ids):
+    # after the hotels, on threads with either engine
+    if CONFIG.get('snapshot_backfill') and hotel_ids and \
+            any(stream in SELECTED for stream in SNAPSHOT_STREAMS):
+        with METRICS.job('backfill_snapshots'):
+            backfill_snapshots(CONFIG, STATE, sync_until, hotel_ids)
+
+async def async_sync(CONFIG, STATE, sync_until):
+    # the async engine: all requests are tasks on one event loop, sharing one
+    # connection pool and max_in_flight; records are written from the loop, in
+    # the same order as the threaded engine writes them
+    async with AsyncTransport(limiter=LIMITER,
+                              timeout=CONFIG.get('request_timeout'),
+                              max_tries=int(CONFIG.get('max_tries') or 5),
+                              signer=SIGNER,
+                              observer=METRICS) as client:
+        hotel_ids = None
+        if hotels_needed(CONFIG):
+            with METRICS.job('sync_hotels'):
+                hotel_ids = await async_sync_hotels(client, CONFIG)
+            sync_snapshot_backfill(CONFIG, STATE, sync_until, hotel_ids)
+        if any(stream in SELECTED for stream in REVIEW_STREAMS):
+            with METRICS.job('sync_reviews'):
+                if CONFIG.get('partition_reviews_by_hotel'):
+                    LOGGER.info('Partitioned reviews are synced on threads, not by the async '
+                                'engine.')
+                    sync_reviews(CONFIG, STATE, sync_until, hotel_ids)
+                else:
+                    await async_sync_reviews(client, CONFIG, STATE, sync_until)
+
+def load_catalog(args):
+    # --catalog, or the deprecated --properties; None if neither was given
+    if getattr(args, 'catalog', None):
+        return args.catalog
+    if getattr(args, 'properties', None):
+        return Catalog.from_dict(args.properties)
+    return None
+
+def select_streams(catalog):
+    SELECTED.clear()
+    if catalog is None:
+        SELECTED.update({stream: None for stream in KEY_PROPERTIES})
+    else:
+        for stream, deselected in get_selection(catalog).items():
+            if stream in KEY_PROPERTIES:
+                SELECTED[stream] = [column for column, _ in fields.STREAMS[stream] \
+                    if column not in deselected] if deselected else None
+    if CONFIG.get('dimension_ids_only'):
+        # review sites and languages are only referenced by id
+        for stream in ('reviews', 'hotel_reviews_snapshot_by_site'):
+            if stream in SELECTED:
+                SELECTED[stream] = [column for column in SELECTED[stream] or \
+                    [column for column, _ in fields.STREAMS[stream]] \
+                    if column not in DIMENSION_COLUMNS]
+    LOGGER.info('Selected streams: {}.'.format(', '.join(SELECTED) or 'none'))
+
+def do_discover():
+    LOGGER.info("Running discovery.")
+    catalog = discover(KEY_PROPERTIES, CONFIG.get('json_columns', 'repr'))
+    json.dump(catalog.to_dict(), sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    LOGGER.info("Finished discovery.")
+
+def build_flatteners(json_columns):
+    # review sites and languages are flattened once each per run, and written
+    # to their streams then
+    interned = {key: Interned(fields.STREAMS[stream], json_columns, \
+        on_new=functools.partial(emit_dimension, stream)) \
+        for key, stream in fields.INTERNED.items()}
+    # only the selected columns are extracted; deselected streams that are
+    # still parsed get just their keys, and the review site and language ids
+    # when those streams are selected
+    keys = [KEY_PROPERTIES[stream][0] for stream in fields.INTERNED.values() \
+        if stream in SELECTED]
+    FLATTENERS.update({stream: Flattener(spec, json_columns=json_columns, \
+        columns=SELECTED[stream] if stream in SELECTED else KEY_PROPERTIES[stream] + keys, \
+        interned=interned) for stream, spec in fields.STREAMS.items()})
+
+def configure_account(CONFIG, STATE, max_in_flight):
+    # the objects every account of a multi-account run has its own one of;
+    # requests are signed as they are sent
+    LIMITER.configure(max_in_flight=CONFIG.get('max_in_flight') or max_in_flight,
+                      min_in_flight=CONFIG.get('min_in_flight', 1))
+    CHANGES.configure(enabled=CONFIG.get('emit_changes_only'), state=STATE)
+    DEDUP.configure(mode=CONFIG.get('dedup_filter'),
+                    capacity=CONFIG.get('dedup_capacity'),
+                    error_rate=CONFIG.get('dedup_error_rate'),
+                    max_state_ids=CONFIG.get('dedup_max_state_ids'))
+    DEDUP.start(STATE)
+    SIGNER.configure(username=CONFIG.get('username'),
+                     api_key=CONFIG.get('api_key'),
+                     api_secret=CONFIG.get('api_secret'),
+                     max_age=CONFIG.get('signature_max_age'))
+
+def sync_account(CONFIG, STATE, sync_until, max_in_flight):
+    configure_account(CONFIG, STATE, max_in_flight)
+    try:
+        if CONFIG.get('engine', 'threads') == 'async':
+            asyncio.run(async_sync(CONFIG, STATE, sync_until))
+        else:
+            hotel_ids = None
+            if hotels_needed(CONFIG):
+                with METRICS.job('sync_hotels'):
+                    hotel_ids = sync_hotels(CONFIG)
+                sync_snapshot_backfill(CONFIG, STATE, sync_until, hotel_ids)
+            if any(stream in SELECTED for stream in REVIEW_STREAMS):
+                with METRICS.job('sync_reviews'):
+                    sync_reviews(CONFIG, STATE, sync_until, hotel_ids)
+        finish_dimensions()
+    finally:
+        SIGNER.log_stats()
+        DEDUP.log_stats()
+
+def account_resources():
+    # a fresh set of the Scoped objects, for one account
+    return {'SIGNER': Signer(),
+            'LIMITER': RateLimiter(),
+            'CHANGES': ChangeDetector({stream: KEY_PROPERTIES[stream] \
+                for stream in HOTEL_STREAMS + DIMENSION_STREAMS}, accumulated=DIMENSION_STREAMS),
+            'DEDUP': BoundaryDedup()}
+
+def sync_accounts(sync_until, max_in_flight):
+    # every account's sync, account_concurrency at a time, each on a thread of
+    # its own with its own CONFIG, STATE, signer and limits; an account that
+    # fails does not stop the others
+    accounts = ACCOUNTS.accounts
+    concurrency = int(CONFIG.get('account_concurrency', 4))
+    LOGGER.info('Syncing {} accounts, {} at a time.'.format(len(accounts), concurrency))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(account.run, sync_account, account.config, account.state, \
+            sync_until, max_in_flight) for account in accounts]
+    failed = []
+    for account, future in zip(accounts, futures):
+        if future.exception() is not None:
+            LOGGER.error('Account {} failed: {}'.format(account.name, future.exception()))
+            failed.append(account.name)
+        else:
+            LOGGER.info('Finished account {}.'.format(account.name))
+    if failed:
+        raise RuntimeError('Accounts failed: {}'.format(', '.join(failed)))
+
+def account_stats():
+    if not ACCOUNTS.accounts:
+        return {'auth': SIGNER.stats(), 'dedup': DEDUP.stats()}
+    return {'accounts': {account.name: {'auth': account.resources['SIGNER'].stats(),
+                                        'dedup': account.resources['DEDUP'].stats()} \
+        for account in ACCOUNTS.accounts}}
 
 def do_sync(args):
     LOGGER.info("Starting sync.")
     CONFIG.update(args.config)
     if args.state:
         STATE.update(args.state)
-    # Get current timestamp - 5 min
-    minutes = 5
-    unix_timestamp = int(time.time())-(60 * minutes)
-    hash_key = generate_hash_key(
-        username=CONFIG.get('username'),
-        api_secret=CONFIG.get('api_secret'),
-        unix_timestamp=unix_timestamp
-    )
-    headers = {
-        'X-Revinate-Porter-Username': CONFIG.get('username'),
-        'X-Revinate-Porter-Timestamp': str(unix_timestamp),
-        'X-Revinate-Porter-Key': CONFIG.get('api_key'),
-        'X-Revinate-Porter-Encoded': hash_key
-    }
-    singer.write_schema('hotels',
-                        schemas.hotels,
-                        key_properties=['hotel_id'])
-    singer.write_schema('reviews',
-                        schemas.reviews,
-                        key_properties=['review_id'])
-    singer.write_schema('hotel_reviews_snapshot',
-                        schemas.hotel_reviews_snapshot,
-                        key_properties=['hotel_id', 'snapshot_start_date'])
-    singer.write_schema('hotel_reviews_snapshot_by_site',
-                        schemas.hotel_reviews_snapshot_by_site,
-                        key_properties=['hotel_id', 'review_site_id', 'snapshot_start_date'])
-    singer.write_schema('hotel_reviews_snapshot_by_time',
-                        schemas.hotel_reviews_snapshot_by_time,
-                        key_properties=['hotel_id', 'unix_time'])
-    sync_hotels(headers)
-    sync_reviews(headers, CONFIG, STATE)
+    select_streams(load_catalog(args))
+    accounts = ACCOUNTS.configure(resolve(CONFIG), resolve(STATE), account_resources)
+    # keep a pooled connection for every concurrent fetcher plus the pager, of
+    # every account syncing at once
+    per_account = max(int(CONFIG.get('pool_size') or DEFAULT_POOL_SIZE), \
+        int(CONFIG.get('snapshot_concurrency', 1)) + int(CONFIG.get('page_prefetch', 1)) + \
+        int(CONFIG.get('shard_concurrency', 4) if CONFIG.get('shard_reviews_by') else 0) + \
+        int(CONFIG.get('partition_concurrency', 4) if CONFIG.get('partition_reviews_by_hotel') \
+            else 0))
+    TRANSPORT.configure(pool_size=per_account * max(1, min(len(accounts), \
+        int(CONFIG.get('account_concurrency', 4)))), timeout=CONFIG.get('request_timeout'))
+    CACHE.configure(directory=CONFIG.get('cache_dir'),
+                    max_bytes=CONFIG.get('cache_max_bytes', DEFAULT_MAX_BYTES),
+                    ttl=CONFIG.get('cache_ttl', 0))
+    write_depth = int(CONFIG.get('write_queue_depth', DEFAULT_WRITE_DEPTH))
+    WRITER.configure(buffer_size=CONFIG.get('write_buffer_size', DEFAULT_BUFFER_SIZE),
+                     stage=WriteStage(write_out, write_depth, PIPELINE) if write_depth else None)
+    # reviews are synced up to the current timestamp - 5 min, fixed for the run
+    sync_until = int(time.time()) - CLOCK_SKEW
+    json_columns = CONFIG.get('json_columns', 'repr')
+    build_flatteners(json_columns)
+    for stream, columns in SELECTED.items():
+        schema = schemas.get_schema(stream, json_columns, columns)
+        key_properties = KEY_PROPERTIES[stream]
+        if accounts and stream in ACCOUNT_STREAMS:
+            # records are tagged with the name of the account they come from
+            schema['properties']['account'] = {'type': 'string'}
+            key_properties = ['account'] + key_properties
+        WRITER.write_schema(stream, schema, key_properties=key_properties)
+    try:
+        if accounts:
+            sync_accounts(sync_until, per_account)
+        else:
+            sync_account(CONFIG, STATE, sync_until, per_account)
+    finally:
+        # records written after the last STATE are still in the buffer
+        WRITER.flush()
+        METRICS.close()
+        TRANSPORT.log_stats()
+        CACHE.log_stats()
+        WRITER.log_stats()
+        PIPELINE.log_stats()
+        METRICS.log_summary()
+        if CONFIG.get('metrics_file'):
+            METRICS.write_summary(CONFIG['metrics_file'], dict(account_stats(), **{
+                'http': TRANSPORT.stats(),
+                'cache': CACHE.stats(),
+                'output': WRITER.stats(),
+                'pipeline': PIPELINE.stats()
+            }))
+
+def check_config(config):
+    # the credentials and start_date can be set once at the top level, or for
+    # each account under `accounts`
+    for account in config.get('accounts') or [{}]:
+        utils.check_config(dict(config, **account), REQUIRED_CONFIG_KEYS)
+        if dict(config, **account).get('engine') == 'async' and config.get('cache_dir'):
+            raise ValueError('cache_dir is not supported by the async engine.')
+        ignored = [key for key in RUN_SETTINGS if key in account]
+        if ignored:
+            LOGGER.warning('Account {} sets {}, which apply to the whole run: the top-level ' \
+                'values are used instead.'.format(account.get('name') or account.get('username'), \
+                ', '.join(ignored)))
 
 def main_impl():
-    args = utils.parse_args(REQUIRED_CONFIG_KEYS)
+    args = utils.parse_args([])
+    check_config(args.config)
+    if args.discover:
+        CONFIG.update(args.config)
+        do_discover()
+        return
     try:
         do_sync(args)
     except RuntimeError:
@@ -0,0 +1,130 @@
+import collections.abc
+import contextvars
+import copy
+import threading
+import singer
+
+LOGGER = singer.get_logger()
+# the Account whose sync is running in this context; None outside a
+# multi-account run
+ACCOUNT = contextvars.ContextVar('tap_revinate_account', default=None)
+
+
+class Scoped: # pylint: disable=too-few-public-methods
+    """Stands in for an object every account has one of.
+
+    Attribute access goes to the object of the Account whose sync is running
+    in the current context, found in its resources under `name`, or to
+    `default` outside a multi-account run. The tap starts its worker threads
+    in a copy of the context starting them, so they work for the same
+    account.
+    """
+
+    def __init__(self, name, default):
+        self._name = name
+        self._default = default
+
+    def _resolve(self):
+        account = ACCOUNT.get()
+        return self._default if account is None else account.resources[self._name]
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            # copy and pickle probing for hooks, before _name is set
+            raise AttributeError(attr)
+        return getattr(self._resolve(), attr)
+
+
+class ScopedDict(Scoped, collections.abc.MutableMapping):
+    """A Scoped dict: CONFIG and STATE, one per account."""
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+    def __setitem__(self, key, value):
+        self._resolve()[key] = value
+
+    def __delitem__(self, key):
+        del self._resolve()[key]
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def __contains__(self, key):
+        return key in self._resolve()
+
+    def get(self, key, default=None):
+        return self._resolve().get(key, default)
+
+
+def resolve(value):
+    # the object a Scoped stands for in this context; anything else as it is
+    return value._resolve() if isinstance(value, Scoped) else value  # pylint: disable=protected-access
+
+
+class Account: # pylint: disable=too-few-public-methods
+    """One Porter account of a multi-account run.
+
+    config is the top-level config with the account's own settings over it,
+    and state its part of the state. resources holds the account's own
+    instance of each Scoped object, by name.
+    """
+
+    def __init__(self, name, config, state, resources):
+        self.name = name
+        self.config = config
+        self.state = state
+        self.resources = dict(resources, CONFIG=config, STATE=state)
+
+    def run(self, func, *args):
+        # func(*args) with this account's objects in place of the Scoped ones
+        def run():
+            ACCOUNT.set(self)
+            return func(*args)
+        return contextvars.copy_context().run(run)
+
+
+class Accounts:
+    """The accounts listed under `accounts` in the config, and their state.
+
+    Each account's state is kept under its name in the `accounts` object of
+    the state. An account writes the state from its own thread whenever it
+    would have in a single-account run; the STATE message then carries its
+    state as it is at that moment, alongside the latest state every other
+    account wrote (or was started with), so each one's bookmarks only follow
+    the records it wrote before them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.accounts = []
+        self._written = {}
+
+    def configure(self, config, state, resources):
+        # resources() makes a fresh set of an account's Scoped objects
+        entries = config.get('accounts') or []
+        self.accounts = []
+        states = state.setdefault('accounts', {}) if entries else {}
+        shared = {key: value for key, value in config.items() if key != 'accounts'}
+        for entry in entries:
+            name = str(entry.get('name') or entry['username'])
+            if any(account.name == name for account in self.accounts):
+                raise ValueError('Two accounts are named {!r}; give them distinct names.'.format(
+                    name))
+            self.accounts.append(Account(name, dict(shared, **entry),
+                                         states.setdefault(name, {}), resources()))
+        with self._lock:
+            self._written = copy.deepcopy(states)
+        return self.accounts
+
+    def state_message(self, state):
+        # the value of the STATE message to write for `state`
+        account = ACCOUNT.get()
+        if account is None:
+            return resolve(state)
+        with self._lock:
+            self._written[account.name] = copy.deepcopy(account.state)
+            return {'accounts': dict(self._written)}
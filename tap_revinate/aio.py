@@ -0,0 +1,153 @@
+import asyncio
+import collections
+import random
+import time
+import singer
+from tap_revinate.auth import AUTH_STATUSES
+from tap_revinate.streaming import PorterPage
+from tap_revinate.throttle import retry_after_seconds
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+LOGGER = singer.get_logger()
+# how often a task waiting for a request slot looks again, in case one was
+# freed by a request made on a thread
+SLOT_POLL_SECONDS = 0.05
+# what a failed request raises, for callers that carry on after one
+CLIENT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError) if aiohttp else ()
+
+
+class AsyncTransport:
+    """aiohttp client for the async engine.
+
+    One session, so one connection pool, shared by every task. Requests
+    take their slots from the limiter (a throttle.RateLimiter, the one
+    request() uses), so throttled responses lower the number in flight and
+    pause new requests for their Retry-After as they do on threads. Failed
+    requests are retried the way request() retries them: up to max_tries
+    with jittered exponential backoff, giving up at once on 4xx other than
+    429. Each request
+    is signed by the signer (an auth.Signer) as it is sent, and signed
+    again and retried once if Porter refuses the signature. Requests,
+    bytes and retries are counted by the observer (an Instrumentation).
+    """
+
+    def __init__(self, signer, limiter, timeout=None, max_tries=5, observer=None):
+        # create inside the event loop the engine runs on
+        if aiohttp is None:
+            raise RuntimeError('The async engine needs aiohttp: pip install tap-revinate[async]')
+        self.max_in_flight = limiter.max_in_flight
+        self.max_tries = max(1, int(max_tries))
+        self.signer = signer
+        self.limiter = limiter
+        self.observer = observer
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+            timeout=aiohttp.ClientTimeout(total=float(timeout) if timeout else None),
+            headers={'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'})
+        self._released = asyncio.Event()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def get(self, url, params=None):
+        """The body of a GET and the seconds it took, retrying failures."""
+        tries = 0
+        resigned = False
+        while True:
+            tries = tries + 1
+            auth = self.signer.headers()
+            try:
+                return await self._get(url, auth, params)
+            except CLIENT_ERRORS as exception:
+                status = getattr(exception, 'status', None)
+                if status in AUTH_STATUSES and not resigned:
+                    # the signature may have aged out meanwhile: sign again
+                    # and retry once, without counting it as a try
+                    self.signer.refresh(auth)
+                    resigned = True
+                    tries = tries - 1
+                    continue
+                if tries >= self.max_tries or \
+                        (status is not None and 400 <= status < 500 and status != 429):
+                    LOGGER.exception(exception)
+                    raise
+                if self.observer is not None:
+                    self.observer.on_backoff({'args': (url,), 'kwargs': {}})
+                # a Retry-After already holds back every request for that long
+                if not self.limiter.paused_for():
+                    await asyncio.sleep(random.uniform(0, 2 ** tries))
+
+    async def _acquire(self):
+        # a slot from the limiter, waiting on the loop rather than blocking it
+        while True:
+            epoch, wait = self.limiter.try_acquire()
+            if epoch is not None:
+                return epoch
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), \
+                    SLOT_POLL_SECONDS if wait is None else wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _get(self, url, headers, params):
+        epoch = await self._acquire()
+        status = retry_after = None
+        try:
+            LOGGER.info("Making request: GET {} {}".format(url, params or {}))
+            start = time.perf_counter()
+            async with self.session.get(url, headers=headers, params=params) as response:
+                status = response.status
+                retry_after = retry_after_seconds(response.headers)
+                if self.observer is not None:
+                    self.observer.observe_request(url, time.perf_counter() - start, status)
+                LOGGER.info("Got response code: {}".format(status))
+                response.raise_for_status()
+                body = await response.read()
+        finally:
+            self.limiter.release(epoch, status, retry_after)
+            self._released.set()
+        received = int(response.headers.get('Content-Length') or len(body))
+        if self.observer is not None:
+            self.observer.observe_bytes(url, received)
+        return body, time.perf_counter() - start
+
+
+def async_page_fetcher(client, url, params):
+    # fetch_page for async_iter_pages; params(page, size) gives each page's query
+    async def fetch_page(page, size):
+        body, latency = await client.get(url, params(page, size))
+        return PorterPage([body]), latency, len(body)
+    return fetch_page
+
+
+async def async_iter_pages(fetch_page, sizer, prefetch=1, start=0):
+    # iter_pages for the async engine: pages after the first are fetched
+    # `prefetch` at a time as tasks, and yielded in order
+    async def fetch(offset, size):
+        page, latency, nbytes = await fetch_page(offset // size, size)
+        sizer.observe(size, latency, nbytes)
+        return offset, size, page
+    size = sizer.next_size(start)
+    first = await fetch(start, size)
+    yield first
+    total_elements = int(first[2].page.get('totalElements', 0))
+    offset = start + size
+    pending = collections.deque()
+    try:
+        while offset < total_elements or pending:
+            while offset < total_elements and len(pending) < prefetch:
+                chunk_size = sizer.next_size(offset)
+                pending.append(asyncio.ensure_future(fetch(offset, chunk_size)))
+                offset = offset + chunk_size
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,98 @@
+import binascii
+import hashlib
+import hmac
+import threading
+import time
+import singer
+
+LOGGER = singer.get_logger()
+# Porter answers these when it does not accept the signature
+AUTH_STATUSES = (401, 403)
+# requests are signed with a timestamp this far in the past
+CLOCK_SKEW = 5 * 60
+DEFAULT_MAX_AGE = 5 * 60
+
+
+def generate_hash_key(username, api_secret, unix_timestamp):
+    user_time = username + str(unix_timestamp)
+    user_time_enc = user_time.encode()
+    api_secret_enc = api_secret.encode()
+    dig = hmac.new(api_secret_enc, user_time_enc, digestmod=hashlib.sha256).digest()
+    dig_hex = binascii.hexlify(dig)
+    hash_key = repr(dig_hex)[2:(len(repr(dig_hex))-1)]
+    LOGGER.info("Generated user-time hash key.")
+    return hash_key
+
+
+class Signer:
+    """The X-Revinate-Porter-* headers for each request, re-signed as they age.
+
+    A signature is reused until it is max_age seconds old and then made
+    again with the current time, so a run of any length never sends one
+    Porter might have stopped accepting. refresh() signs again straight
+    away, for a request that was refused; when several requests are
+    refused with the same signature it signs again only once. Safe to use
+    from any number of threads.
+    """
+
+    def __init__(self, username=None, api_key=None, api_secret=None,
+                 max_age=DEFAULT_MAX_AGE):
+        self._lock = threading.Lock()
+        self._credentials = (username, api_key, api_secret)
+        self.max_age = float(max_age)
+        self._headers = None
+        self._signed_at = 0.0
+        self._stats = {'signatures': 0, 'refreshes': 0}
+
+    def configure(self, username, api_key, api_secret, max_age=DEFAULT_MAX_AGE):
+        with self._lock:
+            self._credentials = (username, api_key, api_secret)
+            self.max_age = float(max_age or DEFAULT_MAX_AGE)
+            self._headers = None
+
+    def _sign(self):
+        username, api_key, api_secret = self._credentials
+        self._signed_at = time.time()
+        unix_timestamp = int(self._signed_at) - CLOCK_SKEW
+        self._headers = {
+            'X-Revinate-Porter-Username': username,
+            'X-Revinate-Porter-Timestamp': str(unix_timestamp),
+            'X-Revinate-Porter-Key': api_key,
+            'X-Revinate-Porter-Encoded': generate_hash_key(
+                username=username,
+                api_secret=api_secret,
+                unix_timestamp=unix_timestamp)
+        }
+        self._stats['signatures'] += 1
+
+    def headers(self):
+        # the current signature headers; treat the dict as read-only
+        with self._lock:
+            if self._headers is None or time.time() - self._signed_at >= self.max_age:
+                self._sign()
+            return self._headers
+
+    def refresh(self, refused):
+        # sign again after `refused` (a headers() result) was rejected, unless
+        # another thread already has
+        with self._lock:
+            if self._headers is refused:
+                LOGGER.warning('Porter refused the request signature, signing again.')
+                self._stats['refreshes'] += 1
+                self._sign()
+            return self._headers
+
+    def sign(self, headers):
+        # headers plus the current signature, and the signature on its own to
+        # hand to refresh() if the request is refused
+        auth = self.headers()
+        return dict(headers or {}, **auth), auth
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def log_stats(self):
+        stats = self.stats()
+        LOGGER.info('Auth: {} signatures, {} after a refused request.'.format(
+            stats['signatures'], stats['refreshes']))
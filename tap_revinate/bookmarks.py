@@ -0,0 +1,158 @@
+# Where a reviews sync starts from and how far it has got, kept in the state
+# as last_update (the updatedAt of the last review emitted) with the ids of the
+# reviews emitted at that second (see dedup.py), and the
+# periods a hotel reviews snapshot backfill has written, under snapshot_backfill,
+# and the newest hotel_reviews_snapshot_by_time period of each hotel, under
+# snapshot_by_time.
+
+import calendar
+import datetime
+import time
+from singer import utils
+
+
+def reviews_window(CONFIG, STATE, sync_until):
+    to_timestamp = int(sync_until)
+    from_timestamp = 0  # initial value
+    # set from_timestamp as NVL(STATE.last_update, CONFIG.start_date, now - 1 year)
+    if 'last_update' not in STATE:
+        if 'start_date' not in CONFIG:
+            from_timestamp = to_timestamp - (60 * 60 * 24 * 7)  # looks back 1 week
+        else:
+            from_timestamp = int(time.mktime(datetime.datetime.strptime(CONFIG['start_date'], \
+                '%Y-%m-%dT%H:%M:%SZ').timetuple()))
+    else:
+        from_timestamp = int(STATE['last_update'])
+    return from_timestamp, to_timestamp
+
+
+def checkpoint_due(CONFIG):
+    # returns a function to call after each page, True once it is time for a checkpoint
+    checkpoint_pages = int(CONFIG.get('checkpoint_pages', 50))
+    checkpoint_seconds = float(CONFIG.get('checkpoint_seconds', 300))
+    since = {'pages': 0, 'time': time.time()}
+    def due():
+        since['pages'] = since['pages'] + 1
+        if since['pages'] < checkpoint_pages and time.time() - since['time'] < checkpoint_seconds:
+            return False
+        since.update(pages=0, time=time.time())
+        return True
+    return due
+
+
+def track_position(position, record):
+    # position is [last_update, count]: the updatedAt of the last review read
+    # and how many reviews read had it
+    if record['updatedAt'] == position[0]:
+        position[1] = position[1] + 1
+    else:
+        position[:] = [record['updatedAt'], 1]
+
+
+def review_partitions(CONFIG, STATE, sync_until, hotel_ids):
+    # {hotel_id: partition} for the hotels found this run, each with its own
+    # bookmark under reviews_by_hotel. A hotel without one starts from
+    # start_date, except on the first partitioned run, when every hotel
+    # carries on from the global bookmark
+    first_run = 'reviews_by_hotel' not in STATE
+    states = STATE.setdefault('reviews_by_hotel', {})
+    partitions = {}
+    for hotel_id in hotel_ids:
+        if not hotel_id:
+            continue
+        if hotel_id not in states:
+            states[hotel_id] = {key: STATE[key] for key in \
+                ('last_update', 'last_update_review_ids') if key in STATE and first_run}
+        state = states[hotel_id]
+        window = reviews_window(CONFIG, state, sync_until)
+        partitions[hotel_id] = {'state': state, 'window': window,
+                                'position': [window[0], 0], 'dedup': None}
+    return partitions
+
+
+def save_review_partition(partition, completed):
+    # the hotel's bookmark, moved the way finish_reviews moves the global one
+    state = partition['state']
+    last_update, read = partition['position']
+    if completed and last_update == partition['window'][0] and read == 0:
+        last_update = partition['window'][1] # nothing new in the window
+    utils.update_state(state, 'last_update', last_update)
+    if partition['dedup'] is not None:
+        partition['dedup'].save(state, last_update)
+    elif completed:
+        state.pop('last_update_review_ids', None)
+
+
+SNAPSHOT_PERIODS = ('day', 'week', 'month')
+
+
+def period_start(timestamp, period):
+    # the start of the UTC day, week (from Monday) or month timestamp is in
+    day = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).date()
+    if period == 'week':
+        day = day - datetime.timedelta(days=day.weekday())
+    elif period == 'month':
+        day = day.replace(day=1)
+    return calendar.timegm(day.timetuple())
+
+
+def next_period(start, period):
+    day = datetime.datetime.fromtimestamp(start, datetime.timezone.utc).date()
+    if period == 'month':
+        day = (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    else:
+        day = day + datetime.timedelta(days=7 if period == 'week' else 1)
+    return calendar.timegm(day.timetuple())
+
+
+def snapshot_periods(CONFIG, sync_until):
+    # (start, end) of every whole snapshot_backfill period from
+    # snapshot_backfill_start_date (or start_date) that ended by sync_until;
+    # end is the last second of the period, as ?date=start..end is inclusive
+    period = CONFIG['snapshot_backfill']
+    if period not in SNAPSHOT_PERIODS:
+        raise ValueError('snapshot_backfill must be one of {}, not {!r}'.format(
+            ', '.join(SNAPSHOT_PERIODS), period))
+    start_date = CONFIG.get('snapshot_backfill_start_date') or CONFIG['start_date']
+    start = period_start(calendar.timegm(datetime.datetime.strptime(start_date, \
+        '%Y-%m-%dT%H:%M:%SZ').timetuple()), period)
+    periods = []
+    end = next_period(start, period)
+    while end <= sync_until:
+        periods.append((start, end - 1))
+        start, end = end, next_period(end, period)
+    return periods
+
+
+def snapshot_backfill_jobs(STATE, hotel_ids, periods):
+    # (hotel_id, period) for the periods each hotel has no snapshot for yet, by
+    # hotel and then period; a hotel's bookmark is the end of the last period
+    # written for it
+    done = STATE.get('snapshot_backfill', {})
+    return [(hotel_id, period) for hotel_id in hotel_ids if hotel_id \
+        for period in periods if period[1] > int(done.get(hotel_id, -1))]
+
+
+def by_time_periods(CONFIG, STATE, hotel_id, periods):
+    # the valuesByTime periods of a hotel's current snapshot to emit, and the
+    # ones to skip. With snapshot_by_time_incremental, only those from the
+    # hotel's bookmark on (the period that was still open when it was last
+    # synced) are emitted, and all of them the first time and every
+    # snapshot_by_time_refresh_days. The bookmark moves to the newest period;
+    # the caller emits them before it next writes the state
+    if not CONFIG.get('snapshot_by_time_incremental') or not periods:
+        return periods, []
+    bookmarks = STATE.setdefault('snapshot_by_time', {})
+    bookmark = bookmarks.get(hotel_id)
+    now = int(time.time())
+    refresh = float(CONFIG.get('snapshot_by_time_refresh_days') or 0) * 60 * 60 * 24
+    latest = max(int(period.get('time') or 0) for period in periods)
+    if bookmark is None or (refresh and now - bookmark['refreshed_at'] >= refresh):
+        bookmarks[hotel_id] = {'unix_time': latest, 'refreshed_at': now}
+        return periods, []
+    since = bookmark['unix_time']
+    bookmark['unix_time'] = max(since, latest)
+    emit, skip = [], []
+    for period in periods:
+        (emit if int(period.get('time') or 0) >= since else skip).append(period)
+    return emit, skip
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import singer
+
+LOGGER = singer.get_logger()
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ResponseCache:
+    """Persistent cache of Porter response bodies, in a local directory.
+
+    Entries are keyed by namespace (the Porter username), URL and params.
+    Each is a .body file holding the decoded response body and a .json file
+    holding the URL, the server's ETag and Last-Modified validators, when it
+    was stored and how long fetching it took. With validators the next
+    request for the URL is sent with If-None-Match / If-Modified-Since and a
+    304 serves the stored body; within `ttl` seconds of being stored an entry
+    is served without asking at all, which is the only way an entry without
+    validators is reused. Bodies are evicted least recently used first once
+    the directory holds more than max_bytes.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, ttl=0):
+        self.directory = None
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl)
+        self._lock = threading.Lock()
+        self._sizes = {}
+        self._stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stored': 0, 'evicted': 0,
+                       'bytes_saved': 0, 'seconds_saved': 0.0}
+        self.configure(directory, max_bytes, ttl)
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def configure(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, ttl=0):
+        self.max_bytes = int(max_bytes or DEFAULT_MAX_BYTES)
+        self.ttl = float(ttl or 0)
+        self.directory = directory or None
+        self._sizes = {}
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith('.body'):
+                path = os.path.join(self.directory, name)
+                self._sizes[name[:-len('.body')]] = os.path.getsize(path)
+
+    def key(self, namespace, url, params=None):
+        text = json.dumps([namespace, url, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def lookup(self, key):
+        # the stored metadata for key, or None
+        if not self.enabled or key not in self._sizes:
+            return None
+        try:
+            with open(self._path(key, '.json'), encoding='utf-8') as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, meta):
+        return self.ttl > 0 and time.time() - meta['stored_at'] < self.ttl
+
+    @staticmethod
+    def validators(meta):
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def read(self, key, meta, revalidated=False):
+        """The stored body, as a list of chunks, counting it as transfer saved.
+
+        None if the entry has been evicted since it was looked up.
+        """
+        path = self._path(key, '.body')
+        try:
+            with open(path, 'rb') as body_file:
+                body = body_file.read()
+            # mtime orders entries for LRU eviction
+            os.utime(path)
+        except OSError:
+            return None
+        with self._lock:
+            self._stats['revalidated' if revalidated else 'hits'] += 1
+            self._stats['bytes_saved'] += len(body)
+            self._stats['seconds_saved'] += meta.get('fetch_seconds', 0.0)
+        return [body]
+
+    def should_store(self, response):
+        return self.enabled and (self.ttl > 0 or 'ETag' in response.headers or \
+            'Last-Modified' in response.headers)
+
+    def write_through(self, key, url, response, chunks):
+        """Yield chunks unchanged, storing them as key's body once all are read.
+
+        Nothing is stored if the caller stops early or reading fails.
+        """
+        with self._lock:
+            self._stats['misses'] += 1
+        # time spent reading the body, not counting the caller's work between chunks
+        reading = response.elapsed.total_seconds()
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        complete = False
+        chunks = iter(chunks)
+        try:
+            with os.fdopen(handle, 'wb') as body_file:
+                while True:
+                    start = time.perf_counter()
+                    chunk = next(chunks, None)
+                    reading = reading + time.perf_counter() - start
+                    if chunk is None:
+                        break
+                    body_file.write(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if complete:
+                self._store(key, temp_path, {
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'stored_at': time.time(),
+                    'fetch_seconds': reading
+                })
+            elif os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _store(self, key, temp_path, meta):
+        size = os.path.getsize(temp_path)
+        os.replace(temp_path, self._path(key, '.body'))
+        with open(self._path(key, '.json'), 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file)
+        with self._lock:
+            self._sizes[key] = size
+            self._stats['stored'] += 1
+            if sum(self._sizes.values()) > self.max_bytes:
+                self._evict(keep=key)
+
+    def _evict(self, keep):
+        def last_used(key):
+            try:
+                return os.path.getmtime(self._path(key, '.body'))
+            except OSError:
+                return 0.0
+        total = sum(self._sizes.values())
+        for key in sorted(self._sizes, key=last_used):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total = total - self._sizes.pop(key)
+            for suffix in ('.body', '.json'):
+                try:
+                    os.remove(self._path(key, suffix))
+                except OSError:
+                    pass
+            self._stats['evicted'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._sizes)
+            stats['bytes'] = sum(self._sizes.values())
+        return stats
+
+    def log_stats(self):
+        if not self.enabled:
+            return
+        stats = self.stats()
+        LOGGER.info('Cache: {} hits, {} revalidated, {} misses, {} bytes and ~{:.1f}s of '
+                    'transfer saved, {} entries ({} bytes, {} evicted)'.format(
+                        stats['hits'], stats['revalidated'], stats['misses'],
+                        stats['bytes_saved'], stats['seconds_saved'], stats['entries'],
+                        stats['bytes'], stats['evicted']))
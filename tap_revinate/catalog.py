@@ -0,0 +1,58 @@
+from singer import metadata
+from singer.catalog import Catalog, CatalogEntry, Schema
+import tap_revinate.schemas as schemas
+
+# reviews are synced from the last_update bookmark; the other streams are
+# read in full every run
+REPLICATION_KEYS = {'reviews': ['updated_at']}
+
+
+def discover(key_properties, json_columns_mode='repr'):
+    """A catalog of every stream, with Singer standard metadata.
+
+    A stream is synced once `selected` is set in its () breadcrumb metadata.
+    Its fields are selected by default; setting `selected` to false on a
+    field leaves that column out, except for key properties.
+    """
+    entries = []
+    for stream, keys in key_properties.items():
+        schema = schemas.get_schema(stream, json_columns_mode)
+        replication_keys = REPLICATION_KEYS.get(stream)
+        mdata = metadata.get_standard_metadata(
+            schema=schema,
+            key_properties=keys,
+            valid_replication_keys=replication_keys,
+            replication_method='INCREMENTAL' if replication_keys else 'FULL_TABLE')
+        mdata = metadata.to_map(mdata)
+        for column in schema['properties']:
+            mdata = metadata.write(mdata, ('properties', column), 'selected-by-default', True)
+        mdata = metadata.to_list(mdata)
+        entries.append(CatalogEntry(tap_stream_id=stream,
+                                    stream=stream,
+                                    schema=Schema.from_dict(schema),
+                                    key_properties=keys,
+                                    metadata=mdata))
+    return Catalog(entries)
+
+
+def is_selected(mdata, breadcrumb=()):
+    selected = metadata.get(mdata, breadcrumb, 'selected')
+    if selected is None:
+        selected = metadata.get(mdata, breadcrumb, 'selected-by-default')
+    return bool(selected) or metadata.get(mdata, breadcrumb, 'inclusion') == 'automatic'
+
+
+def get_selection(catalog):
+    """{stream: [deselected columns]} for the streams selected in catalog.
+
+    Key properties are never deselected. A stream selected through the
+    legacy `schema.selected` flag counts as selected.
+    """
+    selection = {}
+    for entry in catalog.streams:
+        mdata = metadata.to_map(entry.metadata or [])
+        if not (is_selected(mdata) or entry.is_selected()):
+            continue
+        selection[entry.tap_stream_id] = [breadcrumb[1] for breadcrumb in mdata \
+            if len(breadcrumb) == 2 and not is_selected(mdata, breadcrumb)]
+    return selection
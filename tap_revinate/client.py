@@ -0,0 +1,320 @@
+# Requests to the Porter API, signed, throttled and retried, and the paging
+# shared by the hotels and reviews streams.
+
+import itertools
+import time
+import backoff
+import requests
+import singer
+from singer import metrics
+from tap_revinate.auth import AUTH_STATUSES
+from tap_revinate.concurrency import ordered_map
+from tap_revinate.context import CACHE, CONFIG, LIMITER, METRICS, PIPELINE, SIGNER, TRANSPORT
+from tap_revinate.instrumentation import endpoint_of
+from tap_revinate.paging import aligned_size
+from tap_revinate.pipeline import staged, DEFAULT_DECODE_DEPTH
+from tap_revinate.streaming import load_object
+from tap_revinate.throttle import THROTTLE_STATUSES, retry_after_seconds
+
+LOGGER = singer.get_logger()
+# read when each request is made, so it can be pointed elsewhere (as the
+# benchmarks point it at their mock Porter)
+BASE_URL = 'https://porter.revinate.com'
+# records handed from the decode stage to the writing thread at a time
+DECODE_BATCH_SIZE = 100
+
+
+def porter_url(path):
+    # the URL of a Porter API path, e.g. /hotels
+    return BASE_URL + path
+
+
+def is_fatal_error(exception):
+    # 4xx errors won't go away on retry, except 429 Too Many Requests
+    response = getattr(exception, 'response', None)
+    return response is not None and 400 <= response.status_code < 500 and \
+        response.status_code != 429
+
+
+def retry_wait(factor=2):
+    # exponential backoff, except after a throttled response that carried a
+    # Retry-After: LIMITER already holds every request back for that long
+    for delay in backoff.expo(factor=factor):
+        yield LIMITER.retry_delay(delay)
+
+
+@backoff.on_exception(retry_wait,
+                      (requests.exceptions.RequestException),
+                      max_tries=lambda: int(CONFIG.get('max_tries') or 5),
+                      giveup=is_fatal_error,
+                      on_backoff=METRICS.on_backoff,
+                      factor=2)
+
+def request(url, params={}, stream=False, headers=None):
+    # headers, if any, are sent along with the signature headers from SIGNER
+    signed, auth = SIGNER.sign(headers)
+    response = send(url, signed, params, stream)
+    if response.status_code in AUTH_STATUSES:
+        # the signature may have aged out meanwhile: sign again and retry once
+        response.close()
+        response = send(url, dict(headers or {}, **SIGNER.refresh(auth)), params, stream)
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        response.close()
+        raise
+    return response
+
+
+def send(url, headers, params, stream):
+    LOGGER.info("Making request: GET {} {}".format(url, params))
+    epoch = LIMITER.acquire()
+    start = time.time()
+    try:
+        with metrics.http_request_timer(endpoint_of(url)) as timer:
+            response = TRANSPORT.get(
+                url=url,
+                headers=headers,
+                params=params,
+                stream=stream)
+            timer.tags[metrics.Tag.http_status_code] = response.status_code
+    except Exception as exception:
+        LIMITER.release(epoch)
+        METRICS.observe_request(url, time.time() - start, type(exception).__name__)
+        LOGGER.exception(exception)
+        raise
+    LIMITER.release(epoch, response.status_code, retry_after_seconds(response.headers))
+    METRICS.observe_request(url, time.time() - start, response.status_code)
+    LOGGER.info("Got response code: {}".format(response.status_code))
+    return response
+
+
+def fetch_cached(url, params=None):
+    # the body of a GET as chunks, served from CACHE when Porter answers 304
+    # Not Modified, or without asking while the entry is within cache_ttl
+    if not CACHE.enabled:
+        return TRANSPORT.iter_content(request(url, params, stream=True))
+    key = CACHE.key(CONFIG.get('username'), url, params)
+    meta = CACHE.lookup(key)
+    if meta is not None and CACHE.is_fresh(meta):
+        body = CACHE.read(key, meta)
+        if body is not None:
+            return body
+    resp = request(url, params, stream=True, headers=CACHE.validators(meta) if meta else None)
+    if resp.status_code == 304:
+        for _ in TRANSPORT.iter_content(resp):
+            pass
+        body = CACHE.read(key, meta, revalidated=True)
+        if body is not None:
+            return body
+        # evicted in the meantime
+        resp = request(url, params, stream=True)
+    chunks = TRANSPORT.iter_content(resp)
+    if CACHE.should_store(resp):
+        return CACHE.write_through(key, url, resp, chunks)
+    return chunks
+
+
+def fetch_object(url, params=None):
+    # a whole JSON object through fetch_cached. A body cut off while it is read
+    # is requested again, up to max_tries with request()'s backoff
+    max_tries = int(CONFIG.get('max_tries') or 5)
+    for tries, delay in zip(range(1, max_tries + 1), retry_wait()):
+        chunks = fetch_cached(url, params)
+        try:
+            return load_object(chunks)
+        except requests.exceptions.RequestException as exception:
+            if tries == max_tries:
+                raise
+            LOGGER.warning('Reading {} failed ({}), requesting it again.'.format(url, exception))
+        time.sleep(backoff.full_jitter(delay))
+    return None
+
+
+def is_page_size_error(exception):
+    # errors that a smaller page might avoid: timeouts, bodies cut off part way
+    # and server-side failures, other than throttling
+    if isinstance(exception, (requests.exceptions.Timeout,
+                              requests.exceptions.ChunkedEncodingError)):
+        return True
+    response = getattr(exception, 'response', None)
+    return response is not None and response.status_code >= 500 and \
+        response.status_code not in THROTTLE_STATUSES
+
+
+def fetch_page_chunk(fetch_page, sizer, offset, size):
+    # the page of size records at offset, requested, with its body still to read
+    return ResumablePage(fetch_page, sizer, offset, size).fetch()
+
+
+class ResumablePage:
+    """A page from fetch_page_chunk, whose body is still to be read.
+
+    Iterating it reads the records as they arrive, like PorterPage. If the
+    connection is lost while they are (a reset, a read timeout), the page
+    is requested again and the records already yielded are skipped, up to
+    max_tries with request()'s backoff; the error is raised after that.
+    In adaptive mode, a page failing with an error a smaller page might
+    avoid, whether before or while its body is read, is read from the first
+    record not yet yielded in aligned pages of half its size instead.
+    count and page are those of PorterPage, once the records are read.
+    """
+
+    def __init__(self, fetch_page, sizer, offset, size):
+        self._fetch_page = fetch_page
+        self._sizer = sizer
+        self._offset = offset
+        self._size = size
+        self._page = None
+        self.count = 0
+        # False once read in smaller pages, which don't tell the sizer about this size
+        self.streamed = True
+
+    @property
+    def page(self):
+        return self._page.page
+
+    def fetch(self):
+        # request the page; after an error a smaller page might avoid, the
+        # records are read in smaller pages instead
+        self._page = None
+        try:
+            self._page = self._fetch_page(self._offset // self._size, self._size)
+        except requests.exceptions.RequestException as exception:
+            if not self._splits(exception):
+                raise
+        return self
+
+    def _splits(self, exception):
+        if not self._sizer.adaptive or self._size == 1 or not is_page_size_error(exception):
+            return False
+        LOGGER.warning('Page of {} records at offset {} failed after {} records ({}), ' \
+            'retrying with smaller pages.'.format(self._size, self._offset, self.count, exception))
+        self._sizer.shrink(self._size)
+        return True
+
+    def _split(self):
+        # the records not yet yielded, in aligned pages of at most half the
+        # size, until one comes back short
+        self.streamed = False
+        offset = self._offset + self.count
+        end = self._offset + self._size
+        while offset < end:
+            part_size = aligned_size(offset, min(self._size // 2, end - offset))
+            self._page = ResumablePage(self._fetch_page, self._sizer, offset, part_size).fetch()
+            for item in self._page.with_raw():
+                self.count = self.count + 1
+                yield item
+            if self._page.count < part_size:
+                return
+            offset = offset + part_size
+
+    def __iter__(self):
+        for item, _ in self.with_raw():
+            yield item
+
+    def with_raw(self):
+        max_tries = int(CONFIG.get('max_tries') or 5)
+        for tries, delay in zip(range(1, max_tries + 1), retry_wait()):
+            if self._page is None:
+                yield from self._split()
+                return
+            try:
+                for index, item in enumerate(self._page.with_raw()):
+                    if index >= self.count:
+                        self.count = self.count + 1
+                        yield item
+                return
+            except requests.exceptions.RequestException as exception:
+                if self._splits(exception):
+                    yield from self._split()
+                    return
+                if tries == max_tries:
+                    raise
+                LOGGER.warning('Page of {} records at offset {} failed after {} records ({}), ' \
+                    'requesting it again.'.format(self._size, self._offset, self.count, exception))
+            time.sleep(backoff.full_jitter(delay))
+            self.fetch()
+
+
+def observe_page(sizer, size, page):
+    # called once the page has been read, on the thread that read it
+    if page.streamed:
+        exchange = TRANSPORT.last_exchange()
+        sizer.observe(size, exchange['latency'], exchange['bytes'])
+
+
+def iter_pages(fetch_page, sizer, prefetch=1, start=0):
+    # the first page tells us totalElements; the rest of the window is planned as
+    # (offset, size) requests, fetched `prefetch` at a time and yielded in order
+    size = sizer.next_size(start)
+    first = fetch_page_chunk(fetch_page, sizer, start, size)
+    yield start, size, first
+    observe_page(sizer, size, first)
+    total_elements = int(first.page.get('totalElements', 0))
+    def plan():
+        offset = start + size
+        while offset < total_elements:
+            chunk_size = sizer.next_size(offset)
+            yield offset, chunk_size
+            offset = offset + chunk_size
+    def fetch(chunk):
+        offset, chunk_size = chunk
+        return offset, chunk_size, fetch_page_chunk(fetch_page, sizer, offset, chunk_size)
+    for offset, chunk_size, page in ordered_map(fetch, plan(), workers=prefetch, \
+            window=prefetch):
+        yield offset, chunk_size, page
+        observe_page(sizer, chunk_size, page)
+
+
+def decoded_pages(stream, pages):
+    # the decode stage: each page's body is read and decoded on a thread of its
+    # own and handed over in batches of DECODE_BATCH_SIZE records, up to
+    # pipeline_depth batches ahead of the thread writing them, so however
+    # large the pages only that many records are held between the two
+    def decode(pages):
+        for offset, size, page in pages:
+            batch = []
+            for item in page.with_raw():
+                batch.append(item)
+                if len(batch) == DECODE_BATCH_SIZE:
+                    yield offset, size, page, batch
+                    batch = []
+            # a page's last batch, empty or not, tells the writer it is done
+            yield offset, size, page, batch
+    batches = staged(decode(pages), int(CONFIG.get('pipeline_depth', DEFAULT_DECODE_DEPTH)), \
+        PIPELINE, 'decode ' + stream, 'flatten ' + stream)
+    for (offset, size, page), group in itertools.groupby(batches, key=lambda item: item[:3]):
+        yield offset, size, DecodedPage(page, (batch for _, _, _, batch in group))
+
+
+class DecodedPage:
+    """A page on the writing thread, as decoded_pages hands it over.
+
+    with_raw() yields its records as their batches come in from the decode
+    stage; count and page are the page's own, once they have all been read.
+    """
+
+    def __init__(self, page, batches):
+        self._page = page
+        self._batches = batches
+
+    def with_raw(self):
+        for batch in self._batches:
+            yield from batch
+
+    @property
+    def count(self):
+        return self._page.count
+
+    @property
+    def page(self):
+        return self._page.page
+
+
+def log_page(offset, size, count, page_json):
+    total_elements = int(page_json.get('totalElements', 0))
+    total_pages = (total_elements + size - 1) // size
+    LOGGER.info('Page {} of {} Total Pages, Record {}-{} of {} Total Records'.format( \
+        str(offset // size + 1), str(total_pages), str(offset + 1), str(offset + count), \
+        str(total_elements)))
@@ -0,0 +1,45 @@
+import collections
+import contextvars
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+def ordered_map(func, items, workers=1, window=None):
+    """Apply func to items on a thread pool and yield the results in input order.
+
+    Items are pulled lazily from the iterable in the calling thread, and at
+    most `window` calls are in flight at once, so the caller can keep paging
+    (and writing records) while the workers fetch. Exceptions raised by func
+    are re-raised when their result is reached.
+    """
+    workers = max(1, int(workers))
+    window = max(1, int(window or workers))
+    iterator = iter(items)
+    pending = collections.deque()
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            while True:
+                while not exhausted and len(pending) < window:
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.append(executor.submit(contextvars.copy_context().run, func, item))
+                if not pending:
+                    return
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def put_page(pages, item, stop):
+    # hand a worker's page to the writer thread, unless it has stopped waiting
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=1)
+            return
+        except queue.Full:
+            continue
@@ -0,0 +1,101 @@
+# What the hotels and reviews syncs share within a run: the config and state,
+# the streams and the columns selected of them, and the objects every request
+# and record goes through. CONFIG, STATE and the Scoped objects are each
+# account's own in a multi-account run (see accounts.py).
+
+import time
+import tap_revinate.fields as fields
+from tap_revinate.accounts import ACCOUNT, Accounts, Scoped, ScopedDict
+from tap_revinate.auth import Signer
+from tap_revinate.cache import ResponseCache
+from tap_revinate.dedup import BoundaryDedup
+from tap_revinate.fingerprints import ChangeDetector
+from tap_revinate.flatten import Flattener
+from tap_revinate.instrumentation import Instrumentation
+from tap_revinate.pipeline import PipelineStats
+from tap_revinate.throttle import RateLimiter
+from tap_revinate.transport import Transport
+from tap_revinate.writer import MessageWriter
+
+CONFIG = ScopedDict('CONFIG', {
+    'username': None,
+    'api_key': None,
+    'api_secret': None,
+    'start_date': None
+})
+STATE = ScopedDict('STATE', {})
+KEY_PROPERTIES = {
+    'hotels': ['hotel_id'],
+    'reviews': ['review_id'],
+    'hotel_reviews_snapshot': ['hotel_id', 'snapshot_start_date'],
+    'hotel_reviews_snapshot_by_site': ['hotel_id', 'review_site_id', 'snapshot_start_date'],
+    'hotel_reviews_snapshot_by_time': ['hotel_id', 'unix_time'],
+    'review_sites': ['review_site_id'],
+    'languages': ['language_id']
+}
+# streams re-read in full every run, where emit_changes_only can skip records
+HOTEL_STREAMS = ['hotels', 'hotel_reviews_snapshot', 'hotel_reviews_snapshot_by_site',
+                 'hotel_reviews_snapshot_by_time']
+SNAPSHOT_STREAMS = HOTEL_STREAMS[1:]
+# review sites and languages, written the first time a run comes across them;
+# emit_changes_only skips them too
+DIMENSION_STREAMS = list(fields.INTERNED.values())
+# streams written while syncing /reviews: review sites and languages are
+# written as they are first seen in the reviews (and snapshots by site)
+REVIEW_STREAMS = ['reviews', 'review_sites', 'languages']
+# streams whose records belong to one account, tagged with it in a
+# multi-account run
+ACCOUNT_STREAMS = [stream for stream in KEY_PROPERTIES if stream not in DIMENSION_STREAMS]
+# the review site and language columns of reviews and snapshots by site that
+# dimension_ids_only leaves out
+DIMENSION_COLUMNS = [column for stream in DIMENSION_STREAMS \
+    for column, _ in fields.STREAMS[stream] if column not in KEY_PROPERTIES[stream]]
+# snapshot columns the by_site and by_time records are built from
+SNAPSHOT_CONTEXT = ['hotel_reviews_snapshot_url', 'snapshot_start_date', 'snapshot_end_date']
+TRANSPORT = Transport()
+SIGNER = Scoped('SIGNER', Signer())
+METRICS = Instrumentation()
+TRANSPORT.on_response = METRICS.observe_bytes
+LIMITER = Scoped('LIMITER', RateLimiter())
+CACHE = ResponseCache()
+CHANGES = Scoped('CHANGES', ChangeDetector({stream: KEY_PROPERTIES[stream] \
+    for stream in HOTEL_STREAMS + DIMENSION_STREAMS}, accumulated=DIMENSION_STREAMS))
+DEDUP = Scoped('DEDUP', BoundaryDedup())
+ACCOUNTS = Accounts()
+WRITER = MessageWriter()
+PIPELINE = PipelineStats()
+FLATTENERS = {stream: Flattener(spec) for stream, spec in fields.STREAMS.items()}
+FLATTENERS['snapshot_context'] = Flattener(fields.hotel_reviews_snapshot, columns=SNAPSHOT_CONTEXT)
+FLATTENERS['by_time_key'] = Flattener(fields.hotel_reviews_snapshot_by_time, \
+    columns=KEY_PROPERTIES['hotel_reviews_snapshot_by_time'])
+# {stream: columns to emit, or None for all} for the streams being synced
+SELECTED = {stream: None for stream in KEY_PROPERTIES}
+
+
+def emit_record(stream, parse, *args):
+    # parse and write one record, timing both for the run summary
+    start = time.perf_counter()
+    record = parse(*args)
+    account = ACCOUNT.get()
+    if account is not None and stream in ACCOUNT_STREAMS:
+        record['account'] = account.name
+    # deselected streams are still parsed when other streams need their keys
+    if stream not in SELECTED or not CHANGES.changed(stream, record):
+        METRICS.add_time(stream, 'parse', time.perf_counter() - start)
+        return record
+    parsed = time.perf_counter()
+    WRITER.write_record(stream, record)
+    METRICS.count_record(stream, parsed - start, time.perf_counter() - parsed)
+    return record
+
+
+def emit_dimension(stream, record):
+    # a review site or language, written the first time the run comes across it
+    columns = SELECTED.get(stream)
+    emit_record(stream, lambda: record if columns is None else \
+        {column: record[column] for column in columns if column in record})
+
+
+def write_state(state):
+    # in a multi-account run the STATE message carries every account's state
+    WRITER.write_state(ACCOUNTS.state_message(state))
@@ -0,0 +1,184 @@
+import hashlib
+import math
+import re
+import singer
+from tap_revinate.fields import REVIEW_ID
+
+LOGGER = singer.get_logger()
+FILTERS = ('exact', 'bloom', 'off')
+DEFAULT_CAPACITY = 1000000
+DEFAULT_ERROR_RATE = 1e-6
+# past this many reviews at one second, their ids are not kept in the state
+DEFAULT_MAX_STATE_IDS = 10000
+REVIEW_ID_PATTERN = re.compile(REVIEW_ID)
+
+
+def review_id_of(review):
+    # the id in a raw review's self link, as the review_id column has it
+    for link in review.get('links') or ():
+        if link.get('rel') == 'self':
+            match = REVIEW_ID_PATTERN.search(link.get('href') or '')
+            return int(match.group(1)) if match else None
+    return None
+
+
+class BloomFilter:
+    """A fixed-size set of keys that may answer `in` wrongly, never `not in`.
+
+    Sized for `capacity` keys at a false positive rate of `error_rate`: about
+    3.6MB for a million keys at one in a million. Past capacity the rate
+    climbs, but memory does not.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        capacity = max(1, int(capacity))
+        error_rate = min(max(float(error_rate), 1e-12), 0.5)
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # double hashing: h1 + i * h2 over one blake2b digest
+        packed = hashlib.blake2b(str(key).encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(packed[:8], 'little')
+        second = int.from_bytes(packed[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) \
+            for position in self._positions(key))
+
+
+class BoundaryDedup:
+    """Drops the reviews at the bookmark second that were already emitted.
+
+    The updatedAt range a run asks for starts at the last run's last_update,
+    inclusive, so the reviews at that second come back every run, and a
+    sharded run starting there hands them to whichever shard covers it.
+    start() takes the ids emitted at last_update from the state
+    (`last_update_review_ids`); duplicate() is then True for a review at
+    that second that was already emitted. Only reviews at that second are
+    remembered, and with the 'bloom' filter in a BloomFilter of fixed size
+    rather than a set, so memory stays bounded on a backfill with huge
+    numbers of reviews at one second, at the price of dropping a new one
+    about once in 1 / error_rate. 'off' emits every review as Porter
+    returns it. Reviews are checked on the thread writing them.
+
+    save() puts the ids emitted at the new last_update into the state,
+    unless there are more than max_state_ids of them.
+    """
+
+    def __init__(self, mode='exact', capacity=DEFAULT_CAPACITY,
+                 error_rate=DEFAULT_ERROR_RATE, max_state_ids=DEFAULT_MAX_STATE_IDS):
+        self._options = {}
+        self._seen = {}
+        self._filter = None
+        self._tail = [None, []]
+        self._stats = {'duplicates': 0}
+        self.configure(mode, capacity, error_rate, max_state_ids)
+
+    def configure(self, mode='exact', capacity=DEFAULT_CAPACITY,
+                  error_rate=DEFAULT_ERROR_RATE, max_state_ids=DEFAULT_MAX_STATE_IDS):
+        mode = mode or 'exact'
+        if mode not in FILTERS:
+            raise ValueError('dedup_filter must be one of {}, not {!r}'.format(
+                ', '.join(FILTERS), mode))
+        self._options = {'mode': mode, 'capacity': capacity or DEFAULT_CAPACITY,
+                         'error_rate': error_rate or DEFAULT_ERROR_RATE,
+                         'max_state_ids': int(max_state_ids or DEFAULT_MAX_STATE_IDS)}
+
+    @property
+    def options(self):
+        # the keyword arguments for a BoundaryDedup configured like this one
+        return dict(self._options)
+
+    @property
+    def enabled(self):
+        return self._options['mode'] != 'off'
+
+    def start(self, state):
+        self._seen = {}
+        self._filter = BloomFilter(self._options['capacity'], self._options['error_rate']) \
+            if self._options['mode'] == 'bloom' else None
+        self._tail = [None, []]
+        self._stats = {'duplicates': 0}
+        if 'last_update' not in state:
+            return
+        bookmark = int(state['last_update'])
+        self._seen[bookmark] = set()
+        for review_id in state.get('last_update_review_ids') or ():
+            self._remember(bookmark, review_id)
+
+    def _remember(self, second, review_id):
+        ids = self._seen[second]
+        if self._filter is not None:
+            self._filter.add((second, review_id))
+            # the exact ids are only kept for the state, and only up to a point
+            if ids is not None and len(ids) >= self._options['max_state_ids']:
+                self._seen[second] = None
+                return
+        if ids is not None:
+            ids.add(review_id)
+
+    def _known(self, second, review_id):
+        if self._filter is not None:
+            return (second, review_id) in self._filter
+        return review_id in self._seen[second]
+
+    def duplicate(self, review):
+        if not self.enabled:
+            return False
+        updated_at = review['updatedAt']
+        if updated_at in self._seen:
+            review_id = review_id_of(review)
+            if self._known(updated_at, review_id):
+                self._stats['duplicates'] += 1
+                return True
+            self._remember(updated_at, review_id)
+        else:
+            self._track(updated_at, review)
+        return False
+
+    def _track(self, updated_at, review):
+        # the reviews at the latest second so far, the next last_update when
+        # they come in updatedAt order; their ids are only read if saved
+        if updated_at != self._tail[0]:
+            self._tail = [updated_at, []]
+        reviews = self._tail[1]
+        if reviews is not None:
+            reviews.append(review)
+            if len(reviews) > self._options['max_state_ids']:
+                self._tail[1] = None
+
+    def ids_at(self, second):
+        # the exact ids emitted at that second, or None if not known
+        if second == self._tail[0]:
+            reviews = self._tail[1]
+            return None if reviews is None else {review_id_of(review) for review in reviews}
+        ids = self._seen.get(second)
+        if ids is not None and len(ids) > self._options['max_state_ids']:
+            return None
+        return ids
+
+    def save(self, state, last_update):
+        ids = self.ids_at(last_update) if self.enabled else None
+        if ids:
+            state['last_update_review_ids'] = sorted(ids)
+        else:
+            state.pop('last_update_review_ids', None)
+
+    def add_stats(self, other):
+        # count another BoundaryDedup's duplicates in with this one's
+        self._stats['duplicates'] += other.stats()['duplicates']
+
+    def stats(self):
+        return dict(self._stats)
+
+    def log_stats(self):
+        if self.enabled:
+            LOGGER.info('Dedup: skipped {} reviews already emitted at the bookmark.'.format(
+                self._stats['duplicates']))
@@ -0,0 +1,16 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(value):
+    """Compact JSON text for value, using orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode('utf-8') # pylint: disable=no-member
+        except TypeError:
+            pass
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
@@ -0,0 +1,193 @@
+# Where each column of schemas.py comes from in the Porter API payloads.
+#
+# Every entry is (column, source), in the order the columns are emitted:
+#   {'path': (...), 'type': t}          value at that key path, cast to t
+#   {'repr': (...)}                     str() of the object at that path ('{}' if missing)
+#   {'link': rel, 'in': (...), 'type': t, 'match': regex, 'group': n}
+#                                       href of the link with that rel in the `links` of the
+#                                       object at 'in' (the record itself by default),
+#                                       optionally reduced to a regex group
+#   {'context': name, 'type': t}        a value passed in by the caller, e.g. the hotel_id
+# Types are the JSON schema types, plus 'text' for free text that is stripped of
+# newlines and has its double quotes escaped.
+
+REVIEW_ID = r'.*/reviews/(.*)'
+HOTEL_ID = r'.*/hotels/(.*)'
+REVIEW_SITE_ID = r'.*/reviewsites/(.*)'
+LANGUAGE_ID = r'.*/languages/(.*)'
+SNAPSHOT_DATES = r'^.*\?date\=(\d+)\.\.(\d+)$'
+
+hotels = [
+    ('hotel_id', {'link': 'self', 'type': 'integer', 'match': HOTEL_ID}),
+    ('hotel_url', {'link': 'self', 'type': 'string'}),
+    ('hotel_reviews_snapshot_url', {'link': 'reviewssnapshot', 'type': 'string'}),
+    ('hotel_json', {'repr': ()}),
+    ('name', {'path': ('name',), 'type': 'string'}),
+    ('slug', {'path': ('slug',), 'type': 'string'}),
+    ('logo', {'path': ('logo',), 'type': 'string'}),
+    ('url', {'path': ('url',), 'type': 'string'}),
+    ('address1', {'path': ('address1',), 'type': 'string'}),
+    ('address2', {'path': ('address2',), 'type': 'string'}),
+    ('city', {'path': ('city',), 'type': 'string'}),
+    ('state', {'path': ('state',), 'type': 'string'}),
+    ('postal_code', {'path': ('postalCode',), 'type': 'string'}),
+    ('country', {'path': ('country',), 'type': 'string'}),
+    ('trip_advisor_id', {'path': ('tripAdvisorId',), 'type': 'integer'}),
+    ('revinate_purchase_uri', {'path': ('revinatePurchaseUri',), 'type': 'string'}),
+    ('revinate_login_uri', {'path': ('revinateLoginUri',), 'type': 'string'}),
+    # historically filled from revinatePurchaseUri; kept as is for existing targets
+    ('account_type', {'path': ('revinatePurchaseUri',), 'type': 'string'}),
+    ('links_json', {'repr': ('links',)})
+]
+
+hotel_reviews_snapshot = [
+    ('hotel_id', {'context': 'hotel_id', 'type': 'integer'}),
+    ('hotel_reviews_snapshot_url', {'link': 'self', 'type': 'string'}),
+    ('hotel_reviews_snapshot_json', {'repr': ()}),
+    ('snapshot_start_date', {'link': 'self', 'type': 'integer', 'match': SNAPSHOT_DATES,
+                             'group': 1}),
+    ('snapshot_end_date', {'link': 'self', 'type': 'integer', 'match': SNAPSHOT_DATES,
+                           'group': 2}),
+    ('aggregate_values_json', {'repr': ('aggregateValues',)}),
+    ('aggregate_average_rating', {'path': ('aggregateValues', 'averageRating'),
+                                  'type': 'number'}),
+    ('aggregate_new_reviews', {'path': ('aggregateValues', 'newReviews'), 'type': 'number'}),
+    ('aggregate_pos_reviews_pct', {'path': ('aggregateValues', 'posReviewsPct'),
+                                   'type': 'number'}),
+    ('aggregate_trip_advisor_market_ranking', {'path': ('aggregateValues',
+                                                        'tripadvisorMarketRanking'),
+                                               'type': 'integer'}),
+    ('aggregate_trip_advisor_market_ranking_pctl', {'path': ('aggregateValues',
+                                                             'tripadvisorMarketRankingPctl'),
+                                                    'type': 'number'}),
+    ('aggregate_trip_advisor_market_size', {'path': ('aggregateValues',
+                                                     'tripadvisorMarketSize'),
+                                            'type': 'integer'}),
+    ('values_by_review_site_json', {'repr': ('valuesByReviewSite',)}),
+    ('values_by_time_json', {'repr': ('valuesByTime',)}),
+    ('links_json', {'repr': ('links',)})
+]
+
+hotel_reviews_snapshot_by_site = [
+    ('hotel_id', {'context': 'hotel_id', 'type': 'integer'}),
+    ('hotel_reviews_snapshot_url', {'context': 'hotel_reviews_snapshot_url', 'type': 'string'}),
+    ('site_json', {'repr': ()}),
+    ('snapshot_start_date', {'context': 'snapshot_start_date', 'type': 'integer'}),
+    ('snapshot_end_date', {'context': 'snapshot_end_date', 'type': 'integer'}),
+    ('review_site_json', {'repr': ('reviewSite',)}),
+    ('review_site_id', {'link': 'self', 'in': ('reviewSite',), 'type': 'integer',
+                        'match': REVIEW_SITE_ID}),
+    ('review_site_url', {'link': 'self', 'in': ('reviewSite',), 'type': 'string'}),
+    ('review_site_name', {'path': ('reviewSite', 'name'), 'type': 'string'}),
+    ('review_site_main_url', {'path': ('reviewSite', 'mainUrl'), 'type': 'string'}),
+    ('review_site_slug', {'path': ('reviewSite', 'slug'), 'type': 'string'}),
+    ('values_json', {'repr': ('values',)}),
+    ('site_average_rating', {'path': ('values', 'averageRating'), 'type': 'number'}),
+    ('site_new_reviews', {'path': ('values', 'newReviews'), 'type': 'number'}),
+    ('site_pos_reviews_pct', {'path': ('values', 'posReviewsPct'), 'type': 'number'}),
+    ('site_trip_advisor_market_ranking', {'path': ('values', 'tripadvisorMarketRanking'),
+                                          'type': 'integer'}),
+    ('site_trip_advisor_market_ranking_pctl', {'path': ('values',
+                                                        'tripadvisorMarketRankingPctl'),
+                                               'type': 'number'}),
+    ('site_trip_advisor_market_size', {'path': ('values', 'tripadvisorMarketSize'),
+                                       'type': 'integer'})
+]
+
+hotel_reviews_snapshot_by_time = [
+    ('hotel_id', {'context': 'hotel_id', 'type': 'integer'}),
+    ('hotel_reviews_snapshot_url', {'context': 'hotel_reviews_snapshot_url', 'type': 'string'}),
+    ('time_period_json', {'repr': ()}),
+    ('unix_time', {'path': ('time',), 'type': 'integer'}),
+    ('values_json', {'repr': ('values',)}),
+    ('snapshot_average_rating', {'path': ('values', 'averageRating'), 'type': 'number'}),
+    ('snapshot_new_reviews', {'path': ('values', 'newReviews'), 'type': 'number'}),
+    ('snapshot_pos_reviews_pct', {'path': ('values', 'posReviewsPct'), 'type': 'number'}),
+    ('snapshot_trip_advisor_market_ranking', {'path': ('values', 'tripadvisorMarketRanking'),
+                                              'type': 'integer'}),
+    ('snapshot_trip_advisor_market_ranking_pctl', {'path': ('values',
+                                                            'tripadvisorMarketRankingPctl'),
+                                                   'type': 'number'}),
+    ('snapshot_trip_advisor_market_size', {'path': ('values', 'tripadvisorMarketSize'),
+                                           'type': 'integer'})
+]
+
+reviews = [
+    ('review_id', {'link': 'self', 'type': 'integer', 'match': REVIEW_ID}),
+    ('review_url', {'link': 'self', 'type': 'string'}),
+    ('review_json', {'repr': ()}),
+    ('hotel_id', {'link': 'hotel', 'type': 'integer', 'match': HOTEL_ID}),
+    ('hotel_url', {'link': 'hotel', 'type': 'string'}),
+    ('title', {'path': ('title',), 'type': 'text'}),
+    ('body', {'path': ('body',), 'type': 'text'}),
+    ('author', {'path': ('author',), 'type': 'string'}),
+    ('author_location', {'path': ('authorLocation',), 'type': 'string'}),
+    ('date_review', {'path': ('dateReview',), 'type': 'integer'}),
+    ('date_collected', {'path': ('dateCollected',), 'type': 'integer'}),
+    ('updated_at', {'path': ('updatedAt',), 'type': 'integer'}),
+    ('rating', {'path': ('rating',), 'type': 'number'}),
+    ('nps', {'path': ('nps',), 'type': 'integer'}),
+    ('review_site_json', {'repr': ('reviewSite',)}),
+    ('review_site_id', {'link': 'self', 'in': ('reviewSite',), 'type': 'integer',
+                        'match': REVIEW_SITE_ID}),
+    ('review_site_url', {'link': 'self', 'in': ('reviewSite',), 'type': 'string'}),
+    ('review_site_name', {'path': ('reviewSite', 'name'), 'type': 'string'}),
+    ('review_site_main_url', {'path': ('reviewSite', 'mainUrl'), 'type': 'string'}),
+    ('review_site_slug', {'path': ('reviewSite', 'slug'), 'type': 'string'}),
+    ('language_json', {'repr': ('language',)}),
+    ('language_id', {'link': 'self', 'in': ('language',), 'type': 'integer',
+                     'match': LANGUAGE_ID}),
+    ('language_url', {'link': 'self', 'in': ('language',), 'type': 'string'}),
+    ('language_name', {'path': ('language', 'name'), 'type': 'string'}),
+    ('language_english_name', {'path': ('language', 'englishName'), 'type': 'string'}),
+    ('language_slug', {'path': ('language', 'slug'), 'type': 'string'}),
+    ('crawled_url', {'path': ('crawledUrl',), 'type': 'string'}),
+    ('subratings_json', {'repr': ('subratings',)}),
+    ('subratings_cleanliness', {'path': ('subratings', 'Cleanliness'), 'type': 'number'}),
+    ('subratings_hotel_condition', {'path': ('subratings', 'Hotel condition'),
+                                    'type': 'number'}),
+    ('subratings_rooms', {'path': ('subratings', 'Rooms'), 'type': 'number'}),
+    ('subratings_service', {'path': ('subratings', 'Service'), 'type': 'number'}),
+    ('trip_type', {'path': ('tripType',), 'type': 'string'}),
+    ('guest_stay_json', {'repr': ('guestStay',)}),
+    ('survey_topics_json', {'repr': ('surveyTopics',)}),
+    ('response_json', {'repr': ('response',)}),
+    ('links_json', {'repr': ('links',)})
+]
+
+# Review sites and languages, as nested in reviews and snapshots by site. Their
+# columns are named as they are in those records.
+review_sites = [
+    ('review_site_id', {'link': 'self', 'type': 'integer', 'match': REVIEW_SITE_ID}),
+    ('review_site_url', {'link': 'self', 'type': 'string'}),
+    ('review_site_json', {'repr': ()}),
+    ('review_site_name', {'path': ('name',), 'type': 'string'}),
+    ('review_site_main_url', {'path': ('mainUrl',), 'type': 'string'}),
+    ('review_site_slug', {'path': ('slug',), 'type': 'string'})
+]
+
+languages = [
+    ('language_id', {'link': 'self', 'type': 'integer', 'match': LANGUAGE_ID}),
+    ('language_url', {'link': 'self', 'type': 'string'}),
+    ('language_json', {'repr': ()}),
+    ('language_name', {'path': ('name',), 'type': 'string'}),
+    ('language_english_name', {'path': ('englishName',), 'type': 'string'}),
+    ('language_slug', {'path': ('slug',), 'type': 'string'})
+]
+
+# nested object key -> the stream of the objects found there, which are
+# flattened once per run each (see flatten.Interned)
+INTERNED = {
+    'reviewSite': 'review_sites',
+    'language': 'languages'
+}
+
+STREAMS = {
+    'hotels': hotels,
+    'hotel_reviews_snapshot': hotel_reviews_snapshot,
+    'hotel_reviews_snapshot_by_site': hotel_reviews_snapshot_by_site,
+    'hotel_reviews_snapshot_by_time': hotel_reviews_snapshot_by_time,
+    'reviews': reviews,
+    'review_sites': review_sites,
+    'languages': languages
+}
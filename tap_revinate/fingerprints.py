@@ -0,0 +1,106 @@
+import base64
+import hashlib
+import singer
+from tap_revinate.encoding import dumps
+
+LOGGER = singer.get_logger()
+DIGEST_SIZE = 8
+# bumped if the encoding or the digests change, so old state is ignored
+# rather than misread (everything is emitted once)
+VERSION = '1'
+
+
+def digest(value):
+    return hashlib.blake2b(dumps(value).encode('utf-8'), digest_size=DIGEST_SIZE).digest()
+
+
+def encode(fingerprints):
+    # {key digest: record digest} -> one base64 string of the sorted pairs,
+    # 2 * DIGEST_SIZE bytes each before base64
+    packed = b''.join(key + value for key, value in sorted(fingerprints.items()))
+    return VERSION + ':' + base64.b64encode(packed).decode('ascii')
+
+
+def decode(text):
+    version, _, data = (text or '').partition(':')
+    if version != VERSION:
+        return {}
+    packed = base64.b64decode(data)
+    size = 2 * DIGEST_SIZE
+    return {packed[i:i + DIGEST_SIZE]: packed[i + DIGEST_SIZE:i + size]
+            for i in range(0, len(packed), size)}
+
+
+class ChangeDetector:
+    """Remembers a digest of every record emitted, per key, across runs.
+
+    When enabled, changed() is False for records of a tracked stream whose
+    key_properties were emitted with exactly the same content by an earlier
+    run, so they can be skipped. The digests live in the state under
+    `fingerprints`, one compact string per stream (about 22 characters per
+    record). save() replaces a stream's digests with those seen (or kept)
+    this run, so keys that no longer come back from Porter drop out of the
+    state, except for the `accumulated` streams: their records only turn up
+    when something refers to them, so their digests are kept until the record
+    changes.
+    """
+
+    def __init__(self, key_properties, enabled=False, state=None, accumulated=()):
+        self.key_properties = key_properties
+        self.accumulated = frozenset(accumulated)
+        self.enabled = False
+        self._previous = {}
+        self._current = {}
+        self._stats = {}
+        self.configure(enabled, state)
+
+    def configure(self, enabled=False, state=None):
+        self.enabled = bool(enabled)
+        self._previous = {stream: decode(text) for stream, text in \
+            (state or {}).get('fingerprints', {}).items()}
+        self._current = {stream: {} for stream in self.key_properties}
+        self._stats = {stream: {'new': 0, 'changed': 0, 'unchanged': 0} \
+            for stream in self.key_properties}
+
+    def changed(self, stream, record):
+        # False only for a tracked record identical to the one last emitted
+        if not self.enabled or stream not in self.key_properties:
+            return True
+        key = digest([record.get(prop) for prop in self.key_properties[stream]])
+        value = digest(record)
+        self._current[stream][key] = value
+        previous = self._previous.get(stream, {}).get(key)
+        if previous == value:
+            self._stats[stream]['unchanged'] += 1
+            return False
+        self._stats[stream]['new' if previous is None else 'changed'] += 1
+        return True
+
+    def keep(self, stream, record):
+        # a tracked record deliberately not read again this run (only its key
+        # properties are needed): its digest carries over as it was
+        if not self.enabled or stream not in self.key_properties:
+            return
+        key = digest([record.get(prop) for prop in self.key_properties[stream]])
+        previous = self._previous.get(stream, {}).get(key)
+        if previous is not None:
+            self._current[stream][key] = previous
+
+    def save(self, state, streams=None):
+        # the digests of `streams` (default: every tracked stream) into state
+        fingerprints = state.setdefault('fingerprints', {})
+        for stream in self.key_properties if streams is None else streams:
+            current = self._current[stream]
+            if stream in self.accumulated:
+                current = dict(self._previous.get(stream, {}))
+                current.update(self._current[stream])
+            fingerprints[stream] = encode(current)
+            self._previous[stream] = current
+            self._current[stream] = {}
+
+    def log_stats(self, streams=None):
+        for stream, stats in sorted(self._stats.items()):
+            if any(stats.values()) and (streams is None or stream in streams):
+                LOGGER.info('Change detection for {}: {} new, {} changed, {} unchanged and '
+                            'skipped.'.format(stream, stats['new'], stats['changed'],
+                                              stats['unchanged']))
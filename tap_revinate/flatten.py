@@ -0,0 +1,192 @@
+import re
+import threading
+from tap_revinate.encoding import dumps
+
+DEFAULTS = {
+    'integer': 0,
+    'number': 0.0,
+    'string': '',
+    'text': ''
+}
+def clean_text(value):
+    return str(value).replace('"', '\\"').replace('\r', '').replace('\n', '')
+
+
+CASTS = {
+    'integer': int,
+    'number': float,
+    'string': str,
+    'text': clean_text
+}
+
+
+JSON_COLUMN_MODES = ('repr', 'json', 'object', 'drop')
+
+
+def _nested_key(source):
+    # the key of the nested object a column is read from, if it is one
+    if 'path' in source:
+        path = tuple(source['path'])
+    else:
+        path = tuple(source.get('repr', source.get('in', ())))
+    return path[0] if path and (len(path) > 1 or 'path' not in source) else None
+
+
+class Flattener: # pylint: disable=too-few-public-methods
+    """Turns one Porter API object into a flat record, following a field spec.
+
+    The spec (see fields.py) is compiled once into a getter per column:
+    regexes are precompiled, and each nested object and each `links` array a
+    record needs is looked up, or indexed by rel, a single time per record
+    however many columns read it (the record's `shared` values, worked out
+    before the columns). Passing `columns` builds a flattener that only
+    extracts those columns.
+
+    json_columns sets how the *_json columns are produced: 'repr' (Python
+    repr strings, the historical output), 'json' (JSON strings; the whole
+    record reuses the response text passed as context['raw_json'] when
+    there is one), 'object' (the nested objects themselves) or 'drop'.
+
+    interned maps nested object keys to Interned caches: the columns of the
+    objects under such a key are then read from the cache rather than
+    extracted from each record.
+    """
+
+    def __init__(self, spec, columns=None, json_columns='repr', interned=None):
+        if json_columns not in JSON_COLUMN_MODES:
+            raise ValueError('json_columns must be one of {}, got {!r}'.format( \
+                ', '.join(JSON_COLUMN_MODES), json_columns))
+        self.json_columns = json_columns
+        self.columns = [column for column, source in spec
+                        if (columns is None or column in columns)
+                        and not ('repr' in source and json_columns == 'drop')]
+        # functions of (record, shared) giving each shared value, in order, and
+        # the index in shared of each one by what it is
+        self._shared = []
+        self._indexes = {}
+        self._getters = [(column, self._value(column, source, interned or {})) \
+            for column, source in spec if column in self.columns]
+
+    def __call__(self, record, context=None):
+        shared = []
+        for value in self._shared:
+            shared.append(value(record, shared))
+        return {column: getter(record, context, shared) for column, getter in self._getters}
+
+    def _share(self, key, value):
+        # the index of a value worked out once per record
+        if key not in self._indexes:
+            self._indexes[key] = len(self._shared)
+            self._shared.append(value)
+        return self._indexes[key]
+
+    def _value(self, column, source, interned):
+        # the column off an interned object when there is one for its key
+        key = _nested_key(source)
+        if key in interned and column in interned[key].columns:
+            of = interned[key]
+            index = self._share(('interned', key), lambda record, shared: of(record.get(key)))
+            return lambda record, context, shared: shared[index][column]
+        return self._getter(source)
+
+    def _links(self, container):
+        # the `links` array of a (nested) object, indexed by rel once per record
+        def links(record, _shared):
+            obj = record
+            for key in container:
+                obj = obj.get(key) or {}
+            return {link['rel']: link['href'] for link in obj.get('links') or ()}
+        return self._share(('links', container), links)
+
+    def _getter(self, source): # pylint: disable=too-many-return-statements
+        field_type = source.get('type', 'string')
+        cast = CASTS[field_type]
+        default = DEFAULTS[field_type]
+        if 'repr' in source:
+            return self._json_getter(tuple(source['repr']))
+        if 'context' in source:
+            name = source['context']
+            return lambda record, context, shared: cast(context[name])
+        if 'link' in source:
+            links = self._links(tuple(source.get('in', ())))
+            rel = source['link']
+            if not source.get('match'):
+                return lambda record, context, shared: cast(shared[links].get(rel, default))
+            search = re.compile(source['match']).search
+            group = source.get('group', 1)
+            match = self._share(('match', links, rel, source['match']), \
+                lambda record, shared: search(shared[links].get(rel, '')))
+            def matched(_record, _context, shared):
+                found = shared[match]
+                return cast(found.group(group)) if found else default
+            return matched
+        path = tuple(source['path'])
+        if len(path) == 1:
+            key = path[0]
+            return lambda record, context, shared: cast(record.get(key, default))
+        key, inner = path[:2]
+        nested = self._share(('nested', key), lambda record, shared: record.get(key, {}))
+        return lambda record, context, shared: cast(shared[nested].get(inner, default))
+
+    def _json_getter(self, path):
+        key = path[0] if path else None
+        if self.json_columns == 'object':
+            if key is None:
+                return lambda record, context, shared: record
+            return lambda record, context, shared: record.get(key)
+        encode = dumps if self.json_columns == 'json' else str
+        if key is None:
+            if self.json_columns == 'json':
+                return lambda record, context, shared: \
+                    (context or {}).get('raw_json') or dumps(record)
+            return lambda record, context, shared: str(record)
+        return lambda record, context, shared: encode(record[key]) if key in record else '{}'
+
+
+class Interned:
+    """Flattens nested objects that many records share once per run each.
+
+    Every review carries its review site and language in full, but there are
+    only a few dozen of either. A Flattener given an Interned for their key
+    reads those columns from it instead: each distinct object, told apart by
+    its self link, is flattened the first time it is seen and kept, and
+    on_new is called with the flat object. Objects without a self link are
+    flattened every time. Safe to share between threads.
+    """
+
+    def __init__(self, spec, json_columns='repr', on_new=None):
+        self._flattener = Flattener(spec, json_columns=json_columns)
+        self.columns = self._flattener.columns
+        self.on_new = on_new
+        self._cache = {}
+        self._lock = threading.Lock()
+        # the columns of records without the object, as extracting them would
+        # leave them
+        self._missing = self._flattener({})
+        if json_columns == 'object':
+            self._missing.update({column: None for column, source in spec \
+                if 'repr' in source and column in self._missing})
+
+    def __call__(self, obj):
+        if obj is None:
+            return self._missing
+        key = None
+        for link in obj.get('links') or ():
+            if link['rel'] == 'self':
+                key = link['href']
+                break
+        flat = self._cache.get(key)
+        if flat is not None:
+            return flat
+        if key is None:
+            return self._flattener(obj)
+        with self._lock:
+            flat = self._cache.get(key)
+            if flat is None:
+                flat = self._cache[key] = self._flattener(obj)
+                if self.on_new is not None:
+                    self.on_new(flat)
+        return flat
+
+    def __len__(self):
+        return len(self._cache)
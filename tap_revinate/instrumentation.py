@@ -0,0 +1,233 @@
+import contextlib
+import json
+import re
+import threading
+import time
+from urllib.parse import urlparse
+import singer
+from singer import metrics
+
+LOGGER = singer.get_logger()
+# upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PHASES = ('fetch', 'parse', 'emit')
+NUMERIC_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_of(url):
+    # /hotels/123/reviewssnapshot -> /hotels/{id}/reviewssnapshot
+    return NUMERIC_SEGMENT.sub('/{id}', urlparse(url).path)
+
+
+class Histogram:
+    """Request latencies in fixed buckets, plus their count, sum and max."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        index = 0
+        while index < len(self.bounds) and value > self.bounds[index]:
+            index = index + 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        # upper bound of the bucket holding that fraction of the requests
+        # (the max for the open-ended last bucket)
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen = seen + count
+            if count and seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return 0.0
+
+    def summary(self):
+        labels = ['<={}'.format(bound) for bound in self.bounds] + \
+            ['>{}'.format(self.bounds[-1])]
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': {label: count for label, count in zip(labels, self.buckets) if count}
+        }
+
+
+class Instrumentation:
+    """Run-wide counters for requests, retries, records and where time goes.
+
+    Per endpoint: a latency histogram (time to response headers), status
+    codes, backoff retries and bytes received. Per stream: records emitted
+    and the seconds spent in each phase on the thread writing records:
+    fetch (waiting for the next record off the wire, including decoding),
+    parse (flattening) and emit (serialising and writing). Records are also
+    counted through singer.metrics record counters, so the usual METRIC log
+    lines come out periodically.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._endpoints = {}
+        self._streams = {}
+        self._jobs = {}
+        self._exit_stack = contextlib.ExitStack()
+        self._local = threading.local()
+
+    def _endpoint(self, endpoint):
+        if endpoint not in self._endpoints:
+            self._endpoints[endpoint] = {'latency': Histogram(), 'status': {}, 'retries': 0,
+                                         'bytes': 0}
+        return self._endpoints[endpoint]
+
+    def _stream(self, stream):
+        if stream not in self._streams:
+            self._streams[stream] = {'records': 0, 'first': None, 'last': None,
+                                     'seconds': dict.fromkeys(PHASES, 0.0), 'counter': None}
+        return self._streams[stream]
+
+    def observe_request(self, url, latency, status):
+        with self._lock:
+            endpoint = self._endpoint(endpoint_of(url))
+            endpoint['latency'].add(latency)
+            endpoint['status'][str(status)] = endpoint['status'].get(str(status), 0) + 1
+
+    def observe_bytes(self, url, nbytes):
+        with self._lock:
+            self._endpoint(endpoint_of(url))['bytes'] += nbytes
+
+    def on_backoff(self, details):
+        # backoff handler: one call per retry of request()
+        url = details['args'][0] if details['args'] else details['kwargs'].get('url', '')
+        with self._lock:
+            self._endpoint(endpoint_of(url))['retries'] += 1
+
+    def _accounted(self):
+        # seconds already attributed to some phase on this thread
+        return getattr(self._local, 'accounted', 0.0)
+
+    def add_time(self, stream, phase, seconds):
+        self._local.accounted = self._accounted() + seconds
+        with self._lock:
+            self._stream(stream)['seconds'][phase] += seconds
+
+    def timed_iter(self, stream, items):
+        # yields items, counting the time spent waiting for each as fetch time;
+        # time the wait spent on other streams' records (an inner generator
+        # writing records, say) is left to them
+        items = iter(items)
+        while True:
+            start = time.perf_counter()
+            accounted = self._accounted()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                self.add_time(stream, 'fetch', time.perf_counter() - start - \
+                    (self._accounted() - accounted))
+            yield item
+
+    async def timed_aiter(self, stream, items):
+        # timed_iter for an async iterator
+        start = time.perf_counter()
+        accounted = self._accounted()
+        async for item in items:
+            self.add_time(stream, 'fetch', time.perf_counter() - start - \
+                (self._accounted() - accounted))
+            yield item
+            start = time.perf_counter()
+            accounted = self._accounted()
+        self.add_time(stream, 'fetch', time.perf_counter() - start - \
+            (self._accounted() - accounted))
+
+    def count_record(self, stream, parse_seconds, emit_seconds):
+        now = time.time()
+        self._local.accounted = self._accounted() + parse_seconds + emit_seconds
+        with self._lock:
+            entry = self._stream(stream)
+            entry['records'] += 1
+            entry['seconds']['parse'] += parse_seconds
+            entry['seconds']['emit'] += emit_seconds
+            if entry['first'] is None:
+                entry['first'] = now
+            entry['last'] = now
+            if entry['counter'] is None:
+                entry['counter'] = self._exit_stack.enter_context(metrics.record_counter(stream))
+            entry['counter'].increment()
+
+    @contextlib.contextmanager
+    def job(self, name):
+        # a singer.metrics job timer whose duration also goes into the summary
+        start = time.time()
+        try:
+            with metrics.job_timer(name):
+                yield
+        finally:
+            with self._lock:
+                self._jobs[name] = time.time() - start
+
+    def close(self):
+        # emit the final record_count metrics
+        with self._lock:
+            exit_stack, self._exit_stack = self._exit_stack, contextlib.ExitStack()
+            for entry in self._streams.values():
+                entry['counter'] = None
+        exit_stack.close()
+
+    def summary(self):
+        with self._lock:
+            endpoints = {endpoint: {
+                'requests': entry['latency'].count,
+                'latency': entry['latency'].summary(),
+                'status': dict(entry['status']),
+                'retries': entry['retries'],
+                'bytes': entry['bytes']
+            } for endpoint, entry in self._endpoints.items()}
+            streams = {}
+            for stream, entry in self._streams.items():
+                active = (entry['last'] - entry['first']) if entry['first'] else 0.0
+                streams[stream] = {
+                    'records': entry['records'],
+                    'records_per_second': entry['records'] / active if active else 0.0,
+                    'seconds': dict(entry['seconds'])
+                }
+            jobs = dict(self._jobs)
+        return {
+            'seconds': time.time() - self._started,
+            'endpoints': endpoints,
+            'streams': streams,
+            'jobs': jobs
+        }
+
+    def log_summary(self):
+        summary = self.summary()
+        for endpoint, entry in sorted(summary['endpoints'].items()):
+            LOGGER.info('Endpoint {}: {} requests, {} retries, {} bytes, latency p50 {}s, '
+                        'p95 {}s, max {:.3f}s, status codes {}'.format(
+                            endpoint, entry['requests'], entry['retries'], entry['bytes'],
+                            entry['latency']['p50'], entry['latency']['p95'],
+                            entry['latency']['max'], entry['status']))
+        for stream, entry in sorted(summary['streams'].items()):
+            LOGGER.info('Stream {}: {} records ({:.0f}/s), {:.3f}s fetch, {:.3f}s parse, '
+                        '{:.3f}s emit'.format(
+                            stream, entry['records'], entry['records_per_second'],
+                            entry['seconds']['fetch'], entry['seconds']['parse'],
+                            entry['seconds']['emit']))
+
+    def write_summary(self, path, extra=None):
+        summary = self.summary()
+        summary.update(extra or {})
+        with open(path, 'w', encoding='utf-8') as summary_file:
+            json.dump(summary, summary_file, indent=2, sort_keys=True)
+        LOGGER.info('Wrote metrics summary to {}'.format(path))
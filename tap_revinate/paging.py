@@ -0,0 +1,108 @@
+import threading
+
+DEFAULT_PAGE_SIZE = 10
+DEFAULT_MAX_PAGE_SIZE = 1000
+DEFAULT_TARGET_PAGE_SECONDS = 5.0
+DEFAULT_TARGET_PAGE_BYTES = 5 * 1024 * 1024
+
+
+def aligned_size(offset, size):
+    # Porter pages are addressed as (page, size), so a request can only start at
+    # `offset` when offset is a multiple of size: the largest such size up to
+    # `size`
+    size = max(1, int(size))
+    if offset <= 0:
+        return size
+    for candidate in range(min(size, offset), 0, -1):
+        if offset % candidate == 0:
+            return candidate
+    return 1
+
+
+class PageSizer:
+    """Chooses the number of records requested per page for one stream.
+
+    With a fixed size this simply returns the configured page_size. In
+    adaptive mode the size doubles while pages come back comfortably under
+    the latency and payload targets, and halves when a page goes over either
+    target, times out or fails with a 5xx. Adaptive sizes are always
+    page_size times a power of two (or page_size halved, down to 1), up to
+    max_size rounded down to one of them.
+
+    A page starting at an offset the size does not divide (after a resume
+    mid-window, or once the size has grown) is requested in the largest
+    pieces that fit before the next multiple of the size, from where the
+    full size is used again.
+    """
+
+    def __init__(self, size=DEFAULT_PAGE_SIZE, adaptive=False, max_size=DEFAULT_MAX_PAGE_SIZE,
+                 target_seconds=DEFAULT_TARGET_PAGE_SECONDS,
+                 target_bytes=DEFAULT_TARGET_PAGE_BYTES):
+        self.base = max(1, int(size))
+        self.adaptive = adaptive
+        self.target_seconds = float(target_seconds)
+        self.target_bytes = int(target_bytes)
+        self._lock = threading.Lock()
+        # sizes are base << level, or base >> -level below zero
+        self._levels = [1 - self.base.bit_length(), self._level_of(max(self.base, int(max_size)))]
+        self._level = 0
+
+    def _size_at(self, level):
+        return self.base << level if level >= 0 else max(1, self.base >> -level)
+
+    def _level_of(self, size):
+        # the level of the largest size on the ladder that is no more than size
+        level = 0
+        if size >= self.base:
+            while self.base << (level + 1) <= size:
+                level = level + 1
+        else:
+            while level > 1 - self.base.bit_length() and self._size_at(level) > size:
+                level = level - 1
+        return level
+
+    @property
+    def size(self):
+        return self._size_at(self._level)
+
+    @property
+    def max_size(self):
+        return self._size_at(self._levels[1])
+
+    @classmethod
+    def from_config(cls, config, stream):
+        size = config.get('page_size', DEFAULT_PAGE_SIZE)
+        if isinstance(size, dict):
+            size = size.get(stream, DEFAULT_PAGE_SIZE)
+        return cls(size=size,
+                   adaptive=bool(config.get('adaptive_page_size', False)),
+                   max_size=config.get('max_page_size', DEFAULT_MAX_PAGE_SIZE),
+                   target_seconds=config.get('target_page_seconds', DEFAULT_TARGET_PAGE_SECONDS),
+                   target_bytes=config.get('target_page_bytes', DEFAULT_TARGET_PAGE_BYTES))
+
+    def next_size(self, offset):
+        with self._lock:
+            size = self.size
+        misaligned = offset % size
+        return aligned_size(offset, size - misaligned) if misaligned else size
+
+    def _smaller(self, size):
+        # one step below both the current size and `size`
+        self._level = max(self._levels[0], min(self._level, self._level_of(size)) - 1)
+
+    def observe(self, size, latency, nbytes):
+        if not self.adaptive:
+            return
+        with self._lock:
+            if latency > self.target_seconds or nbytes > self.target_bytes:
+                self._smaller(size)
+            elif latency < self.target_seconds / 2 and nbytes < self.target_bytes / 2 \
+                    and size >= self.size:
+                self._level = min(self._levels[1], self._level + 1)
+
+    def shrink(self, size):
+        # a page that failed outright is not tried at that size again this run
+        with self._lock:
+            self._smaller(size)
+            self._levels[1] = max(self._levels[0], min(self._levels[1],
+                                                       self._level_of(size) - 1))
@@ -0,0 +1,171 @@
+import contextvars
+import queue
+import threading
+import time
+import singer
+
+LOGGER = singer.get_logger()
+DEFAULT_DECODE_DEPTH = 2
+DEFAULT_WRITE_DEPTH = 4
+
+
+class PipelineStats:
+    """Where each pipeline stage's thread spends its time.
+
+    busy: doing the stage's own work; waiting: idle for lack of input;
+    blocked: held up by a full queue into the next stage. Utilization is
+    the busy share of the three.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def add(self, stage, items=0, busy=0.0, waiting=0.0, blocked=0.0):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {'items': 0, 'busy': 0.0, 'waiting': 0.0,
+                                               'blocked': 0.0}
+            entry['items'] += items
+            entry['busy'] += busy
+            entry['waiting'] += waiting
+            entry['blocked'] += blocked
+
+    def stats(self):
+        with self._lock:
+            stages = {stage: dict(entry) for stage, entry in self._stages.items()}
+        for entry in stages.values():
+            total = entry['busy'] + entry['waiting'] + entry['blocked']
+            entry['utilization'] = entry['busy'] / total if total else 0.0
+        return stages
+
+    def log_stats(self):
+        for stage, entry in sorted(self.stats().items()):
+            LOGGER.info('Stage {}: {} items, {:.3f}s busy, {:.3f}s waiting, {:.3f}s blocked '
+                        '({:.0%} utilization)'.format(stage, entry['items'], entry['busy'],
+                                                      entry['waiting'], entry['blocked'],
+                                                      entry['utilization']))
+
+
+def _put(channel, entry, stop):
+    # False if the consumer went away first
+    while not stop.is_set():
+        try:
+            channel.put(entry, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def staged(items, depth, stats, stage, consumer):
+    """Iterate items on a thread of its own, up to `depth` items ahead.
+
+    Yields the items in order on the calling thread; an exception raised
+    while producing them is raised here when its turn comes. The producer's
+    time is counted under `stage` and the caller's, between items, under
+    `consumer`. With depth 0 the items are simply iterated inline. The
+    thread runs in a copy of the calling thread's context.
+    """
+    if not depth:
+        yield from items
+        return
+    channel = queue.Queue(maxsize=int(depth))
+    stop = threading.Event()
+
+    def produce():
+        iterator = iter(items)
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                produced = time.perf_counter()
+                if not _put(channel, (True, item), stop):
+                    break
+                stats.add(stage, items=1, busy=produced - start,
+                          blocked=time.perf_counter() - produced)
+            _put(channel, (False, None), stop)
+        except Exception as exception: # pylint: disable=broad-except
+            _put(channel, (False, exception), stop)
+        finally:
+            # close a generator on the thread that ran it
+            getattr(iterator, 'close', lambda: None)()
+
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(produce,),
+                              name='tap-revinate-' + stage, daemon=True)
+    thread.start()
+    try:
+        while True:
+            start = time.perf_counter()
+            more, item = channel.get()
+            got = time.perf_counter()
+            stats.add(consumer, waiting=got - start)
+            if not more:
+                if item is not None:
+                    raise item
+                return
+            yield item
+            stats.add(consumer, items=1, busy=time.perf_counter() - got)
+    finally:
+        stop.set()
+        thread.join()
+
+
+class WriteStage:
+    """Writes MessageWriter's buffers out from a thread of its own.
+
+    Up to `depth` flushed buffers wait in the queue, so a target that is
+    slow to read its stdin only holds up the tap once that many are
+    pending, and fetching and flattening carry on meanwhile. Buffers are
+    written in the order they were flushed, so a STATE still follows the
+    records it covers. A failed write is raised from the next submit() or
+    join(); close() writes what is pending and stops the thread.
+    """
+
+    def __init__(self, write, depth=DEFAULT_WRITE_DEPTH, stats=None):
+        self._write = write
+        self._stats = stats or PipelineStats()
+        self._queue = queue.Queue(maxsize=max(1, int(depth)))
+        self._error = []
+        self._thread = threading.Thread(target=self._run, name='tap-revinate-write', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            start = time.perf_counter()
+            entry = self._queue.get()
+            got = time.perf_counter()
+            if entry is None:
+                self._queue.task_done()
+                return
+            out, data = entry
+            try:
+                if not self._error:
+                    self._write(out, data)
+            except Exception as exception: # pylint: disable=broad-except
+                self._error.append(exception)
+            finally:
+                self._stats.add('write', items=1, busy=time.perf_counter() - got,
+                                waiting=got - start)
+                self._queue.task_done()
+
+    def _raise(self):
+        if self._error:
+            raise self._error[0]
+
+    def submit(self, out, data):
+        self._raise()
+        self._queue.put((out, data))
+
+    def join(self):
+        self._queue.join()
+        self._raise()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._raise()
@@ -0,0 +1,303 @@
+# The reviews stream: one /reviews pager, shards of the updatedAt window synced
+# concurrently, or one pager per hotel, on threads or on the async engine,
+# with the bookmarks each of them keeps.
+
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import singer
+from singer import utils
+from tap_revinate.aio import CLIENT_ERRORS, async_iter_pages, async_page_fetcher
+from tap_revinate.bookmarks import checkpoint_due, review_partitions, reviews_window, \
+    save_review_partition, track_position
+from tap_revinate.client import decoded_pages, iter_pages, log_page, porter_url, request
+from tap_revinate.concurrency import put_page
+from tap_revinate.context import DEDUP, FLATTENERS, METRICS, TRANSPORT, emit_record, write_state
+from tap_revinate.dedup import BoundaryDedup
+from tap_revinate.paging import PageSizer
+from tap_revinate.shards import add_interval, advance, gaps, split_by_count, split_by_days
+from tap_revinate.streaming import PorterPage
+
+LOGGER = singer.get_logger()
+
+
+def parse_review(review, raw_json=None):
+    return FLATTENERS['reviews'](review, {'raw_json': raw_json} if raw_json else None)
+
+
+def fetch_reviews(params, hotel_id=None):
+    # one hotel's reviews, or every hotel's
+    url = porter_url('/hotels/{}/reviews'.format(hotel_id) if hotel_id else '/reviews')
+    resp = request(url, params, stream=True)
+    return PorterPage(TRANSPORT.iter_content(resp))
+
+
+def review_page_fetcher(updated_at_range, hotel_id=None):
+    def fetch_page(page, size):
+        params = {
+            'updatedAt': updated_at_range,
+            'page': page,
+            'size': size,
+            'sort': 'updatedAt,ASC'
+        }
+        return fetch_reviews(params, hotel_id)
+    return fetch_page
+
+
+def count_reviews(from_timestamp, to_timestamp):
+    # cheap probe: a single-record page still reports totalElements for the window
+    fetch_page = review_page_fetcher('{}..{}'.format(from_timestamp, to_timestamp))
+    return int(fetch_page(0, 1).page.get('totalElements', 0))
+
+
+def plan_review_shards(CONFIG, from_timestamp, to_timestamp, done):
+    # split whatever is not yet done of the window into (from, to, total) shards;
+    # total is None when it is not known up front
+    def count(low, high):
+        return count_reviews(low, high)
+    windows = []
+    for low, high in gaps(from_timestamp, to_timestamp, done):
+        if CONFIG.get('shard_reviews_by') == 'records':
+            windows.extend(split_by_count(low, high, count, \
+                int(CONFIG.get('shard_records', 10000))))
+        else:
+            windows.extend((low, high, None) for low, high in \
+                split_by_days(low, high, CONFIG.get('shard_days', 1)))
+    return windows
+
+
+def review_page_worker(sizer, job, pages, stop):
+    # runs on a worker: pages through the reviews of job, a (key, updatedAt
+    # range, hotel_id or None) tuple, and hands them to the writer thread
+    # through the bounded `pages` queue as (kind, key, payload)
+    key, updated_at_range, hotel_id = job
+    fetch_page = review_page_fetcher(updated_at_range, hotel_id)
+    try:
+        for _, _, reviews_parsed in iter_pages(fetch_page, sizer):
+            put_page(pages, ('page', key, list(reviews_parsed.with_raw())), stop)
+        put_page(pages, ('done', key, None), stop)
+    except Exception as exception:
+        put_page(pages, ('error', key, exception), stop)
+
+
+def sync_review_jobs(sizer, jobs, concurrency, write_page, finish):
+    # pages through each of jobs (see review_page_worker), concurrency at a
+    # time, and writes from this thread: write_page(key, records) for each page
+    # as it comes in, then finish(key, error) once the job's pages are all
+    # written (error None) or it failed
+    pages = queue.Queue(maxsize=2 * concurrency)
+    stop = threading.Event()
+    pending = len(jobs)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            for job in jobs:
+                executor.submit(contextvars.copy_context().run, review_page_worker, sizer, \
+                    job, pages, stop)
+            while pending:
+                start = time.perf_counter()
+                kind, key, payload = pages.get()
+                METRICS.add_time('reviews', 'fetch', time.perf_counter() - start)
+                if kind == 'page':
+                    write_page(key, payload)
+                    continue
+                pending = pending - 1
+                finish(key, payload)
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def write_reviews_shard_state(STATE, from_timestamp, done):
+    last_update, remaining = advance(from_timestamp, done)
+    if last_update > from_timestamp:
+        utils.update_state(STATE, 'last_update', last_update)
+    DEDUP.save(STATE, last_update)
+    STATE['reviews_shards_done'] = remaining
+    write_state(STATE)
+    return last_update
+
+
+def sync_reviews_sharded(CONFIG, STATE, from_timestamp, to_timestamp):
+    sizer = PageSizer.from_config(CONFIG, 'reviews')
+    concurrency = int(CONFIG.get('shard_concurrency', 4))
+    done = [list(interval) for interval in STATE.get('reviews_shards_done', [])]
+    windows = plan_review_shards(CONFIG, from_timestamp, to_timestamp, done)
+    LOGGER.info('Syncing reviews {}..{} in {} shards, {} at a time.'.format( \
+        from_timestamp, to_timestamp, len(windows), concurrency))
+    shards = []
+    for window in windows:
+        if window[2] == 0:
+            done = add_interval(done, window[:2])
+        else:
+            shards.append((window, '{}..{}'.format(window[0], window[1]), None))
+    def write_page(_, payload):
+        for record, raw_json in payload:
+            if not DEDUP.duplicate(record):
+                emit_record('reviews', parse_review, record, raw_json)
+    def finish(window, error):
+        nonlocal done
+        if error is None:
+            LOGGER.info('Finished reviews shard {}..{}.'.format(window[0], window[1]))
+            done = add_interval(done, window[:2])
+            write_reviews_shard_state(STATE, from_timestamp, done)
+        else:
+            LOGGER.error('Reviews shard {}..{} failed: {}'.format(window[0], window[1], error))
+    sync_review_jobs(sizer, shards, concurrency, write_page, finish)
+    last_update = write_reviews_shard_state(STATE, from_timestamp, done)
+    LOGGER.info("State synced to last_update: {}".format(last_update))
+    LOGGER.info("Done syncing reviews.")
+
+
+def write_reviews_checkpoint(STATE, last_update):
+    # a resumed run reads last_update's reviews again from the first, and the
+    # ids saved with it drop the ones already emitted; skipping them by
+    # position would lose a review if one of them has moved to a later second
+    if last_update != STATE.get('last_update'):
+        utils.update_state(STATE, 'last_update', last_update)
+    DEDUP.save(STATE, last_update)
+    write_state(STATE)
+
+
+def write_reviews_page(offset, size, reviews_parsed, position):
+    # position is [last_update, count at last_update] for the reviews written so far
+    # loop thru all records on page, as they are decoded
+    for record, raw_json in METRICS.timed_iter('reviews', reviews_parsed.with_raw()):
+        # reviews at the bookmark that were emitted before are counted, not written
+        if not DEDUP.duplicate(record):
+            emit_record('reviews', parse_review, record, raw_json)
+        track_position(position, record)
+    log_page(offset, size, reviews_parsed.count, reviews_parsed.page)
+
+
+def finish_reviews(STATE, window, position, completed):
+    last_update, read = position
+    if not completed:
+        # keep the last checkpoint so the next run resumes where this one stopped
+        write_reviews_checkpoint(STATE, last_update)
+        LOGGER.info("State checkpointed at last_update: {}".format(last_update))
+        return
+    if last_update == window[0] and read == 0:
+        last_update = window[1] # nothing new in the window
+    # update STATE last_update
+    utils.update_state(STATE, 'last_update', last_update)
+    DEDUP.save(STATE, last_update)
+    write_state(STATE)
+    LOGGER.info("State synced to last_update: {}".format(last_update))
+    LOGGER.info("Done syncing reviews.")
+
+
+def write_review_partition_page(partition, payload):
+    # each hotel's reviews are checked against the reviews at its own bookmark
+    if partition['dedup'] is None:
+        partition['dedup'] = BoundaryDedup(**DEDUP.options)
+        partition['dedup'].start(partition['state'])
+    for record, raw_json in payload:
+        if not partition['dedup'].duplicate(record):
+            emit_record('reviews', parse_review, record, raw_json)
+        track_position(partition['position'], record)
+
+
+def checkpoint_review_partitions(STATE, partitions):
+    # the hotels that are done are already saved, and the ones not started yet
+    # have nothing to save
+    for partition in partitions.values():
+        if partition['dedup'] is not None:
+            save_review_partition(partition, False)
+    write_state(STATE)
+
+
+def finish_review_partition(partition, completed):
+    save_review_partition(partition, completed)
+    if partition['dedup'] is not None:
+        DEDUP.add_stats(partition['dedup'])
+        partition['dedup'] = None
+
+
+def sync_reviews_by_hotel(CONFIG, STATE, sync_until, hotel_ids):
+    # one /hotels/{id}/reviews pager per hotel, partition_concurrency at a
+    # time and all within max_in_flight; records are written from this thread
+    sizer = PageSizer.from_config(CONFIG, 'reviews')
+    concurrency = int(CONFIG.get('partition_concurrency', 4))
+    partitions = review_partitions(CONFIG, STATE, sync_until, hotel_ids)
+    LOGGER.info('Syncing reviews for {} hotels, {} at a time.'.format( \
+        len(partitions), concurrency))
+    due = checkpoint_due(CONFIG)
+    def write_page(hotel_id, payload):
+        write_review_partition_page(partitions[hotel_id], payload)
+        if due():
+            checkpoint_review_partitions(STATE, partitions)
+    def finish(hotel_id, error):
+        if error is None:
+            LOGGER.info('Finished reviews for hotel {}.'.format(hotel_id))
+        else:
+            LOGGER.error('Reviews for hotel {} failed: {}'.format(hotel_id, error))
+        finish_review_partition(partitions[hotel_id], error is None)
+        write_state(STATE)
+    sync_review_jobs(sizer, [(hotel_id, '{}..{}'.format(*partition['window']), hotel_id) \
+        for hotel_id, partition in partitions.items()], concurrency, write_page, finish)
+    bookmarks = [partition['state']['last_update'] for partition in partitions.values() \
+        if 'last_update' in partition['state']]
+    if bookmarks:
+        # the oldest hotel bookmark, for an unpartitioned run to start from
+        STATE['last_update'] = min(bookmarks)
+        STATE.pop('last_update_review_ids', None)
+        write_state(STATE)
+    LOGGER.info("Done syncing reviews.")
+
+
+def sync_reviews(CONFIG, STATE, sync_until, hotel_ids=None):
+    if CONFIG.get('partition_reviews_by_hotel'):
+        sync_reviews_by_hotel(CONFIG, STATE, sync_until, hotel_ids or [])
+        return
+    sizer = PageSizer.from_config(CONFIG, 'reviews')
+    from_timestamp, to_timestamp = reviews_window(CONFIG, STATE, sync_until)
+    if CONFIG.get('shard_reviews_by'):
+        sync_reviews_sharded(CONFIG, STATE, from_timestamp, to_timestamp)
+        return
+    updated_at_range = str(from_timestamp) + '..' + str(to_timestamp)
+    fetch_page = review_page_fetcher(updated_at_range)
+    prefetch = int(CONFIG.get('page_prefetch', 1))
+    due = checkpoint_due(CONFIG)
+    position = [from_timestamp, 0]
+    completed = False
+    # loop thru all pages, in page order
+    try:
+        for offset, size, reviews_parsed in METRICS.timed_iter('reviews', \
+                decoded_pages('reviews', iter_pages(fetch_page, sizer, prefetch))):
+            write_reviews_page(offset, size, reviews_parsed, position)
+            if due():
+                write_reviews_checkpoint(STATE, position[0])
+        completed = True
+    except (requests.exceptions.RequestException, ValueError) as exception:
+        LOGGER.exception(exception)
+    finish_reviews(STATE, (from_timestamp, to_timestamp), position, completed)
+
+
+async def async_sync_reviews(client, CONFIG, STATE, sync_until):
+    sizer = PageSizer.from_config(CONFIG, 'reviews')
+    from_timestamp, to_timestamp = reviews_window(CONFIG, STATE, sync_until)
+    if CONFIG.get('shard_reviews_by'):
+        LOGGER.info('Sharded reviews are synced on threads, not by the async engine.')
+        sync_reviews_sharded(CONFIG, STATE, from_timestamp, to_timestamp)
+        return
+    updated_at_range = str(from_timestamp) + '..' + str(to_timestamp)
+    prefetch = int(CONFIG.get('page_prefetch', 1))
+    due = checkpoint_due(CONFIG)
+    position = [from_timestamp, 0]
+    completed = False
+    fetch_page = async_page_fetcher(client, porter_url('/reviews'), \
+        lambda page, size: {'updatedAt': updated_at_range, 'page': page, 'size': size, \
+            'sort': 'updatedAt,ASC'})
+    pages = async_iter_pages(fetch_page, sizer, prefetch)
+    try:
+        async for offset, size, reviews_parsed in METRICS.timed_aiter('reviews', pages):
+            write_reviews_page(offset, size, reviews_parsed, position)
+            if due():
+                write_reviews_checkpoint(STATE, position[0])
+        completed = True
+    except CLIENT_ERRORS + (ValueError,) as exception:
+        LOGGER.exception(exception)
+    finish_reviews(STATE, (from_timestamp, to_timestamp), position, completed)
@@ -1,3 +1,5 @@
+import copy
+
 hotels = {
     'type': ['object', 'null'],
     'properties': {
@@ -125,3 +127,84 @@ reviews = {
         'links_json': {'type': 'string'}
     }
 }
+
+review_sites = {
+    'type': ['object', 'null'],
+    'properties': {
+        'review_site_id': {'type': 'integer'},
+        'review_site_url': {'type': 'string'},
+        'review_site_json': {'type': 'string'},
+        'review_site_name': {'type': 'string'},
+        'review_site_main_url': {'type': 'string'},
+        'review_site_slug': {'type': 'string'}
+    }
+}
+
+languages = {
+    'type': ['object', 'null'],
+    'properties': {
+        'language_id': {'type': 'integer'},
+        'language_url': {'type': 'string'},
+        'language_json': {'type': 'string'},
+        'language_name': {'type': 'string'},
+        'language_english_name': {'type': 'string'},
+        'language_slug': {'type': 'string'}
+    }
+}
+
+# Native types of the *_json columns, declared in place of strings when the
+# tap runs with json_columns set to 'object'
+json_object = {'type': ['object', 'null']}
+json_array = {'type': ['array', 'null'], 'items': {'type': ['object', 'null']}}
+
+json_columns = {
+    'hotels': {
+        'hotel_json': json_object,
+        'links_json': json_array
+    },
+    'hotel_reviews_snapshot': {
+        'hotel_reviews_snapshot_json': json_object,
+        'aggregate_values_json': json_object,
+        'values_by_review_site_json': json_array,
+        'values_by_time_json': json_array,
+        'links_json': json_array
+    },
+    'hotel_reviews_snapshot_by_site': {
+        'site_json': json_object,
+        'review_site_json': json_object,
+        'values_json': json_object
+    },
+    'hotel_reviews_snapshot_by_time': {
+        'time_period_json': json_object,
+        'values_json': json_object
+    },
+    'reviews': {
+        'review_json': json_object,
+        'review_site_json': json_object,
+        'language_json': json_object,
+        'subratings_json': json_object,
+        'guest_stay_json': json_object,
+        'survey_topics_json': json_array,
+        'response_json': json_object,
+        'links_json': json_array
+    },
+    'review_sites': {
+        'review_site_json': json_object
+    },
+    'languages': {
+        'language_json': json_object
+    }
+}
+
+
+def get_schema(stream, json_columns_mode='repr', columns=None):
+    schema = copy.deepcopy(globals()[stream])
+    if json_columns_mode == 'object':
+        schema['properties'].update(copy.deepcopy(json_columns[stream]))
+    elif json_columns_mode == 'drop':
+        for column in json_columns[stream]:
+            schema['properties'].pop(column, None)
+    if columns is not None:
+        schema['properties'] = {column: value for column, value in \
+            schema['properties'].items() if column in columns}
+    return schema
@@ -0,0 +1,75 @@
+SECONDS_PER_DAY = 60 * 60 * 24
+
+
+def add_interval(done, interval):
+    # merge [from, to] into a sorted list of disjoint, inclusive intervals
+    merged = []
+    low, high = interval
+    for start, end in sorted(done):
+        if end + 1 < low or high + 1 < start:
+            merged.append([start, end])
+        else:
+            low, high = min(low, start), max(high, end)
+    merged.append([low, high])
+    return sorted(merged)
+
+
+def gaps(from_ts, to_ts, done):
+    # the parts of [from_ts, to_ts] not covered by the done intervals
+    out = []
+    cursor = from_ts
+    for start, end in sorted(done):
+        if end < cursor:
+            continue
+        if start > to_ts:
+            break
+        if start > cursor:
+            out.append((cursor, start - 1))
+        cursor = max(cursor, end + 1)
+    if cursor <= to_ts:
+        out.append((cursor, to_ts))
+    return out
+
+
+def advance(from_ts, done):
+    """Return the new bookmark and the done intervals still beyond it.
+
+    The bookmark only moves past a window once every window between it and
+    from_ts has completed.
+    """
+    bookmark = from_ts
+    remaining = []
+    for start, end in sorted(done):
+        if start <= bookmark <= end + 1:
+            bookmark = max(bookmark, end + 1)
+        elif end >= bookmark:
+            remaining.append([start, end])
+    return bookmark, remaining
+
+
+def split_by_days(from_ts, to_ts, days):
+    step = max(1, int(float(days) * SECONDS_PER_DAY))
+    windows = []
+    start = from_ts
+    while start <= to_ts:
+        end = min(to_ts, start + step - 1)
+        windows.append((start, end))
+        start = end + 1
+    return windows
+
+
+def split_by_count(from_ts, to_ts, count, target, total=None):
+    """Bisect [from_ts, to_ts] until each window holds at most target records.
+
+    count(from_ts, to_ts) is expected to be a cheap probe (a size=1 request
+    that only reads totalElements); the right half of each split is derived
+    from the left one. Returns (from, to, total) tuples.
+    """
+    if total is None:
+        total = count(from_ts, to_ts)
+    if total <= target or from_ts >= to_ts:
+        return [(from_ts, to_ts, total)]
+    middle = (from_ts + to_ts) // 2
+    left = count(from_ts, middle)
+    return split_by_count(from_ts, middle, count, target, left) + \
+        split_by_count(middle + 1, to_ts, count, target, max(0, total - left))
@@ -0,0 +1,183 @@
+import codecs
+import collections
+import json
+
+DECODER = json.JSONDecoder()
+WHITESPACE = ' \t\n\r'
+# drop the consumed head of the text buffer once it grows past this many characters
+COMPACT_AT = 64 * 1024
+
+
+class StreamDecoder:
+    """Incremental reader over a JSON document arriving as byte chunks.
+
+    Only the text of the value currently being decoded is kept in memory:
+    whatever precedes it is discarded as soon as it has been decoded.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        if self._eof:
+            return False
+        if self._pos > COMPACT_AT:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk)
+            if text:
+                self._buf = self._buf + text
+                return True
+        self._buf = self._buf + self._utf8.decode(b'', final=True)
+        self._eof = True
+        return False
+
+    def peek(self):
+        # the next non-whitespace character, or '' at the end of the document
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in WHITESPACE:
+                self._pos = self._pos + 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars or not char:
+            raise ValueError('Expected one of {!r} at offset {}, got {!r}'.format( \
+                chars, self._pos, char))
+        self._pos = self._pos + 1
+        return char
+
+    def finish(self):
+        # read to the end of the stream so the source can release its connection
+        while self._fill():
+            pass
+
+    def value(self):
+        return self.raw_value()[0]
+
+    def raw_value(self):
+        # the next value, along with the JSON text it was decoded from
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # a bare number at the end of the buffer may continue in the next chunk
+            if end == len(self._buf) and self._fill():
+                continue
+            text = self._buf[self._pos:end]
+            self._pos = end
+            return value, text
+
+
+def iter_object(chunks, stream_key=None):
+    """Yield the top-level members of a JSON object as ('field', key, value, None).
+
+    When the member named stream_key is an array, its elements are yielded
+    one at a time as ('item', stream_key, element, text) instead of as one
+    list, where text is the JSON the element was decoded from.
+    """
+    reader = StreamDecoder(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.finish()
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == stream_key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    value, text = reader.raw_value()
+                    yield 'item', key, value, text
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            yield 'field', key, reader.value(), None
+        if reader.expect(',}') == '}':
+            reader.finish()
+            return
+
+
+class PorterPage:
+    """One page of a Porter collection, decoded while it is read.
+
+    Iterating yields the records of `content` straight off the response
+    stream; the other members (`page`, `links`) are collected in `fields`
+    as they go by. Reading `page` before the records have been iterated
+    buffers the remaining records so they can still be iterated afterwards.
+    with_raw() yields each record along with the JSON text it came from
+    (None for pages built from already parsed data).
+    """
+
+    def __init__(self, chunks, streamed=True):
+        self._events = iter_object(chunks, 'content')
+        self._buffered = collections.deque()
+        self.fields = {}
+        self.count = 0
+        self.streamed = streamed
+
+    @classmethod
+    def from_parsed(cls, parsed):
+        page = cls([], streamed=False)
+        page._events = iter(())
+        page._buffered = collections.deque((item, None) for item in parsed.get('content', []))
+        page.fields = {key: value for key, value in parsed.items() if key != 'content'}
+        return page
+
+    def _next_item(self):
+        for event, key, value, text in self._events:
+            if event == 'item':
+                return value, text
+            self.fields[key] = value
+        raise StopIteration
+
+    def __iter__(self):
+        for item, _ in self.with_raw():
+            yield item
+
+    def with_raw(self):
+        while True:
+            if self._buffered:
+                item = self._buffered.popleft()
+            else:
+                try:
+                    item = self._next_item()
+                except StopIteration:
+                    return
+            self.count = self.count + 1
+            yield item
+
+    def read(self):
+        # decode the rest of the body now, buffering the records
+        while True:
+            try:
+                self._buffered.append(self._next_item())
+            except StopIteration:
+                return self
+
+    @property
+    def page(self):
+        if 'page' not in self.fields:
+            self.read()
+        return self.fields.get('page', {})
+
+
+def load_object(chunks):
+    # decode a whole JSON object from byte chunks without first joining them
+    # into a single response string
+    return {key: value for _, key, value, _ in iter_object(chunks)}
@@ -0,0 +1,144 @@
+import email.utils
+import threading
+import time
+import singer
+
+LOGGER = singer.get_logger()
+THROTTLE_STATUSES = (429, 503)
+DEFAULT_MAX_IN_FLIGHT = 10
+# a Retry-After above this is capped, so a bad header can't stall a run for hours
+MAX_RETRY_AFTER = 300.0
+
+
+def retry_after_seconds(headers, now=None):
+    """Seconds the server asked us to wait, from Retry-After or rate-limit headers.
+
+    Retry-After may be a number of seconds or an HTTP date. When it is
+    missing, an exhausted X-RateLimit-Remaining with an X-RateLimit-Reset
+    (seconds, or an epoch timestamp) is used instead. None if neither says.
+    """
+    now = time.time() if now is None else now
+    value = headers.get('Retry-After')
+    if value:
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = email.utils.parsedate_to_datetime(value).timestamp() - now
+            except (TypeError, ValueError):
+                return None
+        return min(MAX_RETRY_AFTER, max(0.0, seconds))
+    if headers.get('X-RateLimit-Remaining') == '0' and headers.get('X-RateLimit-Reset'):
+        try:
+            reset = float(headers['X-RateLimit-Reset'])
+        except ValueError:
+            return None
+        seconds = reset - now if reset > 1e9 else reset
+        return min(MAX_RETRY_AFTER, max(0.0, seconds))
+    return None
+
+
+class RateLimiter:
+    """Shared cap on the number of Porter requests in flight, tuned by AIMD.
+
+    Every request() call takes a slot for as long as it waits for the
+    response headers. Each throttled response (429 or 503) halves the cap,
+    at most once per round of requests so a burst of 429s counts once, and
+    pauses all new requests for the Retry-After the server sent. Once a cap's
+    worth of requests have succeeded in a row, the cap grows by one, up to
+    max_in_flight.
+    """
+
+    def __init__(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT, min_in_flight=1, decrease=0.5):
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._state = {'in_flight': 0, 'successes': 0, 'epoch': 0, 'paused_until': 0.0}
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min_in_flight
+        self.decrease = decrease
+        self.limit = float(max_in_flight)
+        self.configure(max_in_flight, min_in_flight, decrease)
+
+    def configure(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT, min_in_flight=1, decrease=0.5):
+        with self._cond:
+            self.max_in_flight = max(1, int(max_in_flight))
+            self.min_in_flight = max(1, min(int(min_in_flight), self.max_in_flight))
+            self.decrease = float(decrease)
+            self.limit = float(self.max_in_flight)
+            self._cond.notify_all()
+
+    def acquire(self):
+        # returns the epoch the request started in, to hand back to release()
+        with self._cond:
+            while True:
+                epoch, wait = self._try_acquire()
+                if epoch is not None:
+                    return epoch
+                self._cond.wait(wait)
+
+    def try_acquire(self):
+        # acquire() without waiting, for the async engine: (epoch, None) once
+        # a slot is taken, else (None, the seconds left of a Retry-After pause,
+        # or None while the cap is full)
+        with self._cond:
+            return self._try_acquire()
+
+    def _try_acquire(self):
+        wait = self._state['paused_until'] - time.time()
+        if wait > 0:
+            return None, wait
+        if self._state['in_flight'] >= int(self.limit):
+            return None, None
+        self._state['in_flight'] += 1
+        return self._state['epoch'], None
+
+    def release(self, epoch, status=None, retry_after=None):
+        throttled = status in THROTTLE_STATUSES
+        self._local.retry_after = retry_after if throttled else None
+        with self._cond:
+            self._state['in_flight'] -= 1
+            if throttled:
+                self._throttled(epoch, status, retry_after)
+            elif retry_after:
+                # a success that used up the last of the rate-limit window
+                self._state['paused_until'] = max(self._state['paused_until'],
+                                                  time.time() + retry_after)
+            elif status is not None:
+                self._state['successes'] += 1
+                if self._state['successes'] >= int(self.limit) and \
+                        self.limit < self.max_in_flight:
+                    self.limit = self.limit + 1
+                    self._state['successes'] = 0
+            self._cond.notify_all()
+
+    def _throttled(self, epoch, status, retry_after):
+        self._state['successes'] = 0
+        if retry_after:
+            self._state['paused_until'] = max(self._state['paused_until'],
+                                              time.time() + retry_after)
+        # requests already in flight when the cap last dropped were sent at
+        # the old rate; their 429s don't call for another cut
+        if epoch != self._state['epoch']:
+            return
+        self._state['epoch'] += 1
+        self.limit = max(float(self.min_in_flight), self.limit * self.decrease)
+        LOGGER.warning('Throttled by Porter ({}), allowing {} requests in flight{}.'.format(
+            status, int(self.limit),
+            ', pausing {:.1f}s'.format(retry_after) if retry_after else ''))
+
+    def retry_delay(self, default):
+        # backoff wait before retrying on this thread: acquire() already holds
+        # new requests back for a Retry-After, so only throttles without one
+        # fall back to the exponential delay
+        if getattr(self._local, 'retry_after', None):
+            return 0
+        return default
+
+    def paused_for(self):
+        # seconds left of the Retry-After pause, if any
+        return max(0.0, self._state['paused_until'] - time.time())
+
+    def stats(self):
+        with self._cond:
+            return {'limit': int(self.limit), 'in_flight': self._state['in_flight'],
+                    'paused_for': self.paused_for()}
@@ -0,0 +1,119 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+import singer
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError
+
+LOGGER = singer.get_logger()
+DEFAULT_POOL_SIZE = 10
+CHUNK_SIZE = 64 * 1024
+
+
+class Transport:
+    """Shared keep-alive HTTP session for all Porter API calls.
+
+    Connections to porter.revinate.com are pooled and reused across pages,
+    hotels and streams, so each run pays for a handful of TCP/TLS handshakes
+    instead of one per request. Byte and latency counters are kept for the
+    end-of-run summary.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        })
+        self.pool_size = None
+        self.timeout = None
+        # called with (url, bytes received) for every response read in full
+        self.on_response = None
+        self.configure(pool_size, timeout)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {
+            'requests': 0,
+            'bytes_received': 0,
+            'bytes_decoded': 0,
+            'total_latency': 0.0,
+            'max_latency': 0.0
+        }
+
+    def configure(self, pool_size=DEFAULT_POOL_SIZE, timeout=None):
+        self.timeout = float(timeout) if timeout else None
+        pool_size = int(pool_size or DEFAULT_POOL_SIZE)
+        if pool_size == self.pool_size:
+            return
+        self.pool_size = pool_size
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url, headers=None, params=None, stream=False):
+        # with stream=True only the headers have been read on return; the body
+        # is read (and accounted for) through iter_content
+        start = time.time()
+        response = self.session.get(url=url, headers=headers, params=params,
+                                    timeout=self.timeout, stream=stream)
+        if not stream:
+            self._account(response, time.time() - start, len(response.content))
+        return response
+
+    def iter_content(self, response):
+        # yield the decoded body of a streamed response in chunks. urllib3's
+        # errors are raised as the requests exceptions Response.iter_content
+        # raises for them, so a connection lost mid-body is a RequestException
+        # like any other failed request
+        decoded = 0
+        try:
+            for chunk in response.raw.stream(CHUNK_SIZE, decode_content=True):
+                decoded = decoded + len(chunk)
+                yield chunk
+        except ProtocolError as exception:
+            raise requests.exceptions.ChunkedEncodingError(exception) from exception
+        except DecodeError as exception:
+            raise requests.exceptions.ContentDecodingError(exception) from exception
+        except ReadTimeoutError as exception:
+            raise requests.exceptions.ReadTimeout(exception) from exception
+        finally:
+            response.close()
+        self._account(response, response.elapsed.total_seconds(), decoded)
+
+    def _account(self, response, latency, decoded):
+        try:
+            # urllib3 counts the bytes read off the wire, before gzip decoding
+            received = response.raw.tell() or decoded
+        except Exception:
+            received = decoded
+        self._local.last_exchange = {'latency': latency, 'bytes': received}
+        if self.on_response is not None:
+            self.on_response(response.url, received)
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['bytes_received'] += received
+            self._stats['bytes_decoded'] += decoded
+            self._stats['total_latency'] += latency
+            self._stats['max_latency'] = max(self._stats['max_latency'], latency)
+
+    def last_exchange(self):
+        # latency and size of the most recent response received on this thread
+        return getattr(self._local, 'last_exchange', {'latency': 0.0, 'bytes': 0})
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        count = stats['requests']
+        stats['avg_latency'] = stats['total_latency'] / count if count else 0.0
+        return stats
+
+    def log_stats(self):
+        stats = self.stats()
+        LOGGER.info('HTTP: {} requests, {} bytes received ({} decoded), '
+                    'avg latency {:.3f}s, max latency {:.3f}s'.format(
+                        stats['requests'], stats['bytes_received'], stats['bytes_decoded'],
+                        stats['avg_latency'], stats['max_latency']))
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,123 @@
+import functools
+import sys
+import threading
+import time
+import singer
+from tap_revinate.encoding import dumps
+
+LOGGER = singer.get_logger()
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+@functools.lru_cache(maxsize=None)
+def record_prefix(stream):
+    # the RECORD envelope only depends on the stream, so it is built once
+    return '{{"type":"RECORD","stream":{},"record":'.format(dumps(stream))
+
+
+def write_out(out, data):
+    # write UTF-8 straight to the underlying binary stream when there is
+    # one, whatever the locale encoding of the text layer
+    binary = getattr(out, 'buffer', None)
+    if binary is not None:
+        out.flush()
+        binary.write(data)
+        binary.flush()
+    else:
+        out.write(data.decode('utf-8'))
+        out.flush()
+
+
+class MessageWriter:
+    """Writes Singer messages to stdout in large buffered writes.
+
+    RECORD messages are serialised as they come (with orjson when it is
+    installed) and collected until buffer_size bytes are pending. SCHEMA and
+    STATE messages flush everything before them and then themselves, so a
+    target never sees a STATE ahead of the records it covers. Given a
+    pipeline.WriteStage, flushed buffers are handed to its thread to write
+    instead of being written in place.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, out=None):
+        self.buffer_size = int(buffer_size)
+        self.out = out
+        self.stage = None
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_bytes = 0
+        self._stats = {
+            'messages': 0,
+            'bytes': 0,
+            'flushes': 0,
+            'started': None
+        }
+
+    def configure(self, buffer_size=DEFAULT_BUFFER_SIZE, out=None, stage=None):
+        with self._lock:
+            self._flush()
+            if self.stage is not None:
+                self.stage.close()
+            self.buffer_size = int(buffer_size or DEFAULT_BUFFER_SIZE)
+            self.out = out
+            self.stage = stage
+
+    def write_record(self, stream, record):
+        self._write(record_prefix(stream) + dumps(record) + '}\n', flush=False)
+
+    def write_schema(self, stream, schema, key_properties, bookmark_properties=None):
+        message = singer.SchemaMessage(stream=stream, schema=schema,
+                                       key_properties=key_properties,
+                                       bookmark_properties=bookmark_properties)
+        self._write(dumps(message.asdict()) + '\n', flush=True)
+
+    def write_state(self, value):
+        self._write(dumps({'type': 'STATE', 'value': value}) + '\n', flush=True)
+
+    def _write(self, line, flush):
+        with self._lock:
+            if self._stats['started'] is None:
+                self._stats['started'] = time.time()
+            self._pending.append(line)
+            self._pending_bytes += len(line)
+            self._stats['messages'] += 1
+            if flush or self._pending_bytes >= self.buffer_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        out = self.out or sys.stdout
+        data = ''.join(self._pending).encode('utf-8')
+        self._pending = []
+        self._pending_bytes = 0
+        if self.stage is not None:
+            self.stage.submit(out, data)
+        else:
+            write_out(out, data)
+        self._stats['bytes'] += len(data)
+        self._stats['flushes'] += 1
+
+    def flush(self):
+        # returns once everything has been written out
+        with self._lock:
+            self._flush()
+            if self.stage is not None:
+                self.stage.join()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        started = stats.pop('started')
+        stats['seconds'] = time.time() - started if started else 0.0
+        stats['messages_per_second'] = stats['messages'] / stats['seconds'] \
+            if stats['seconds'] else 0.0
+        stats['bytes_per_second'] = stats['bytes'] / stats['seconds'] if stats['seconds'] else 0.0
+        return stats
+
+    def log_stats(self):
+        stats = self.stats()
+        LOGGER.info('Output: {} messages, {} bytes in {} writes over {:.1f}s '
+                    '({:.0f} messages/s, {:.0f} bytes/s)'.format(
+                        stats['messages'], stats['bytes'], stats['flushes'], stats['seconds'],
+                        stats['messages_per_second'], stats['bytes_per_second']))
@@ -0,0 +1,81 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'benchmarks'))
+
+# pylint: disable=wrong-import-position
+from singer import metadata
+from fixtures import Dataset
+from mock_porter import MockPorter
+import tap_revinate
+from tap_revinate.catalog import discover
+
+BASE_CONFIG = {'username': 'user@example.com',
+               'api_key': 'key',
+               'api_secret': 'secret',
+               'start_date': '2018-09-01T00:00:00Z'}
+
+
+class Run:
+    """The Singer messages one do_sync wrote, by type."""
+
+    def __init__(self, output):
+        self.messages = [json.loads(line) for line in output.splitlines()]
+
+    def records(self, stream):
+        return [message['record'] for message in self.messages \
+            if message['type'] == 'RECORD' and message['stream'] == stream]
+
+    @property
+    def states(self):
+        return [message['value'] for message in self.messages if message['type'] == 'STATE']
+
+    @property
+    def state(self):
+        return self.states[-1]
+
+
+def catalog(*streams):
+    # a catalog with only `streams` selected
+    selected = discover(tap_revinate.KEY_PROPERTIES)
+    for entry in selected.streams:
+        if entry.tap_stream_id in streams:
+            entry.metadata = metadata.to_list(metadata.write( \
+                metadata.to_map(entry.metadata), (), 'selected', True))
+    return selected
+
+
+def sync(porter, config=None, state=None, catalog=None):
+    tap_revinate.client.BASE_URL = porter.url
+    tap_revinate.STATE.clear()
+    tap_revinate.CONFIG.clear()
+    args = argparse.Namespace(config=dict(BASE_CONFIG, **(config or {})),
+                              state=json.loads(json.dumps(state or {})),
+                              catalog=catalog, properties=None, discover=False)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        tap_revinate.do_sync(args)
+    return Run(output.getvalue())
+
+
+@contextlib.contextmanager
+def serve(**dataset):
+    # a mock Porter served from this process, 15 hotels and 500 reviews unless
+    # told otherwise
+    server = MockPorter(Dataset(**dict({'hotels': 15, 'reviews': 500}, **dataset))).start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+@pytest.fixture
+def porter():
+    with serve() as server:
+        yield server
@@ -0,0 +1,43 @@
+from conftest import catalog, sync
+from tap_revinate.dedup import review_id_of
+
+ACCOUNTS = [{'name': 'a', 'username': 'a@example.com'},
+            {'name': 'b', 'username': 'b@example.com', 'start_date': '2018-09-15T00:00:00Z'}]
+# 2018-09-15T00:00:00Z
+B_START = 1536969600
+
+
+def test_each_account_bookmarks_its_own_reviews(porter):
+    config = {'accounts': ACCOUNTS, 'checkpoint_pages': 5}
+    run = sync(porter, config, catalog=catalog('reviews'))
+    updated_at = {review_id_of(review): review['updatedAt'] for review in porter.dataset.reviews}
+    written = {'a': [], 'b': []}
+    bookmarks = {'a': 0, 'b': 0}
+    for message in run.messages:
+        if message['type'] == 'RECORD':
+            written[message['record']['account']].append(updated_at[message['record']['review_id']])
+        elif message['type'] == 'STATE':
+            # every STATE carries both accounts' latest bookmarks, each only
+            # past reviews its own account has written
+            assert set(message['value']) == {'accounts'}
+            for name, state in message['value']['accounts'].items():
+                last_update = state.get('last_update', 0)
+                assert last_update >= bookmarks[name]
+                assert not last_update or last_update <= max(written[name])
+                bookmarks[name] = last_update
+    assert sorted(written['a']) == sorted(updated_at.values())
+    assert sorted(written['b']) == sorted(second for second in updated_at.values() \
+        if second >= B_START)
+    last = porter.dataset.reviews[-1]['updatedAt']
+    assert {name: state['last_update'] for name, state in run.state['accounts'].items()} == \
+        {'a': last, 'b': last}
+    assert not sync(porter, config, run.state, catalog('reviews')).records('reviews')
+
+
+def test_an_account_missing_from_the_state_starts_from_its_start_date(porter):
+    config = {'accounts': ACCOUNTS}
+    first = sync(porter, config, catalog=catalog('reviews'))
+    state = {'accounts': {'a': first.state['accounts']['a']}}
+    run = sync(porter, config, state, catalog('reviews'))
+    assert {record['account'] for record in run.records('reviews')} == {'b'}
+    assert run.state == first.state
@@ -0,0 +1,29 @@
+from conftest import catalog, sync
+import tap_revinate
+from tap_revinate.auth import Signer
+
+
+def test_refresh_signs_again_once_per_refused_signature():
+    signer = Signer('user', 'key', 'secret', max_age=3600)
+    refused = signer.headers()
+    assert signer.headers() is refused
+    fresh = signer.refresh(refused)
+    assert fresh is not refused
+    # a second request refused with the same signature gets the new one
+    assert signer.refresh(refused) is fresh
+    assert signer.stats() == {'signatures': 2, 'refreshes': 1}
+
+
+def test_refused_signatures_are_made_again_and_the_request_retried(porter):
+    config = {'page_size': 5}
+    baseline = sync(porter, config, catalog=catalog('reviews')).records('reviews')
+    # the signature outlives what Porter accepts: requests start being refused
+    # part way through the run
+    porter.signature_ttl = 1.5
+    porter.latency = 0.03
+    refreshes = tap_revinate.SIGNER.stats()['refreshes']
+    run = sync(porter, dict(config, signature_max_age=3600), catalog=catalog('reviews'))
+    assert run.records('reviews') == baseline
+    assert porter.counts['unauthorized']
+    # one new signature for each refused request, each retried once
+    assert tap_revinate.SIGNER.stats()['refreshes'] - refreshes == porter.counts['unauthorized']
@@ -0,0 +1,92 @@
+import time
+import mock_porter
+from conftest import catalog, sync
+from tap_revinate.bookmarks import snapshot_periods
+
+BACKFILL = {'snapshot_backfill': 'month', 'snapshot_backfill_start_date': '2026-01-01T00:00:00Z',
+            'snapshot_concurrency': 4}
+
+
+def backfill_requests(monkeypatch, failing=()):
+    # the (hotel_id, date) of each backfill snapshot request; those in
+    # `failing` are answered with a 404
+    requests = []
+    route = mock_porter.route
+    def recording(dataset, path, query):
+        match = mock_porter.SNAPSHOT_PATH.match(path)
+        if match and 'date' in query:
+            requests.append((match.group(1), query['date']))
+            if requests[-1] in failing:
+                return None
+        return route(dataset, path, query)
+    monkeypatch.setattr(mock_porter, 'route', recording)
+    return requests
+
+
+def test_backfill_fetches_each_period_once(porter, monkeypatch):
+    requests = backfill_requests(monkeypatch)
+    periods = snapshot_periods(BACKFILL, int(time.time()) - 300)
+    hotel_ids = [str(hotel_id) for hotel_id in range(1, len(porter.dataset.hotels) + 1)]
+    first = sync(porter, BACKFILL, catalog=catalog('hotel_reviews_snapshot'))
+    assert sorted(requests) == sorted((hotel_id, '{}..{}'.format(*period)) \
+        for hotel_id in hotel_ids for period in periods)
+    # the backfilled snapshots and the current one
+    assert len(first.records('hotel_reviews_snapshot')) == len(hotel_ids) * (len(periods) + 1)
+    assert first.state['snapshot_backfill'] == {hotel_id: periods[-1][1] for hotel_id in hotel_ids}
+    del requests[:]
+    sync(porter, BACKFILL, first.state, catalog('hotel_reviews_snapshot'))
+    assert not requests
+
+
+def test_hotel_whose_period_failed_resumes_from_it(porter, monkeypatch):
+    periods = snapshot_periods(BACKFILL, int(time.time()) - 300)
+    failing = [('3', '{}..{}'.format(*periods[2]))]
+    requests = backfill_requests(monkeypatch, failing)
+    first = sync(porter, BACKFILL, catalog=catalog('hotel_reviews_snapshot'))
+    done = dict(first.state['snapshot_backfill'])
+    # the hotel stops at the period before the one that failed; the others finish
+    assert done.pop('3') == periods[1][1]
+    assert set(done.values()) == {periods[-1][1]}
+    # its first two periods and the current snapshot
+    assert len([record for record in first.records('hotel_reviews_snapshot') \
+        if str(record['hotel_id']) == '3']) == 3
+    del requests[:]
+    del failing[:]
+    second = sync(porter, BACKFILL, first.state, catalog('hotel_reviews_snapshot'))
+    assert sorted(requests) == sorted(('3', '{}..{}'.format(*period)) for period in periods[2:])
+    assert second.state['snapshot_backfill']['3'] == periods[-1][1]
+
+
+def by_time_run(porter, config, state=None):
+    return sync(porter, config, state, catalog('hotel_reviews_snapshot_by_time'))
+
+
+def test_incremental_by_time_emits_the_newest_periods_again(porter):
+    config = {'snapshot_by_time_incremental': True}
+    first = by_time_run(porter, config)
+    hotels = len(porter.dataset.hotels)
+    assert len(first.records('hotel_reviews_snapshot_by_time')) == \
+        hotels * porter.dataset.snapshot_periods
+    bookmarks = first.state['snapshot_by_time']
+    assert len(bookmarks) == hotels
+    # only the period that was newest last time is emitted again
+    again = by_time_run(porter, config, first.state).records('hotel_reviews_snapshot_by_time')
+    assert len(again) == hotels
+    assert all(record['unix_time'] == bookmarks[str(record['hotel_id'])]['unix_time'] \
+        for record in again)
+
+
+def test_periods_skipped_as_closed_keep_their_fingerprints(porter):
+    config = {'snapshot_by_time_incremental': True, 'snapshot_by_time_refresh_days': 1,
+              'emit_changes_only': True}
+    first = by_time_run(porter, config)
+    fingerprints = first.state['fingerprints']['hotel_reviews_snapshot_by_time']
+    second = by_time_run(porter, config, first.state)
+    assert not second.records('hotel_reviews_snapshot_by_time')
+    assert second.state['fingerprints']['hotel_reviews_snapshot_by_time'] == fingerprints
+    # a refresh emits every period, but none has changed
+    for bookmark in second.state['snapshot_by_time'].values():
+        bookmark['refreshed_at'] = 0
+    refreshed = by_time_run(porter, config, second.state)
+    assert not refreshed.records('hotel_reviews_snapshot_by_time')
+    assert refreshed.state['fingerprints']['hotel_reviews_snapshot_by_time'] == fingerprints
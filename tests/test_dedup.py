@@ -0,0 +1,75 @@
+import pytest
+from tap_revinate.dedup import BloomFilter, BoundaryDedup, review_id_of
+
+
+def review(review_id, updated_at):
+    return {'updatedAt': updated_at,
+            'links': [{'rel': 'self',
+                       'href': 'https://porter.example.com/reviews/{}'.format(review_id)}]}
+
+
+def emitted(dedup, reviews):
+    return [review_id_of(item) for item in reviews if not dedup.duplicate(item)]
+
+
+def test_review_id_of_reads_the_self_link():
+    assert review_id_of(review(42, 0)) == 42
+    assert review_id_of({'links': [{'rel': 'hotel', 'href': '/hotels/1'}]}) is None
+    assert review_id_of({}) is None
+
+
+@pytest.mark.parametrize('mode', ['exact', 'bloom'])
+def test_reviews_at_the_bookmark_are_emitted_once(mode):
+    dedup = BoundaryDedup(mode=mode)
+    dedup.start({'last_update': 100, 'last_update_review_ids': [1, 2]})
+    reviews = [review(1, 100), review(2, 100), review(3, 100), review(3, 100),
+               review(4, 101), review(5, 102), review(6, 102)]
+    assert emitted(dedup, reviews) == [3, 4, 5, 6]
+    assert dedup.stats() == {'duplicates': 3}
+    state = {}
+    dedup.save(state, 102)
+    assert state == {'last_update_review_ids': [5, 6]}
+    dedup.save(state, 100)
+    assert state == {'last_update_review_ids': [1, 2, 3]}
+
+
+def test_reviews_past_the_bookmark_are_not_checked():
+    # only the bookmark second is checked
+    dedup = BoundaryDedup()
+    dedup.start({'last_update': 100})
+    assert emitted(dedup, [review(1, 101), review(1, 101)]) == [1, 1]
+
+
+def test_nothing_is_dropped_without_a_bookmark_or_when_off():
+    dedup = BoundaryDedup()
+    dedup.start({})
+    assert emitted(dedup, [review(1, 100), review(2, 100)]) == [1, 2]
+    dedup = BoundaryDedup(mode='off')
+    dedup.start({'last_update': 100, 'last_update_review_ids': [1]})
+    assert emitted(dedup, [review(1, 100)]) == [1]
+    state = {'last_update_review_ids': [1]}
+    dedup.save(state, 100)
+    assert state == {}
+
+
+def test_ids_past_max_state_ids_are_not_saved():
+    dedup = BoundaryDedup(max_state_ids=2)
+    dedup.start({'last_update': 100, 'last_update_review_ids': [1]})
+    assert emitted(dedup, [review(i, 101) for i in range(3)]) == [0, 1, 2]
+    state = {'last_update_review_ids': [1]}
+    dedup.save(state, 101)
+    assert state == {}
+
+
+def test_unknown_filter_is_rejected():
+    with pytest.raises(ValueError):
+        BoundaryDedup(mode='lru')
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for key in range(1000):
+        bloom.add(key)
+    assert all(key in bloom for key in range(1000))
+    false_positives = sum(1 for key in range(1000, 11000) if key in bloom)
+    assert false_positives < 300
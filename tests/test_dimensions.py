@@ -0,0 +1,41 @@
+from conftest import catalog, sync
+
+STREAMS = ('reviews', 'hotel_reviews_snapshot_by_site')
+
+
+def by_id(run, stream, key):
+    records = run.records(stream)
+    dimensions = {record[key]: record for record in records}
+    # each one is written once
+    assert len(dimensions) == len(records)
+    return dimensions
+
+
+def test_ids_only_records_join_back_to_the_full_ones(porter):
+    full = sync(porter, catalog=catalog(*STREAMS))
+    run = sync(porter, {'dimension_ids_only': True},
+               catalog=catalog('review_sites', 'languages', *STREAMS))
+    sites = by_id(run, 'review_sites', 'review_site_id')
+    languages = by_id(run, 'languages', 'language_id')
+    reviews = run.records('reviews')
+    assert not any(key.startswith(('review_site_', 'language_')) \
+        for record in reviews for key in record if key not in ('review_site_id', 'language_id'))
+    assert [{**review, **sites[review['review_site_id']], **languages[review['language_id']]} \
+        for review in reviews] == full.records('reviews')
+    assert [{**site, **sites[site['review_site_id']]} \
+        for site in run.records('hotel_reviews_snapshot_by_site')] == \
+        full.records('hotel_reviews_snapshot_by_site')
+    schema = next(message['schema']['properties'] for message in run.messages \
+        if message['type'] == 'SCHEMA' and message['stream'] == 'reviews')
+    assert 'review_site_id' in schema and 'review_site_name' not in schema
+    assert 'language_id' in schema and 'language_name' not in schema
+
+
+def test_dimensions_alone_still_page_through_the_reviews(porter):
+    run = sync(porter, {'dimension_ids_only': True}, catalog=catalog('review_sites', 'languages'))
+    assert not run.records('reviews')
+    reviews = sync(porter, catalog=catalog('reviews')).records('reviews')
+    assert set(by_id(run, 'review_sites', 'review_site_id')) == \
+        {review['review_site_id'] for review in reviews}
+    assert set(by_id(run, 'languages', 'language_id')) == \
+        {review['language_id'] for review in reviews}
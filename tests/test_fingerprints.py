@@ -0,0 +1,56 @@
+from tap_revinate.fingerprints import DIGEST_SIZE, ChangeDetector, decode, digest, encode
+
+KEY_PROPERTIES = {'hotels': ['hotel_id'], 'languages': ['language_id']}
+
+
+def test_encode_decode_round_trip():
+    fingerprints = {digest([i]): digest({'hotel_id': i, 'name': str(i)}) for i in range(100)}
+    assert all(len(value) == DIGEST_SIZE for value in fingerprints.values())
+    assert decode(encode(fingerprints)) == fingerprints
+    assert decode(encode({})) == {}
+
+
+def test_decode_ignores_other_versions():
+    assert decode('0:' + encode({digest(1): digest(2)}).partition(':')[2]) == {}
+    assert decode(None) == {}
+
+
+def run(detector, stream, records):
+    return [record for record in records if detector.changed(stream, record)]
+
+
+def test_unchanged_records_are_skipped_on_the_next_run():
+    hotels = [{'hotel_id': 1, 'name': 'a'}, {'hotel_id': 2, 'name': 'b'}]
+    detector = ChangeDetector(KEY_PROPERTIES, enabled=True)
+    assert run(detector, 'hotels', hotels) == hotels
+    state = {}
+    detector.save(state)
+    detector.configure(enabled=True, state=state)
+    renamed = {'hotel_id': 2, 'name': 'c'}
+    assert run(detector, 'hotels', [hotels[0], renamed]) == [renamed]
+
+
+def test_save_drops_keys_not_seen_unless_kept_or_accumulated():
+    detector = ChangeDetector(KEY_PROPERTIES, enabled=True, accumulated=['languages'])
+    run(detector, 'hotels', [{'hotel_id': 1}, {'hotel_id': 2}, {'hotel_id': 3}])
+    run(detector, 'languages', [{'language_id': 1}])
+    state = {}
+    detector.save(state)
+    detector.configure(enabled=True, state=state)
+    # hotel 2 was not read again on purpose, hotel 3 is gone
+    run(detector, 'hotels', [{'hotel_id': 1}])
+    detector.keep('hotels', {'hotel_id': 2})
+    run(detector, 'languages', [{'language_id': 2}])
+    detector.save(state)
+    assert len(decode(state['fingerprints']['hotels'])) == 2
+    assert len(decode(state['fingerprints']['languages'])) == 2
+    detector.configure(enabled=True, state=state)
+    assert run(detector, 'hotels', [{'hotel_id': 2}, {'hotel_id': 3}]) == [{'hotel_id': 3}]
+
+
+def test_disabled_detector_passes_everything():
+    detector = ChangeDetector(KEY_PROPERTIES)
+    assert run(detector, 'hotels', [{'hotel_id': 1}, {'hotel_id': 1}]) == [{'hotel_id': 1}] * 2
+    # untracked streams too
+    detector.configure(enabled=True)
+    assert run(detector, 'reviews', [{'review_id': 1}] * 2) == [{'review_id': 1}] * 2
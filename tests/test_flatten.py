@@ -0,0 +1,54 @@
+import ast
+import json
+from conftest import catalog, sync
+
+STREAMS = ('hotels', 'reviews', 'hotel_reviews_snapshot')
+
+
+def run(porter, mode):
+    return sync(porter, {'json_columns': mode}, catalog=catalog(*STREAMS))
+
+
+def json_columns(record):
+    return {key: value for key, value in record.items() if key.endswith('_json')}
+
+
+def others(record):
+    return {key: value for key, value in record.items() if not key.endswith('_json')}
+
+
+def schema(run, stream):
+    return next(message['schema']['properties'] for message in run.messages \
+        if message['type'] == 'SCHEMA' and message['stream'] == stream)
+
+
+def test_encoded_columns_hold_the_objects(porter):
+    objects = run(porter, 'object')
+    for mode, decode in (('repr', ast.literal_eval), ('json', json.loads)):
+        encoded = run(porter, mode)
+        for stream in STREAMS:
+            records = encoded.records(stream)
+            assert len(records) == len(objects.records(stream))
+            for record, expected in zip(records, objects.records(stream)):
+                assert others(record) == others(expected)
+                assert {key: decode(value) for key, value in json_columns(record).items()} == \
+                    json_columns(expected)
+            assert all(column == {'type': 'string'} \
+                for column in json_columns(schema(encoded, stream)).values())
+
+
+def test_object_columns_are_declared_as_objects_and_arrays(porter):
+    objects = run(porter, 'object')
+    columns = json_columns(schema(objects, 'reviews'))
+    assert columns['review_json'] == {'type': ['object', 'null']}
+    assert columns['links_json']['type'] == ['array', 'null']
+    record = objects.records('reviews')[0]
+    assert isinstance(record['review_json'], dict) and isinstance(record['links_json'], list)
+
+
+def test_dropped_columns_are_left_out_of_records_and_schemas(porter):
+    full = run(porter, 'repr')
+    dropped = run(porter, 'drop')
+    for stream in STREAMS:
+        assert not json_columns(schema(dropped, stream))
+        assert dropped.records(stream) == [others(record) for record in full.records(stream)]
@@ -0,0 +1,99 @@
+import time
+import tap_revinate
+from tap_revinate.client import DECODE_BATCH_SIZE, decoded_pages
+from tap_revinate.paging import PageSizer, aligned_size
+
+
+def page_sizes(sizer, total, start=0, latency=0.0):
+    # the sizes iter_pages would request over a window of `total` records, each
+    # page observed as answering in `latency` seconds
+    sizes = []
+    offset = start
+    while offset < total:
+        size = sizer.next_size(offset)
+        assert offset % size == 0
+        sizes.append(size)
+        sizer.observe(size, latency, 1000)
+        offset = offset + size
+    return sizes
+
+
+def test_aligned_size_is_the_largest_divisor_of_the_offset():
+    assert aligned_size(0, 100) == 100
+    assert aligned_size(200, 100) == 100
+    assert aligned_size(100, 50) == 50
+    assert aligned_size(100, 31) == 25
+    assert aligned_size(37, 63) == 37
+    assert aligned_size(97, 3) == 1
+
+
+def test_fixed_size_resumed_mid_window_realigns():
+    sizes = page_sizes(PageSizer(size=100), 5000, start=37)
+    assert sizes[:4] == [37, 2, 19, 5]
+    assert sizes[4:] == [100] * 49
+
+
+def test_adaptive_size_grows_in_power_of_two_multiples():
+    sizer = PageSizer(size=100, adaptive=True, max_size=1000)
+    assert sizer.max_size == 800
+    sizes = page_sizes(sizer, 20000)
+    assert sizes[:5] == [100, 100, 200, 400, 800]
+    assert set(sizes[5:]) == {800}
+    assert len(sizes) == 28
+
+
+def test_adaptive_size_halves_on_slow_pages():
+    sizer = PageSizer(size=100, adaptive=True, max_size=1000)
+    page_sizes(sizer, 20000)
+    sizer.observe(800, 10.0, 1000)
+    assert sizer.size == 400
+    sizer.observe(400, 10.0, 1000)
+    sizer.observe(200, 10.0, 1000)
+    sizer.observe(100, 10.0, 1000)
+    assert sizer.size == 50
+    assert sizer.next_size(1050) == 50
+
+
+def test_failed_page_is_split_into_aligned_parts():
+    sizer = PageSizer(size=100, adaptive=True)
+    sizer.shrink(200)
+    assert sizer.size == 50
+    assert sizer.max_size == 100
+    # the halves of a 200-record page at offset 200, as fetch_page_chunk asks
+    assert aligned_size(200, 100) == 100
+    assert aligned_size(100, 50) == 50
+
+
+class Page:
+    """A page of `size` numbers, noting each one as it is read."""
+
+    def __init__(self, start, size, read):
+        self.records = range(start, start + size)
+        self.read = read
+        self.count = 0
+        self.page = {'totalElements': 2 * size}
+
+    def with_raw(self):
+        for record in self.records:
+            self.read.append(record)
+            self.count = self.count + 1
+            yield record, None
+
+
+def test_decode_stage_holds_a_few_batches_of_records(monkeypatch):
+    monkeypatch.setitem(tap_revinate.CONFIG, 'pipeline_depth', 2)
+    read = []
+    pages = decoded_pages('reviews', iter([(0, 1000, Page(0, 1000, read)),
+                                           (1000, 1000, Page(1000, 1000, read))]))
+    offset, size, page = next(pages)
+    records = page.with_raw()
+    assert next(records) == (0, None)
+    time.sleep(0.2)
+    # the batch being written, the queued ones and the one being decoded
+    assert len(read) <= 4 * DECODE_BATCH_SIZE
+    assert [record for record, _ in records] == list(range(1, 1000))
+    assert (offset, size, page.count) == (0, 1000, 1000)
+    offset, size, page = next(pages)
+    assert [record for record, _ in page.with_raw()] == list(range(1000, 2000))
+    assert (offset, size, page.count, page.page) == (1000, 1000, 1000, {'totalElements': 2000})
+    assert next(pages, None) is None
@@ -0,0 +1,98 @@
+import collections
+import pytest
+import mock_porter
+from conftest import catalog, serve, sync
+from tap_revinate.dedup import review_id_of
+
+
+def move_review(dataset, review_id, updated_at):
+    # Porter updates a review: it moves to a later updatedAt
+    for review in dataset.reviews:
+        if review_id_of(review) == review_id:
+            review['updatedAt'] = updated_at
+    dataset.reviews.sort(key=lambda review: (review['updatedAt'], review['links'][0]['href']))
+    dataset._updated_at = [review['updatedAt'] for review in dataset.reviews]  # pylint: disable=protected-access
+
+
+def test_resume_keeps_a_review_that_moved_off_the_bookmark():
+    with serve(start=1535760000, end=1535760000 + 2 * 60 * 60) as porter:
+        resume_after_move(porter)
+
+
+def resume_after_move(porter):
+    reviews = porter.dataset.reviews
+    seconds = collections.Counter(review['updatedAt'] for review in reviews)
+    bookmark = min(second for second, count in seconds.items() if count >= 3)
+    at_bookmark = [review_id_of(review) for review in reviews if review['updatedAt'] == bookmark]
+    # an interrupted run emitted everything before the bookmark and the first
+    # two reviews at it, then checkpointed
+    state = {'last_update': bookmark, 'last_update_review_ids': sorted(at_bookmark[:2])}
+    move_review(porter.dataset, at_bookmark[0], bookmark + 60)
+    run = sync(porter, {'page_size': 2}, state)
+    emitted = {record['review_id'] for record in run.records('reviews')}
+    expected = {review_id_of(review) for review in porter.dataset.reviews \
+        if review['updatedAt'] >= bookmark} - {at_bookmark[1]}
+    assert emitted == expected
+
+
+def review_ids(run):
+    return [record['review_id'] for record in run.records('reviews')]
+
+
+def test_resume_from_any_checkpoint_emits_the_rest(porter):
+    config = {'page_size': 10, 'checkpoint_pages': 3}
+    run = sync(porter, config, catalog=catalog('reviews'))
+    everything = sorted(review_ids(run))
+    emitted = []
+    checkpoints = 0
+    for message in run.messages:
+        if message['type'] == 'RECORD':
+            emitted.append(message['record']['review_id'])
+        elif message['type'] == 'STATE' and 'last_update' in message['value']:
+            # the run stopped right after this checkpoint
+            resumed = review_ids(sync(porter, config, message['value'], catalog('reviews')))
+            assert sorted(emitted + resumed) == everything
+            checkpoints = checkpoints + 1
+    assert checkpoints > 5
+
+
+def fail_later_pages(monkeypatch, failing):
+    # a 404 (not retried) for every page but the first of the review requests
+    # `failing` picks out by path and updatedAt range
+    def route(dataset, path, query):
+        if path.endswith('/reviews') and int(query.get('page', 0)) > 0 and \
+                failing(path, *map(int, query['updatedAt'].split('..'))):
+            return None
+        return original(dataset, path, query)
+    original = mock_porter.route
+    monkeypatch.setattr(mock_porter, 'route', route)
+    return monkeypatch.undo
+
+
+@pytest.mark.parametrize('config', [
+    {'shard_reviews_by': 'records', 'shard_records': 50},
+    {'shard_reviews_by': 'days', 'shard_days': 2},
+    {'partition_reviews_by_hotel': True},
+])
+def test_shards_and_hotels_resume_from_their_bookmarks(porter, monkeypatch, config):
+    dataset = porter.dataset
+    everything = sorted(review_id_of(review) for review in dataset.reviews)
+    middle = (dataset.start + dataset.end) // 2
+    # the later shards fail, or the hotels with odd ids
+    restore = fail_later_pages(monkeypatch, lambda path, low, high: \
+        low > middle if path == '/reviews' else int(path.split('/')[2]) % 2)
+    config = dict(config, page_size=10)
+    failed = sync(porter, config, catalog=catalog('reviews'))
+    restore()
+    assert len(review_ids(failed)) < len(everything)
+    if 'partition_reviews_by_hotel' not in config:
+        # the bookmark only passes shards that finished
+        last_update = failed.state['last_update']
+        assert middle < last_update < dataset.reviews[-1]['updatedAt']
+        assert set(review_ids(failed)) >= {review_id_of(review) for review in dataset.reviews \
+            if review['updatedAt'] < last_update}
+    resumed = sync(porter, config, failed.state, catalog('reviews'))
+    assert sorted(set(review_ids(failed) + review_ids(resumed))) == everything
+    # the shards and hotels that finished were not read again
+    assert len(review_ids(failed)) + len(review_ids(resumed)) < 1.5 * len(everything)
+    assert not review_ids(sync(porter, config, resumed.state, catalog('reviews')))
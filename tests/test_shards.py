@@ -0,0 +1,57 @@
+from tap_revinate.shards import add_interval, advance, gaps, split_by_count, split_by_days
+
+
+def test_add_interval_merges_overlapping_and_adjacent_intervals():
+    done = add_interval([], [10, 19])
+    done = add_interval(done, [30, 39])
+    assert done == [[10, 19], [30, 39]]
+    assert add_interval(done, [20, 29]) == [[10, 39]]
+    assert add_interval(done, [15, 32]) == [[10, 39]]
+    assert add_interval(done, [0, 5]) == [[0, 5], [10, 19], [30, 39]]
+
+
+def test_gaps_are_the_parts_not_done():
+    assert gaps(0, 49, []) == [(0, 49)]
+    assert gaps(0, 49, [[10, 19], [30, 39]]) == [(0, 9), (20, 29), (40, 49)]
+    assert gaps(0, 49, [[0, 49]]) == []
+    assert gaps(20, 29, [[0, 24], [60, 70]]) == [(25, 29)]
+
+
+def test_advance_stops_at_the_first_window_not_done():
+    # the window starting at 10 is still running: the bookmark can't pass it
+    assert advance(0, [[0, 9], [20, 29]]) == (10, [[20, 29]])
+    assert advance(0, [[0, 9], [10, 19], [20, 29]]) == (30, [])
+    assert advance(0, [[5, 9]]) == (0, [[5, 9]])
+
+
+def test_advance_drops_windows_already_behind_the_bookmark():
+    assert advance(25, [[0, 9], [20, 29], [40, 49]]) == (30, [[40, 49]])
+    assert advance(30, [[0, 29]]) == (30, [])
+
+
+def test_split_by_days_covers_the_range_without_overlap():
+    day = 60 * 60 * 24
+    assert split_by_days(0, 3 * day - 1, 1) == [(0, day - 1), (day, 2 * day - 1),
+                                                (2 * day, 3 * day - 1)]
+    assert split_by_days(0, day, 2) == [(0, day)]
+    assert split_by_days(0, 2 * day, 1)[-1] == (2 * day, 2 * day)
+
+
+def test_split_by_count_bisects_until_windows_fit():
+    updated_at = list(range(0, 100)) + [50] * 100
+    probes = []
+    def count(low, high):
+        probes.append((low, high))
+        return sum(1 for second in updated_at if low <= second <= high)
+    shards = split_by_count(0, 99, count, 60)
+    assert shards[0] == (0, 49, 50)
+    assert [(low, high) for low, high, _ in shards] == \
+        list(zip([0] + [high + 1 for _, high, _ in shards[:-1]], [high for _, high, _ in shards]))
+    assert shards[-1][1] == 99
+    for low, high, total in shards:
+        assert total == count(low, high)
+        # a single second can't be split further, however many reviews it holds
+        assert total <= 60 or low == high
+    assert (50, 50, 101) in shards
+    # the right half of each split is not probed
+    assert (50, 99) not in probes
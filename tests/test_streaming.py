@@ -0,0 +1,73 @@
+import json
+import pytest
+from tap_revinate.streaming import PorterPage, StreamDecoder, iter_object, load_object
+
+DOCUMENT = {'content': [{'id': 1, 'title': 'Très bien ☃', 'rating': 4.5},
+                        {'id': 22, 'title': '', 'rating': 1234567}],
+            'links': [{'rel': 'self', 'href': 'https://porter.example.com/reviews'}],
+            'page': {'size': 2, 'totalElements': 2, 'number': 0}}
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 4096])
+def test_stream_decoder_reads_values_split_anywhere(size):
+    # chunk boundaries fall inside numbers, strings and multi-byte characters
+    data = '[12345, "Très ☃", {"a": [1.5, null]}, 678]'.encode('utf-8')
+    reader = StreamDecoder(chunked(data, size))
+    assert reader.expect('[') == '['
+    values = []
+    while True:
+        values.append(reader.raw_value())
+        if reader.expect(',]') == ']':
+            break
+    assert values == [(12345, '12345'), ('Très ☃', '"Très ☃"'),
+                      ({'a': [1.5, None]}, '{"a": [1.5, null]}'), (678, '678')]
+    assert reader.peek() == ''
+
+
+def test_stream_decoder_rejects_unexpected_characters():
+    reader = StreamDecoder([b'  [1]'])
+    with pytest.raises(ValueError):
+        reader.expect('{')
+
+
+def test_stream_decoder_raises_on_a_truncated_value():
+    reader = StreamDecoder([b'{"a": [1, 2'])
+    reader.expect('{')
+    reader.value()
+    reader.expect(':')
+    with pytest.raises(ValueError):
+        reader.value()
+
+
+@pytest.mark.parametrize('size', [1, 5, 4096])
+def test_iter_object_streams_the_array_members(size):
+    data = json.dumps(DOCUMENT).encode('utf-8')
+    events = list(iter_object(chunked(data, size), 'content'))
+    assert [(event, key, value) for event, key, value, _ in events] == \
+        [('item', 'content', item) for item in DOCUMENT['content']] + \
+        [('field', 'links', DOCUMENT['links']), ('field', 'page', DOCUMENT['page'])]
+    assert [json.loads(text) for event, _, _, text in events if event == 'item'] == \
+        DOCUMENT['content']
+    assert load_object(chunked(data, size)) == DOCUMENT
+
+
+def test_iter_object_handles_empty_objects_and_arrays():
+    assert not list(iter_object([b'{}'], 'content'))
+    assert list(iter_object([b'{"content": [], "n": 1}'], 'content')) == \
+        [('field', 'n', 1, None)]
+
+
+def test_porter_page_buffers_records_when_page_is_read_first():
+    # `page` comes after `content` in the body
+    data = json.dumps(DOCUMENT).encode('utf-8')
+    page = PorterPage(chunked(data, 3))
+    assert page.page == DOCUMENT['page']
+    assert list(page) == DOCUMENT['content']
+    assert page.count == 2
+    parsed = PorterPage.from_parsed(DOCUMENT)
+    assert list(parsed.with_raw()) == [(item, None) for item in DOCUMENT['content']]
+    assert parsed.page == DOCUMENT['page']
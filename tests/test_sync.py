@@ -0,0 +1,96 @@
+import json
+import pytest
+import mock_porter
+from conftest import sync
+from tap_revinate.dedup import review_id_of
+
+
+def records(run):
+    # every record written, whatever order the streams were synced in
+    return sorted(json.dumps([message['stream'], message['record']], sort_keys=True) \
+        for message in run.messages if message['type'] == 'RECORD')
+
+
+def test_every_review_and_hotel_is_emitted_once(porter):
+    run = sync(porter)
+    review_ids = [record['review_id'] for record in run.records('reviews')]
+    assert sorted(review_ids) == sorted(review_id_of(review) for review in porter.dataset.reviews)
+    assert len(run.records('hotels')) == len(porter.dataset.hotels)
+    assert run.state['last_update'] == porter.dataset.reviews[-1]['updatedAt']
+
+
+@pytest.mark.parametrize('config', [
+    {'engine': 'async'},
+    {'shard_reviews_by': 'records', 'shard_records': 100},
+    {'shard_reviews_by': 'days', 'shard_days': 3},
+    {'partition_reviews_by_hotel': True},
+    {'page_size': 3, 'adaptive_page_size': True, 'max_page_size': 50},
+    {'page_prefetch': 4, 'snapshot_concurrency': 4},
+    {'write_queue_depth': 0, 'pipeline_depth': 0},
+])
+def test_output_matches_the_default_run(porter, config):
+    if config.get('engine') == 'async':
+        pytest.importorskip('aiohttp')
+    assert records(sync(porter, config)) == records(sync(porter))
+
+
+def test_cached_responses_give_the_same_output(porter, tmp_path):
+    baseline = records(sync(porter))
+    config = {'cache_dir': str(tmp_path), 'cache_ttl': 3600}
+    assert records(sync(porter, config)) == baseline
+    requests = porter.requests
+    assert records(sync(porter, config)) == baseline
+    # the snapshots came from the cache
+    assert porter.requests - requests < requests / 2
+
+
+@pytest.mark.parametrize('dedup_filter', ['exact', 'bloom'])
+def test_next_run_skips_the_reviews_at_the_bookmark(porter, dedup_filter):
+    config = {'dedup_filter': dedup_filter}
+    first = sync(porter, config)
+    assert first.state['last_update_review_ids']
+    assert not sync(porter, config, first.state).records('reviews')
+
+
+def test_next_run_repeats_the_bookmark_second_without_dedup(porter):
+    config = {'dedup_filter': 'off'}
+    first = sync(porter, config)
+    again = sync(porter, config, first.state).records('reviews')
+    last_update = first.state['last_update']
+    assert sorted(record['review_id'] for record in again) == sorted( \
+        review_id_of(review) for review in porter.dataset.reviews \
+        if review['updatedAt'] == last_update)
+
+
+def test_responses_cut_off_mid_body_are_requested_again(porter):
+    config = {'page_size': 50, 'max_tries': 10}
+    baseline = records(sync(porter, config))
+    porter.reset_rate = 0.2
+    assert records(sync(porter, config)) == baseline
+    assert porter.counts['resets']
+
+
+def test_pages_cut_off_mid_body_are_split_when_adaptive(porter, monkeypatch):
+    config = {'page_size': 50, 'adaptive_page_size': True, 'max_tries': 10}
+    baseline = records(sync(porter, config))
+    sizes = []
+    route = mock_porter.route
+    def recording(dataset, path, query):
+        if path == '/reviews':
+            sizes.append(int(query['size']))
+        return route(dataset, path, query)
+    monkeypatch.setattr(mock_porter, 'route', recording)
+    porter.reset_rate = 0.3
+    assert records(sync(porter, config)) == baseline
+    assert min(sizes) < 50
+
+
+def test_async_engine_lowers_the_requests_in_flight_when_throttled(porter, capfd):
+    pytest.importorskip('aiohttp')
+    baseline = records(sync(porter))
+    porter.throttle_rate = 0.05
+    porter.retry_after = 0
+    config = {'engine': 'async', 'max_in_flight': 8, 'max_tries': 10}
+    assert records(sync(porter, config)) == baseline
+    assert porter.counts['throttled']
+    assert 'allowing 4 requests in flight' in capfd.readouterr().err
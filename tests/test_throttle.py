@@ -0,0 +1,63 @@
+import email.utils
+import pytest
+from conftest import catalog, sync
+from tap_revinate.throttle import RateLimiter, retry_after_seconds
+
+
+def test_throttles_in_one_round_halve_the_limit_once():
+    limiter = RateLimiter(max_in_flight=8)
+    epochs = [limiter.acquire() for _ in range(4)]
+    for epoch in epochs:
+        limiter.release(epoch, 429)
+    assert limiter.stats()['limit'] == 4
+    # sent after the cut, so a new throttle halves it again, down to the minimum
+    for _ in range(3):
+        limiter.release(limiter.acquire(), 503)
+    assert limiter.stats()['limit'] == 1
+
+
+def test_each_round_of_successes_adds_one_back():
+    limiter = RateLimiter(max_in_flight=4)
+    limiter.release(limiter.acquire(), 429)
+    assert limiter.stats()['limit'] == 2
+    for expected in (3, 4, 4):
+        # a round is as many successes as the limit allows in flight
+        for _ in range(limiter.stats()['limit']):
+            limiter.release(limiter.acquire(), 200)
+        assert limiter.stats()['limit'] == expected
+
+
+def test_retry_after_pauses_every_request():
+    limiter = RateLimiter(max_in_flight=4)
+    limiter.release(limiter.acquire(), 429, retry_after=30)
+    epoch, wait = limiter.try_acquire()
+    assert epoch is None and 29 < wait <= 30
+    assert limiter.retry_delay(2.0) == 0
+    # a full cap makes try_acquire wait without a timeout
+    limiter = RateLimiter(max_in_flight=1)
+    limiter.acquire()
+    assert limiter.try_acquire() == (None, None)
+
+
+def test_retry_after_seconds_reads_seconds_dates_and_rate_limit_headers():
+    now = 1000000000.0
+    assert retry_after_seconds({'Retry-After': '7'}, now) == 7
+    assert retry_after_seconds({'Retry-After': email.utils.formatdate(now + 60, usegmt=True)},
+                               now) == pytest.approx(60)
+    assert retry_after_seconds({'Retry-After': '99999'}, now) == 300
+    assert retry_after_seconds({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '12'},
+                               now) == 12
+    assert retry_after_seconds({'X-RateLimit-Remaining': '3', 'X-RateLimit-Reset': '12'},
+                               now) is None
+    assert retry_after_seconds({}, now) is None
+
+
+def test_throttled_requests_are_retried_with_the_limit_lowered(porter, capfd):
+    config = {'max_in_flight': 8, 'max_tries': 10, 'page_prefetch': 4}
+    baseline = sync(porter, config, catalog=catalog('reviews')).records('reviews')
+    porter.throttle_rate = 0.1
+    porter.retry_after = 0
+    run = sync(porter, config, catalog=catalog('reviews'))
+    assert run.records('reviews') == baseline
+    assert porter.counts['throttled']
+    assert 'allowing 4 requests in flight' in capfd.readouterr().err